@@ -13,8 +13,6 @@ import apifish.stack as stack
 
 from .utils import convert_spot_coordinates
 
-from sklearn.cluster import DBSCAN
-
 
 # ### Detect clusters ###
 
@@ -122,6 +120,9 @@ def _cluster_spots(spots, voxel_size, radius, nb_min_spots):
         assigned, value is -1.
 
     """
+    # import scikit-learn lazily
+    from sklearn.cluster import DBSCAN
+
     # convert spots coordinates in nanometer
     spots_nanometer = convert_spot_coordinates(
         spots=spots, voxel_size=voxel_size)
@@ -1,4 +1,4 @@
-apifishapifishapifish# -*- coding: utf-8 -*-
+# -*- coding: utf-8 -*-
 # Author: Arthur Imbert <arthur.imbert.pro@gmail.com>
 # License: BSD 3 clause
 
@@ -13,6 +13,9 @@ from .utils import get_path_from_recipe
 from .utils import get_nb_element_per_dimension
 from .utils import count_nb_fov
 from .utils import check_datamap
+from .utils import compile_recipe
+from .utils import CompiledRecipe
+from .utils import index_directory
 
 from .preprocess import build_stacks
 from .preprocess import build_stack
@@ -23,14 +26,18 @@ from .colocalization import get_elbow_value_colocalized
 
 from .postprocess import identify_objects_in_region
 from .postprocess import remove_transcription_site
+from .postprocess import assign_objects_to_labels
 from .postprocess import match_nuc_cell
 from .postprocess import extract_cell
+from .postprocess import extract_cells_to_store
 from .postprocess import extract_spots_from_frame
 from .postprocess import summarize_extraction_results
+from .postprocess import summarize_cell_counts
 from .postprocess import center_mask_coord
 from .postprocess import from_boundaries_to_surface
 from .postprocess import from_surface_to_boundaries
 from .postprocess import from_binary_to_coord
+from .postprocess import from_label_to_coord
 from .postprocess import complete_coord_boundaries
 from .postprocess import from_coord_to_frame
 from .postprocess import from_coord_to_surface
@@ -44,7 +51,10 @@ _utils = [
     "get_path_from_recipe",
     "get_nb_element_per_dimension",
     "count_nb_fov",
-    "check_datamap"]
+    "check_datamap",
+    "compile_recipe",
+    "CompiledRecipe",
+    "index_directory"]
 
 _preprocess = [
     "build_stacks",
@@ -58,14 +68,18 @@ _colocalization = [
 _postprocess = [
     "identify_objects_in_region",
     "remove_transcription_site",
+    "assign_objects_to_labels",
     "match_nuc_cell",
     "extract_cell",
+    "extract_cells_to_store",
     "extract_spots_from_frame",
     "summarize_extraction_results",
+    "summarize_cell_counts",
     "center_mask_coord",
     "from_boundaries_to_surface",
     "from_surface_to_boundaries",
     "from_binary_to_coord",
+    "from_label_to_coord",
     "complete_coord_boundaries",
     "from_coord_to_frame",
     "from_coord_to_surface"]
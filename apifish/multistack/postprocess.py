@@ -9,13 +9,15 @@ channels processed with apifish.
 
 import warnings
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-import pandas as pd
 from scipy import ndimage as ndi
 
 import apifish.stack as stack
 
-from skimage.measure import regionprops
 from skimage.measure import find_contours
 from skimage.draw import polygon_perimeter
 
@@ -133,6 +135,141 @@ def remove_transcription_site(rna, clusters, nuc_mask, ndim):
     return rna_out_ts, foci, ts
 
 
+def assign_objects_to_labels(label, coord, ndim):
+    """Assign detected objects to the labelled regions they fall in, for
+    several coordinates arrays at once.
+
+    Each object is assigned to the label of its pixel (0 for the
+    background). Objects are then grouped by label in a compressed format:
+    objects with label `i` are ``coord[order[offsets[i]:offsets[i + 1]]]``
+    and their number is ``offsets[i + 1] - offsets[i]``. Within a label,
+    objects keep their initial order. Sorting the coordinates once with
+    ``coord[order]`` makes every group a view.
+
+    Parameters
+    ----------
+    label : np.ndarray, np.uint or np.int
+        Labelled image with shape (z, y, x) or (y, x). A 3-d image requires
+        3-d coordinates.
+    coord : np.ndarray or Dict[np.ndarray]
+        Array with two dimensions, or dictionary of such arrays (for example
+        RNAs, foci and transcription sites). One object per row, zyx or yx
+        coordinates in the first 3 or 2 columns.
+    ndim : int
+        Number of spatial dimensions to consider (2 or 3).
+
+    Returns
+    -------
+    object_labels : np.ndarray, np.int64
+        Label of each object, with shape (nb_objects,).
+    order : np.ndarray, np.int64
+        Indices of the objects sorted by label, with shape (nb_objects,).
+    offsets : np.ndarray, np.int64
+        Offsets of each label in 'order', with shape (label.max() + 2,).
+
+    If 'coord' is a dictionary, a dictionary with a (object_labels, order,
+    offsets) tuple for each key is returned instead.
+
+    """
+    # check parameters
+    stack.check_parameter(
+        coord=(np.ndarray, dict),
+        ndim=int)
+    stack.check_array(
+        label,
+        ndim=[2, 3],
+        dtype=[np.uint8, np.uint16, np.int64])
+    if ndim not in [2, 3]:
+        raise ValueError("The number of spatial dimension requested should be "
+                         "2 or 3, not {0}.".format(ndim))
+    if label.ndim > ndim:
+        raise ValueError("A {0}-d labelled image requires {0}-d coordinates, "
+                         "not {1}-d.".format(label.ndim, ndim))
+
+    # assign objects for each array
+    if isinstance(coord, dict):
+        assignments = {}
+        for key in coord:
+            assignments[key] = _assign_objects_to_labels(
+                label, coord[key], ndim)
+        return assignments
+    else:
+        return _assign_objects_to_labels(label, coord, ndim)
+
+
+def _assign_objects_to_labels(label, coord, ndim):
+    """Assign detected objects to the labelled regions they fall in.
+
+    Parameters
+    ----------
+    label : np.ndarray, np.uint or np.int
+        Labelled image with shape (z, y, x) or (y, x).
+    coord : np.ndarray
+        Array with two dimensions. One object per row, zyx or yx coordinates
+        in the first 3 or 2 columns.
+    ndim : int
+        Number of spatial dimensions to consider (2 or 3).
+
+    Returns
+    -------
+    object_labels : np.ndarray, np.int64
+        Label of each object, with shape (nb_objects,).
+    order : np.ndarray, np.int64
+        Indices of the objects sorted by label, with shape (nb_objects,).
+    offsets : np.ndarray, np.int64
+        Offsets of each label in 'order', with shape (label.max() + 2,).
+
+    """
+    # check coordinates
+    stack.check_array(coord, ndim=2, dtype=[np.int64, np.float64])
+    if coord.shape[1] < ndim:
+        raise ValueError("Coord array should have at least {0} features to "
+                         "match the number of spatial dimensions requested. "
+                         "Currently {1} is not enough."
+                         .format(ndim, coord.shape[1]))
+
+    # cast coordinates dtype if necessary
+    if coord.dtype == np.int64:
+        coord_int = coord
+    else:
+        coord_int = np.round(coord).astype(np.int64)
+
+    # get the label of each object
+    columns = range(ndim - label.ndim, ndim)
+    index = tuple(coord_int[:, column] for column in columns)
+    object_labels = label[index].astype(np.int64)
+
+    # sort objects by label and count them
+    order = np.argsort(object_labels, kind="stable")
+    counts = np.bincount(object_labels, minlength=int(label.max()) + 1)
+    offsets = _get_offsets(counts)
+
+    return object_labels, order, offsets
+
+
+def _get_offsets(counts):
+    """Compute the offsets of consecutive groups of elements, from their
+    sizes.
+
+    Elements of the group `i` are ``offsets[i]:offsets[i + 1]``.
+
+    Parameters
+    ----------
+    counts : np.ndarray, np.int64
+        Number of elements of each group, with shape (nb_groups,).
+
+    Returns
+    -------
+    offsets : np.ndarray, np.int64
+        Offsets of each group, with shape (nb_groups + 1,).
+
+    """
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    return offsets
+
+
 # ### Nuclei-cells matching
 
 def match_nuc_cell(nuc_label, cell_label, single_nuc, cell_alone):
@@ -167,98 +304,121 @@ def match_nuc_cell(nuc_label, cell_label, single_nuc, cell_alone):
         ndim=[2, 3],
         dtype=[np.uint8, np.uint16, np.int64])
 
-    # initialize new labelled images
-    new_nuc_label = np.zeros_like(nuc_label)
-    new_cell_label = np.zeros_like(cell_label)
-    remaining_cell_label = cell_label.copy()
+    # count the overlap between each nucleus and each cell
+    nuc_values, cell_values, counts = _get_contingency_table(
+        nuc_label, cell_label)
 
-    # loop over nuclei
-    i_instance = 1
-    max_nuc_label = nuc_label.max()
-    for i_nuc in range(1, max_nuc_label + 1):
+    # initialize lookup arrays from the old labels to the new instances
+    nuc_to_instance = np.zeros(int(nuc_label.max()) + 1, dtype=np.int64)
+    nuc_to_cell = np.zeros(int(nuc_label.max()) + 1, dtype=np.int64)
+    cell_to_instance = np.zeros(int(cell_label.max()) + 1, dtype=np.int64)
+    cell_taken = np.zeros(int(cell_label.max()) + 1, dtype=bool)
 
-        # get nuc mask
-        nuc_mask = nuc_label == i_nuc
-
-        # check if a nucleus is labelled with this value
-        if nuc_mask.sum() == 0:
+    # match each nucleus with its most overlapping cell (the background
+    # wins ties), from the table only
+    i_instance = 1
+    starts = np.flatnonzero(np.diff(nuc_values, prepend=-1))
+    ends = np.append(starts[1:], len(nuc_values))
+    for start, end in zip(starts, ends):
+        i_nuc = nuc_values[start]
+        cells = cell_values[start:end]
+        counts_nuc = counts[start:end]
+
+        # cells already matched with a nucleus count as background
+        is_background = (cells == 0) | cell_taken[cells]
+        count_background = counts_nuc[is_background].sum()
+        if is_background.all():
             continue
-
-        # check if a cell is labelled with this value
-        i_cell = _get_most_frequent_value(cell_label[nuc_mask])
-        if i_cell == 0:
+        counts_cell = np.where(is_background, -1, counts_nuc)
+        i_max = np.argmax(counts_cell)
+        if counts_cell[i_max] <= count_background:
             continue
-
-        # get cell mask
-        cell_mask = cell_label == i_cell
-
-        # ensure nucleus is totally included in cell
-        cell_mask |= nuc_mask
-        cell_label[cell_mask] = i_cell
-        remaining_cell_label[cell_mask] = i_cell
+        i_cell = cells[i_max]
 
         # assign cell and nucleus
-        new_nuc_label[nuc_mask] = i_instance
-        new_cell_label[cell_mask] = i_instance
+        nuc_to_instance[i_nuc] = i_instance
+        nuc_to_cell[i_nuc] = i_cell
+        cell_to_instance[i_cell] = i_instance
         i_instance += 1
 
-        # remove pixel already assigned
-        remaining_cell_label[cell_mask] = 0
-
         # if one nucleus per cell only, we remove the cell as candidate
         if single_nuc:
-            cell_label[cell_mask] = 0
+            cell_taken[i_cell] = True
+
+    # relabel nuclei and cells (a nucleus is totally included in its cell,
+    # and a cell matched several times gets its last instance)
+    new_nuc_label = nuc_to_instance[nuc_label].astype(nuc_label.dtype)
+    cell_label_extended = np.where(
+        nuc_to_cell[nuc_label] > 0, nuc_to_cell[nuc_label], cell_label)
+    new_cell_label = cell_to_instance[cell_label_extended]
+    new_cell_label = new_cell_label.astype(cell_label.dtype)
 
     # if only cell with nucleus are authorized we stop here
     if not cell_alone:
         return new_nuc_label, new_cell_label
 
-    # loop over remaining cells
-    max_remaining_cell_label = remaining_cell_label.max()
-    for i_cell in range(1, max_remaining_cell_label + 1):
-
-        # get cell mask
-        cell_mask = remaining_cell_label == i_cell
-
-        # check if a cell is labelled with this value
-        if cell_mask.sum() == 0:
-            continue
-
-        # add cell in the result
-        new_cell_label[cell_mask] = i_instance
-        i_instance += 1
+    # label remaining cells
+    remaining_cell_label = np.where(new_cell_label == 0, cell_label, 0)
+    remaining_cells = np.unique(remaining_cell_label)
+    remaining_cells = remaining_cells[remaining_cells > 0]
+    remaining_to_instance = np.zeros(int(cell_label.max()) + 1,
+                                     dtype=np.int64)
+    remaining_to_instance[remaining_cells] = np.arange(
+        i_instance, i_instance + len(remaining_cells))
+    mask = remaining_cell_label > 0
+    new_cell_label[mask] = remaining_to_instance[remaining_cell_label[mask]]
 
     return new_nuc_label, new_cell_label
 
 
-def _get_most_frequent_value(array):
-    """Count the most frequent value in a array.
+def _get_contingency_table(nuc_label, cell_label):
+    """Count the pixels shared by each pair of nucleus and cell labels.
 
     Parameters
     ----------
-    array : np.ndarray, np.uint or np.int
-        Array-like object.
+    nuc_label : np.ndarray, np.int or np.uint
+        Labelled image of nuclei with shape (z, y, x) or (y, x).
+    cell_label : np.ndarray, np.int or np.uint
+        Labelled image of cells with shape (z, y, x) or (y, x).
 
     Returns
     -------
-    value : int
-        Most frequent integer in the array.
+    nuc_values : np.ndarray, np.int64
+        Nucleus label of each pair, sorted.
+    cell_values : np.ndarray, np.int64
+        Cell label of each pair (0 for the background), sorted within each
+        nucleus.
+    counts : np.ndarray, np.int64
+        Number of pixels of each pair.
 
     """
-    value = np.argmax(np.bincount(array))
+    # keep nuclei pixels only
+    mask = nuc_label > 0
+    nuc_values = nuc_label[mask].astype(np.int64)
+    cell_values = cell_label[mask].astype(np.int64)
+
+    # count the pairs with a single encoded key
+    nb_cell_values = int(cell_label.max()) + 1
+    keys = nuc_values * nb_cell_values + cell_values
+    keys, counts = np.unique(keys, return_counts=True)
+    nuc_values = keys // nb_cell_values
+    cell_values = keys % nb_cell_values
 
-    return value
+    return nuc_values, cell_values, counts.astype(np.int64)
 
 
 # ### Cell extraction ###
 
 def extract_cell(cell_label, ndim, nuc_label=None, rna_coord=None,
                  others_coord=None, image=None, others_image=None,
-                 remove_cropped_cell=True, check_nuc_in_cell=True):
+                 remove_cropped_cell=True, check_nuc_in_cell=True,
+                 z_margin=None):
     """Extract cell-level results for an image.
 
     The function gathers different segmentation and detection results obtained
     at the image level and assigns each of them to the individual cells.
+    Images are cropped to the bounding box of each cell with basic slicing:
+    the crops are views of the input images, not copies.
 
     Parameters
     ----------
@@ -268,7 +428,8 @@ def extract_cell(cell_label, ndim, nuc_label=None, rna_coord=None,
         Number of spatial dimensions to consider (2 or 3).
     nuc_label : np.ndarray, np.uint or np.int
         Image with labelled nuclei and shape (y, x). If None, individual
-        nuclei are not assigned to each cell.
+        nuclei are not assigned to each cell. A cell without nucleus gets an
+        empty `nuc_coord` array and an empty `nuc_mask`.
     rna_coord : np.ndarray
         Coordinates of the detected RNAs with zyx or yx coordinates in the
         first 3 or 2 columns. If None, RNAs are not assigned to individual
@@ -282,14 +443,21 @@ def extract_cell(cell_label, ndim, nuc_label=None, rna_coord=None,
         the spots. If None, no others elements are assigned to the individual
         cells.
     image : np.ndarray, np.uint
-        Image in 2-d. If None, image of the individual cells are not extracted.
+        Image with shape (z, y, x) or (y, x). If None, image of the individual
+        cells are not extracted.
     others_image : Dict[np.ndarray]
-        Dictionary of images to crop. If None, no others image of the
-        individual cells are extracted.
+        Dictionary of images or masks to crop, with shape (z, y, x) or (y, x).
+        If None, no others image of the individual cells are extracted.
     remove_cropped_cell : bool
         Remove cells cropped by the FoV frame.
     check_nuc_in_cell : bool
         Check that each nucleus is entirely localized within a cell.
+    z_margin : int, optional
+        If not None, 3-d images are also cropped along the z axis, around the
+        spots assigned to the cell (RNAs and elements from 'others_coord'),
+        with a margin of 'z_margin' planes. The planes kept are returned as
+        `z_range` (`min_z`, `max_z`). Cells without spots keep all planes.
+        Requires 3-d coordinates and at least one 3-d image.
 
     Returns
     -------
@@ -311,7 +479,8 @@ def extract_cell(cell_label, ndim, nuc_label=None, rna_coord=None,
         others_coord=(dict, type(None)),
         others_image=(dict, type(None)),
         remove_cropped_cell=bool,
-        check_nuc_in_cell=bool)
+        check_nuc_in_cell=bool,
+        z_margin=(int, type(None)))
     stack.check_array(
         cell_label,
         ndim=2,
@@ -324,9 +493,9 @@ def extract_cell(cell_label, ndim, nuc_label=None, rna_coord=None,
     if rna_coord is not None:
         stack.check_array(rna_coord, ndim=2, dtype=[np.int64, np.float64])
     if image is not None:
-        stack.check_array(image, ndim=2, dtype=[np.uint8, np.uint16])
+        stack.check_array(image, ndim=[2, 3], dtype=[np.uint8, np.uint16])
     actual_keys = ["cell_id", "bbox", "cell_coord", "cell_mask", "nuc_coord",
-                   "nuc_mask", "rna_coord", "image"]
+                   "nuc_mask", "rna_coord", "image", "z_range"]
     if others_coord is not None:
         for key in others_coord:
             if key in actual_keys:
@@ -342,8 +511,6 @@ def extract_cell(cell_label, ndim, nuc_label=None, rna_coord=None,
                               "dimension we consider ({1})."
                               .format(array.shape[1], ndim),
                               UserWarning)
-    # TODO allow boolean for 'others_image'
-    # TODO bug if 'image' is None but not 'others_image'
     if others_image is not None:
         for key in others_image:
             if key in actual_keys:
@@ -352,11 +519,14 @@ def extract_cell(cell_label, ndim, nuc_label=None, rna_coord=None,
             else:
                 actual_keys.append(key)
             image_ = others_image[key]
-            stack.check_array(image_, ndim=2, dtype=[np.uint8, np.uint16])
-            if image_.shape != image.shape:
+            stack.check_array(
+                image_,
+                ndim=[2, 3],
+                dtype=[np.uint8, np.uint16, bool])
+            if image_.shape[-2:] != cell_label.shape:
                 warnings.warn("Image in 'others_image' does not have the same "
-                              "shape ({0}) than original image ({1})."
-                              .format(image_.shape, image.shape),
+                              "shape ({0}) than the labelled cells ({1})."
+                              .format(image_.shape, cell_label.shape),
                               UserWarning)
     if rna_coord is not None and rna_coord.shape[1] < ndim:
         warnings.warn("'rna_coord' have less coordinates ({0}) than the "
@@ -364,120 +534,298 @@ def extract_cell(cell_label, ndim, nuc_label=None, rna_coord=None,
                       "consider ({1}).".format(rna_coord.shape[1], ndim),
                       UserWarning)
 
+    # get the number of planes to crop along the z axis
+    images = {}
+    if image is not None:
+        images["image"] = image
+    if others_image is not None:
+        images.update(others_image)
+    if z_margin is not None:
+        if z_margin < 0:
+            raise ValueError("Parameter 'z_margin' should be a positive "
+                             "integer, not {0}.".format(z_margin))
+        if ndim != 3:
+            raise ValueError("Parameter 'z_margin' requires 3-d coordinates, "
+                             "not {0}-d.".format(ndim))
+        nb_z = [image_.shape[0] for image_ in images.values()
+                if image_.ndim == 3]
+        if len(nb_z) == 0:
+            raise ValueError("Parameter 'z_margin' requires at least one 3-d "
+                             "image to crop.")
+        nb_z = max(nb_z)
+
     # initialize FoV results
     fov_results = []
 
-    # initialize a mask to detect cells at the FoV borders
-    fov_borders = np.zeros(cell_label.shape, dtype=bool)
-    if remove_cropped_cell:
-        fov_borders[:, 0] = True
-        fov_borders[0, :] = True
-        fov_borders[:, cell_label.shape[1] - 1] = True
-        fov_borders[cell_label.shape[0] - 1, :] = True
+    # get the bounding box of each cell and nucleus
+    cell_slices = ndi.find_objects(cell_label)
+    if nuc_label is not None:
+        nuc_slices = ndi.find_objects(nuc_label)
+
+    # assign each spot to a cell with a single label lookup
+    coords = {}
+    if rna_coord is not None:
+        coords["rna_coord"] = rna_coord
+    if others_coord is not None:
+        coords.update(others_coord)
+    groups = {}
+    for key in coords:
+        _, order, offsets = _assign_objects_to_labels(
+            cell_label, coords[key], ndim)
+        groups[key] = (coords[key], order, offsets)
 
     # iterate over each segmented cell
-    cells = regionprops(cell_label)
-    for cell in cells:
+    for i, cell_slice in enumerate(cell_slices):
+        if cell_slice is None:
+            continue
 
         # initialize cell results
         cell_results = {}
 
         # get the bounding box of the cell
-        label = cell.label
+        label = i + 1
         cell_results["cell_id"] = label
-        (min_y, min_x, max_y, max_x) = cell.bbox
-        cell_results["bbox"] = cell.bbox
-
-        # get binary masks of the cell
-        cell_mask = cell_label.copy()
-        cell_mask = (cell_mask == label)
+        min_y, max_y = cell_slice[0].start, cell_slice[0].stop
+        min_x, max_x = cell_slice[1].start, cell_slice[1].stop
+        cell_results["bbox"] = (min_y, min_x, max_y, max_x)
 
         # check if cell is not cropped by the borders
-        if remove_cropped_cell and _check_cropped_cell(cell_mask, fov_borders):
+        if remove_cropped_cell and _check_cropped_bbox(
+                cell_slice, cell_label.shape):
             continue
 
+        # get cropped binary mask of the cell
+        cell_mask_cropped = cell_label[cell_slice] == label
+
         # get boundaries coordinates for cell
-        cell_coord = from_binary_to_coord(cell_mask)
+        cell_coord = from_binary_to_coord(cell_mask_cropped)
         cell_coord = complete_coord_boundaries(cell_coord)
-        cell_coord[:, 0] -= min_y
-        cell_coord[:, 1] -= min_x
         cell_results["cell_coord"] = cell_coord
-
-        # crop binary mask of the cell
-        cell_mask_cropped = cell_mask[min_y: max_y, min_x: max_x]
         cell_results["cell_mask"] = cell_mask_cropped
 
         # get binary mask of the nucleus
         if nuc_label is not None:
-            nuc_mask = nuc_label.copy()
-            nuc_mask = (nuc_mask == label)
-
-            # check if nucleus is in the cell
-            if (check_nuc_in_cell
-                    and not _check_nucleus_in_cell(cell_mask, nuc_mask)):
-                continue
-
-            # get boundaries coordinates for nucleus
-            nuc_coord = from_binary_to_coord(nuc_mask)
-            nuc_coord = complete_coord_boundaries(nuc_coord)
-            nuc_coord[:, 0] -= min_y
-            nuc_coord[:, 1] -= min_x
+            nuc_mask_cropped = nuc_label[cell_slice] == label
+            if label <= len(nuc_slices) and nuc_slices[label - 1] is not None:
+                nuc_slice = nuc_slices[label - 1]
+
+                # check if nucleus is in the cell
+                if (check_nuc_in_cell
+                        and not _check_nucleus_in_bbox(
+                            cell_mask_cropped, nuc_mask_cropped, cell_slice,
+                            nuc_slice)):
+                    continue
+
+                # get boundaries coordinates for nucleus, from its own
+                # bounding box (it can overflow the cell)
+                nuc_coord = from_binary_to_coord(
+                    nuc_label[nuc_slice] == label)
+                nuc_coord = complete_coord_boundaries(nuc_coord)
+                nuc_coord[:, 0] += nuc_slice[0].start - min_y
+                nuc_coord[:, 1] += nuc_slice[1].start - min_x
+
+            # cell without nucleus
+            else:
+                nuc_coord = np.zeros((0, 2), dtype=np.int64)
             cell_results["nuc_coord"] = nuc_coord
-
-            # crop binary mask of the nucleus
-            nuc_mask_cropped = nuc_mask[min_y: max_y, min_x: max_x]
             cell_results["nuc_mask"] = nuc_mask_cropped
 
-        # get coordinates of the spots detected in the cell
-        if rna_coord is not None:
-            rna_in_cell, _ = identify_objects_in_region(
-                cell_mask,
-                rna_coord,
-                ndim)
-            rna_in_cell[:, ndim - 2] -= min_y
-            rna_in_cell[:, ndim - 1] -= min_x
-            cell_results["rna_coord"] = rna_in_cell
-
-        # get coordinates of the other detected elements
-        if others_coord is not None:
-            for key in others_coord:
-                array = others_coord[key]
-                element_in_cell, _ = identify_objects_in_region(
-                    cell_mask,
-                    array,
-                    ndim)
-                element_in_cell[:, ndim - 2] -= min_y
-                element_in_cell[:, ndim - 1] -= min_x
-                cell_results[key] = element_in_cell
-
-        # crop cell image
-        if image is not None:
-            image_cropped = image[min_y: max_y, min_x: max_x]
-            cell_results["image"] = image_cropped
-
-        # get crops of the other images
-        if others_image is not None:
-            for key in others_image:
-                image_ = others_image[key]
-                image_cropped_ = image_[min_y: max_y, min_x: max_x]
-                cell_results[key] = image_cropped_
+        # get coordinates of the spots and the other detected elements in the
+        # cell
+        for key, (coord, order, offsets) in groups.items():
+            indices = order[offsets[label]:offsets[label + 1]]
+            element_in_cell = coord[indices]
+            element_in_cell[:, ndim - 2] -= min_y
+            element_in_cell[:, ndim - 1] -= min_x
+            cell_results[key] = element_in_cell
+
+        # get the planes of the cell, around its spots
+        z_slice = slice(None)
+        if z_margin is not None:
+            min_z, max_z = 0, nb_z
+            z_spots = [cell_results[key][:, 0] for key in groups
+                       if len(cell_results[key]) > 0]
+            if len(z_spots) > 0:
+                z_spots = np.concatenate(z_spots)
+                min_z = max(int(np.round(z_spots.min())) - z_margin, 0)
+                max_z = min(int(np.round(z_spots.max())) + z_margin + 1,
+                            nb_z)
+            cell_results["z_range"] = (min_z, max_z)
+            z_slice = slice(min_z, max_z)
+
+        # crop cell image and the other images (views of the original ones)
+        for key, image_ in images.items():
+            if image_.ndim == 3:
+                image_cropped = image_[z_slice, min_y: max_y, min_x: max_x]
+            else:
+                image_cropped = image_[min_y: max_y, min_x: max_x]
+            cell_results[key] = image_cropped
 
         fov_results.append(cell_results)
 
     return fov_results
 
 
-def _check_cropped_cell(cell_mask, border_frame):
+def extract_cells_to_store(fovs, path, ndim, n_jobs=1, max_in_flight=None,
+                           remove_cropped_cell=True, check_nuc_in_cell=True):
+    """Extract cell-level results for several fields of view and write them
+    in a single file with ``cells`` extension.
+
+    Fields of view are extracted with :func:`extract_cell` in a process pool.
+    Their cells are written with :class:`apifish.stack.CellStoreWriter` as
+    soon as they are extracted, in the order of the fields of view, so only a
+    few fields of view are held in memory at the same time. Each cell gets an
+    extra `fov_id` key with the position of its field of view in 'fovs'.
+    The store is only moved to 'path' once every field of view is written: if
+    the extraction fails, no partial store is left behind and a previous
+    file with the same path is kept.
+
+    Parameters
+    ----------
+    fovs : Iterable[Tuple]
+        Fields of view to extract, as (`cell_label`, `nuc_label`,
+        `rna_coord`, `image`, `others_coord`) tuples, with the same
+        definitions than in :func:`extract_cell` (`nuc_label`, `rna_coord`,
+        `image` and `others_coord` can be None). It is consumed lazily, so it
+        can be a generator reading the fields of view from disk.
+    path : str
+        Path of the saved file.
+    ndim : int
+        Number of spatial dimensions to consider (2 or 3).
+    n_jobs : int, default=1
+        Number of processes used to extract the fields of view. If 1, fields
+        of view are extracted in the current process.
+    max_in_flight : int, optional
+        Maximum number of fields of view submitted and not written yet. If
+        None, it is twice the number of processes.
+    remove_cropped_cell : bool
+        Remove cells cropped by the FoV frame.
+    check_nuc_in_cell : bool
+        Check that each nucleus is entirely localized within a cell.
+
+    Returns
+    -------
+    cell_store : apifish.stack.CellStore
+        Lazy store of the cells written.
+
     """
-    Check if a cell is cropped by the border frame.
+    # check parameters
+    stack.check_parameter(
+        path=str,
+        ndim=int,
+        n_jobs=int,
+        max_in_flight=(int, type(None)),
+        remove_cropped_cell=bool,
+        check_nuc_in_cell=bool)
+    if n_jobs < 1:
+        raise ValueError("Parameter 'n_jobs' should be a positive integer, "
+                         "not {0}.".format(n_jobs))
+    if max_in_flight is None:
+        max_in_flight = 2 * n_jobs
+    elif max_in_flight < 1:
+        raise ValueError("Parameter 'max_in_flight' should be a positive "
+                         "integer, not {0}.".format(max_in_flight))
+    parameters = {"remove_cropped_cell": remove_cropped_cell,
+                  "check_nuc_in_cell": check_nuc_in_cell}
+
+    with stack.CellStoreWriter(path) as writer:
+
+        # extract fields of view in the current process
+        if n_jobs == 1:
+            for i_fov, fov in enumerate(fovs):
+                fov_results = _extract_fov(i_fov, fov, ndim, parameters)
+                _write_fov_results(writer, fov_results)
+
+        # extract fields of view in a process pool, keeping at most
+        # 'max_in_flight' results pending
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                pending = deque()
+                try:
+                    for i_fov, fov in enumerate(fovs):
+                        if len(pending) == max_in_flight:
+                            _write_fov_results(
+                                writer, pending.popleft().result())
+                        pending.append(executor.submit(
+                            _extract_fov, i_fov, fov, ndim, parameters))
+                    while len(pending) > 0:
+                        _write_fov_results(writer, pending.popleft().result())
+                finally:
+                    for future in pending:
+                        future.cancel()
+
+    # open the store
+    cell_store = stack.read_fov_extracted(writer.path)
+
+    return cell_store
+
+
+def _extract_fov(i_fov, fov, ndim, parameters):
+    """Extract cell-level results for a field of view.
 
     Parameters
     ----------
-    cell_mask : np.ndarray, bool
-        Binary mask of the cell cytoplasm.
+    i_fov : int
+        Index of the field of view.
+    fov : Tuple
+        Field of view, as a (`cell_label`, `nuc_label`, `rna_coord`, `image`,
+        `others_coord`) tuple.
+    ndim : int
+        Number of spatial dimensions to consider (2 or 3).
+    parameters : Dict
+        Other parameters of :func:`extract_cell`.
 
-    border_frame : np.ndarray, bool
-        Binary mask of the border frame.
+    Returns
+    -------
+    fov_results : List[Dict]
+        List of dictionaries, one per cell segmented in the field of view,
+        with the index of the field of view as `fov_id`.
+
+    """
+    # get field of view
+    if not isinstance(fov, (tuple, list)) or len(fov) != 5:
+        raise ValueError("Field of view {0} should be a (cell_label, "
+                         "nuc_label, rna_coord, image, others_coord) tuple."
+                         .format(i_fov))
+    cell_label, nuc_label, rna_coord, image, others_coord = fov
+    if others_coord is not None and "fov_id" in others_coord:
+        raise KeyError("Key fov_id in 'others_coord' is already taken. "
+                       "Please choose another one.")
+
+    # extract cells
+    fov_results = extract_cell(
+        cell_label, ndim, nuc_label=nuc_label, rna_coord=rna_coord,
+        others_coord=others_coord, image=image, **parameters)
+    for cell_results in fov_results:
+        cell_results["fov_id"] = i_fov
+
+    return fov_results
+
+
+def _write_fov_results(writer, fov_results):
+    """Write the cells of a field of view.
+
+    Parameters
+    ----------
+    writer : apifish.stack.CellStoreWriter
+        Writer of the cell store.
+    fov_results : List[Dict]
+        List of dictionaries, one per cell segmented in the field of view.
+
+    """
+    for cell_results in fov_results:
+        writer.write(cell_results)
+
+
+def _check_cropped_bbox(cell_slice, shape):
+    """Check if a cell is cropped by the border frame, from its bounding box.
+
+    Parameters
+    ----------
+    cell_slice : Tuple[slice]
+        Bounding box of the cell.
+    shape : Tuple[int]
+        Shape of the frame.
 
     Returns
     -------
@@ -485,12 +833,41 @@ def _check_cropped_cell(cell_mask, border_frame):
         True if cell is cropped.
 
     """
-    # check cell is not cropped by the borders
-    crop = cell_mask & border_frame
-    if np.any(crop):
-        return True
-    else:
-        return False
+    for s, size in zip(cell_slice, shape):
+        if s.start == 0 or s.stop == size:
+            return True
+
+    return False
+
+
+def _check_nucleus_in_bbox(cell_mask_cropped, nuc_mask_cropped, cell_slice,
+                           nuc_slice):
+    """Check if the nucleus is properly contained in the cell cytoplasm, from
+    their bounding boxes.
+
+    Parameters
+    ----------
+    cell_mask_cropped : np.ndarray, bool
+        Binary mask of the cell cytoplasm, cropped by its bounding box.
+    nuc_mask_cropped : np.ndarray, bool
+        Binary mask of the nucleus, cropped by the cell bounding box.
+    cell_slice : Tuple[slice]
+        Bounding box of the cell.
+    nuc_slice : Tuple[slice]
+        Bounding box of the nucleus.
+
+    Returns
+    -------
+    _ : bool
+        True if the nucleus is in the cell.
+
+    """
+    # the nucleus bounding box should be included in the cell bounding box
+    for s_cell, s_nuc in zip(cell_slice, nuc_slice):
+        if s_nuc.start < s_cell.start or s_nuc.stop > s_cell.stop:
+            return False
+
+    return _check_nucleus_in_cell(cell_mask_cropped, nuc_mask_cropped)
 
 
 def _check_nucleus_in_cell(cell_mask, nuc_mask):
@@ -607,6 +984,9 @@ def summarize_extraction_results(fov_results, ndim, path_output=None,
         summarized as well.
 
     """
+    # import pandas lazily
+    import pandas as pd
+
     # check parameters
     stack.check_parameter(
         fov_results=list,
@@ -700,6 +1080,143 @@ def summarize_extraction_results(fov_results, ndim, path_output=None,
     return df
 
 
+def summarize_cell_counts(cell_label, ndim, nuc_label=None, rna_coord=None,
+                          others_coord=None, remove_cropped_cell=True,
+                          check_nuc_in_cell=True, path_output=None,
+                          delimiter=";"):
+    """Count detected elements per cell and store them in a dataframe,
+    directly from the labelled images.
+
+    The function returns the same dataframe than
+    :func:`summarize_extraction_results` applied to the output of
+    :func:`extract_cell`, without building the individual cell crops, masks
+    and contours. If no cell is found, the dataframe is empty but keeps all
+    its columns.
+
+    Parameters
+    ----------
+    cell_label : np.ndarray, np.uint or np.int
+        Image with labelled cells and shape (y, x).
+    ndim : int
+        Number of spatial dimensions to consider (2 or 3).
+    nuc_label : np.ndarray, np.uint or np.int
+        Image with labelled nuclei and shape (y, x). If None, RNAs inside and
+        outside the nucleus are not counted.
+    rna_coord : np.ndarray
+        Coordinates of the detected RNAs with zyx or yx coordinates in the
+        first 3 or 2 columns. If None, RNAs are not counted.
+    others_coord : Dict[np.ndarray]
+        Dictionary of coordinates arrays, organized the same way than spots.
+        For each array of the dictionary, the different elements are counted
+        in each cell. If None, no others elements are counted.
+    remove_cropped_cell : bool
+        Remove cells cropped by the FoV frame.
+    check_nuc_in_cell : bool
+        Remove cells whose nucleus is not entirely localized within the cell.
+    path_output : str, optional
+        Path to save the dataframe in a csv file.
+    delimiter : str, default=";"
+        Delimiter used to separate columns if the dataframe is saved in a csv
+        file.
+
+    Returns
+    -------
+    df : pd.DataFrame
+        Dataframe with summarized results from the field of view, at the cell
+        level. At least `cell_id` (Unique id of the cell) is returned. Other
+        indicators are summarized if available:
+
+        * `nb_rna`: Number of detected rna in the cell.
+        * `nb_rna_in_nuc`: Number of detected rna inside the nucleus.
+        * `nb_rna_out_nuc`: Number of detected rna outside the nucleus.
+
+        Elements from 'others_coord' are counted in the cell and summarized
+        as well.
+
+    """
+    # import pandas lazily
+    import pandas as pd
+
+    # check parameters
+    stack.check_parameter(
+        ndim=int,
+        others_coord=(dict, type(None)),
+        remove_cropped_cell=bool,
+        check_nuc_in_cell=bool,
+        path_output=(str, type(None)))
+    stack.check_array(
+        cell_label,
+        ndim=2,
+        dtype=[np.uint8, np.uint16, np.int64])
+    if nuc_label is not None:
+        stack.check_array(
+            nuc_label,
+            ndim=2,
+            dtype=[np.uint8, np.uint16, np.int64])
+    actual_keys = ["cell_id", "bbox", "cell_coord", "cell_mask", "nuc_coord",
+                   "nuc_mask", "rna_coord", "image"]
+    if others_coord is not None:
+        for key in others_coord:
+            if key in actual_keys:
+                raise KeyError("Key {0} in 'others_coord' is already taken. "
+                               "Please choose another one.".format(key))
+
+    # get the segmented cells
+    nb_labels = int(cell_label.max()) + 1
+    keep = np.bincount(cell_label.ravel(), minlength=nb_labels) > 0
+    keep[0] = False
+
+    # remove cells cropped by the borders
+    if remove_cropped_cell:
+        border = np.concatenate([cell_label[0, :], cell_label[-1, :],
+                                 cell_label[:, 0], cell_label[:, -1]])
+        keep[border] = False
+
+    # remove cells with a nucleus overflowing the cytoplasm
+    if nuc_label is not None and check_nuc_in_cell:
+        overflow = (nuc_label > 0) & (nuc_label != cell_label)
+        overflow_label = nuc_label[overflow]
+        keep[overflow_label[overflow_label < nb_labels]] = False
+    cell_id = np.flatnonzero(keep)
+
+    # count rna in each cell, inside and outside the nucleus
+    n = len(cell_id)
+    nb_rna = [np.nan] * n
+    nb_rna_in_nuc = [np.nan] * n
+    nb_rna_out_nuc = [np.nan] * n
+    if rna_coord is not None:
+        rna_label, _, offsets = assign_objects_to_labels(
+            cell_label, rna_coord, ndim)
+        nb_rna = np.diff(offsets)[cell_id]
+        if nuc_label is not None:
+            rna_nuc_label, _, _ = _assign_objects_to_labels(
+                nuc_label, rna_coord, ndim)
+            in_nuc = rna_label[rna_nuc_label == rna_label]
+            nb_rna_in_nuc = np.bincount(in_nuc, minlength=nb_labels)[cell_id]
+            nb_rna_out_nuc = nb_rna - nb_rna_in_nuc
+
+    # store results in a dataframe
+    result_summary = {"cell_id": cell_id,
+                      "nb_rna": nb_rna,
+                      "nb_rna_in_nuc": nb_rna_in_nuc,
+                      "nb_rna_out_nuc": nb_rna_out_nuc}
+
+    # count others elements detected in each cell
+    if others_coord is not None:
+        assignments = assign_objects_to_labels(cell_label, others_coord, ndim)
+        for key, (_, _, offsets) in assignments.items():
+            result_summary["nb_{0}".format(key)] = np.diff(offsets)[cell_id]
+
+    # instantiate dataframe
+    df = pd.DataFrame(result_summary)
+
+    # save dataframe
+    if path_output is not None:
+        stack.save_data_to_csv(df, path_output, delimiter)
+
+    return df
+
+
 # Postprocessing
 
 def center_mask_coord(main, others=None):
@@ -906,6 +1423,81 @@ def from_binary_to_coord(binary):
     return coord
 
 
+def from_label_to_coord(label, complete=True, n_jobs=1):
+    """Extract boundaries coordinates of every object in a 2-d labelled
+    image.
+
+    Each object is processed within its own bounding box, with the same
+    method than :func:`from_binary_to_coord`. Coordinates of all the objects
+    are returned in one array, in the frame of the labelled image: the
+    boundaries of the object with label `i` are
+    ``coord[offsets[i]:offsets[i + 1]]``. As the coordinates represent the
+    external boundaries of the objects, their values can be negative.
+
+    Parameters
+    ----------
+    label : np.ndarray, np.uint or np.int
+        Labelled image with shape (y, x).
+    complete : bool, default=True
+        Complete the boundaries coordinates with
+        :func:`complete_coord_boundaries`.
+    n_jobs : int, default=1
+        Number of threads used to process the objects concurrently.
+
+    Returns
+    -------
+    coord : np.ndarray, np.int64
+        Array of boundaries coordinates with shape (nb_points, 2).
+    offsets : np.ndarray, np.int64
+        Offsets of each label in 'coord', with shape (label.max() + 2,).
+
+    """
+    # check parameters
+    stack.check_parameter(
+        complete=bool,
+        n_jobs=int)
+    stack.check_array(
+        label,
+        ndim=2,
+        dtype=[np.uint8, np.uint16, np.int64])
+    if n_jobs < 1:
+        raise ValueError("Parameter 'n_jobs' should be a positive integer, "
+                         "not {0}.".format(n_jobs))
+
+    # get the bounding box of each object
+    slices = ndi.find_objects(label)
+    objects = [(i + 1, s) for i, s in enumerate(slices) if s is not None]
+
+    def get_boundaries(label_slice):
+        label_, slice_ = label_slice
+        coord_ = from_binary_to_coord(label[slice_] == label_)
+        if complete:
+            coord_ = complete_coord_boundaries(coord_)
+        coord_[:, 0] += slice_[0].start
+        coord_[:, 1] += slice_[1].start
+        return coord_
+
+    # get boundaries of each object
+    if n_jobs == 1 or len(objects) < 2:
+        boundaries = [get_boundaries(object_) for object_ in objects]
+    else:
+        max_workers = min(n_jobs, len(objects))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            boundaries = list(executor.map(get_boundaries, objects))
+
+    # concatenate coordinates and compute offsets
+    counts = np.zeros(len(slices) + 1, dtype=np.int64)
+    for (label_, _), coord_ in zip(objects, boundaries):
+        counts[label_] = len(coord_)
+    offsets = _get_offsets(counts)
+    if len(boundaries) > 0:
+        coord = np.concatenate(boundaries)
+    else:
+        coord = np.zeros((0, 2), dtype=np.int64)
+
+    return coord, offsets
+
+
 def complete_coord_boundaries(coord):
     """Complete a 2-d coordinates array, by generating/interpolating missing
     points.
@@ -6,25 +6,27 @@
 Functions used to build 4D or 5D images.
 """
 
+import queue
+import threading
+import itertools
+
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 import apifish.stack as stack
 
-from .utils import check_recipe
 from .utils import check_datamap
-from .utils import fit_recipe
-from .utils import get_path_from_recipe
-from .utils import get_nb_element_per_dimension
-from .utils import count_nb_fov
+from .utils import compile_recipe
 
 
-# TODO only read in memory one or several channels (and not the entire image)
 # TODO allow new keys to define a recipe
 
 # ### Building stack ###
 
 def build_stacks(data_map, input_dimension=None, sanity_check=False,
-                 return_origin=False):
+                 return_origin=False, n_jobs=1, prefetch=0, rounds=None,
+                 channels=None, z_slice=None):
     """Generator to build several stacks from recipe-folder pairs.
 
     To build a stack, a recipe should be linked to a directory including all
@@ -100,12 +102,26 @@ def build_stacks(data_map, input_dimension=None, sanity_check=False,
     data_map : List[tuple]
         Map between input directories and recipes.
     input_dimension : int
-        Number of dimensions of the loaded files. Can speed up the function if
-        provided.
+        Number of dimensions of the loaded files. If provided, it is checked
+        against the dimensions of the first file.
     sanity_check : bool
         Check the validity of the loaded tensor. Can slow down the function.
     return_origin : bool
         Return the input directory and the recipe used to build the stack.
+    n_jobs : int, default=1
+        Number of threads used to read the files of a field of view
+        concurrently.
+    prefetch : int, default=0
+        Number of stacks loaded in advance by a background thread, while the
+        current one is processed by the caller. At most ``prefetch`` stacks
+        are loaded and waiting at the same time. If 0, each stack is loaded
+        when it is requested.
+    rounds : int or List[int], optional
+        Indices of the rounds to load. If None, every round is loaded.
+    channels : int or List[int], optional
+        Indices of the channels to load. If None, every channel is loaded.
+    z_slice : slice, optional
+        Slice of the z dimension to load. If None, every z element is loaded.
 
     Returns
     -------
@@ -124,29 +140,171 @@ def build_stacks(data_map, input_dimension=None, sanity_check=False,
         data_map=list,
         input_dimension=(int, type(None)),
         sanity_check=bool,
-        return_origin=bool)
+        return_origin=bool,
+        n_jobs=int,
+        prefetch=int)
     check_datamap(data_map)
+    if prefetch < 0:
+        raise ValueError("Parameter 'prefetch' should be a non-negative "
+                         "integer, not {0}.".format(prefetch))
 
-    # load and generate tensors for each recipe-folder pair
+    # list the fov to build for each recipe-folder pair, with recipes
+    # compiled once
+    tasks = []
     for recipe, input_folder in data_map:
+        compiled_recipe = compile_recipe(recipe)
+        for i_fov in range(compiled_recipe.nb_fov):
+            tasks.append((recipe, input_folder, i_fov, compiled_recipe))
+
+    # load and generate tensors for each fov
+    def build(task):
+        _, input_folder_, i_fov_, compiled_recipe_ = task
+        tensor_ = build_stack(
+            compiled_recipe_,
+            input_folder_,
+            input_dimension=input_dimension,
+            sanity_check=sanity_check,
+            i_fov=i_fov_,
+            n_jobs=n_jobs,
+            rounds=rounds,
+            channels=channels,
+            z_slice=z_slice)
+        return tensor_
+
+    if prefetch == 0:
+        results = _build_stacks_sequential(tasks, build)
+    else:
+        results = _build_stacks_prefetched(tasks, build, prefetch)
+    for (recipe, input_folder, i_fov, _), tensor in results:
+        if return_origin:
+            yield tensor, input_folder, recipe, i_fov
+        else:
+            yield tensor
+
+
+def _build_stacks_sequential(tasks, build):
+    """Build stacks one after the other, when they are requested.
+
+    Parameters
+    ----------
+    tasks : List[tuple]
+        List of (recipe, input_folder, i_fov, compiled_recipe) to build.
+    build : callable
+        Function building a stack from a task.
+
+    Returns
+    -------
+    task : tuple
+        Task (recipe, input_folder, i_fov, compiled_recipe) used to build the
+        stack.
+    tensor : np.ndarray
+        Tensor with shape (round, channel, z, y, x).
+
+    """
+    for task in tasks:
+        try:
+            tensor = build(task)
+        except Exception as error:
+            raise _format_building_error(error, task) from error
+        yield task, tensor
+
+
+def _build_stacks_prefetched(tasks, build, prefetch):
+    """Build stacks in a background thread, ahead of the caller.
+
+    A semaphore bounds the number of stacks loaded (or being loaded) and not
+    yet requested by the caller to 'prefetch'. An error raised while
+    building a stack is raised when the caller requests this stack.
+
+    Parameters
+    ----------
+    tasks : List[tuple]
+        List of (recipe, input_folder, i_fov, compiled_recipe) to build.
+    build : callable
+        Function building a stack from a task.
+    prefetch : int
+        Maximum number of stacks loaded in advance.
+
+    Returns
+    -------
+    task : tuple
+        Task (recipe, input_folder, i_fov, compiled_recipe) used to build the
+        stack.
+    tensor : np.ndarray
+        Tensor with shape (round, channel, z, y, x).
+
+    """
+    results = queue.Queue()
+    slots = threading.Semaphore(prefetch)
+    stop = threading.Event()
+
+    def produce():
+        for task in tasks:
+            slots.acquire()
+            if stop.is_set():
+                return
+            try:
+                results.put((task, build(task), None))
+            except Exception as error:
+                results.put((task, None, error))
+                return
+        results.put(None)
+
+    # start the background loading
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    # return the stacks in order, as soon as they are loaded
+    try:
+        while True:
+            result = results.get()
+            if result is None:
+                break
+            task, tensor, error = result
+            slots.release()
+            if error is not None:
+                raise _format_building_error(error, task) from error
+            yield task, tensor
+
+    # stop the background loading if the caller stops early
+    finally:
+        stop.set()
+        slots.release()
+        thread.join()
+
+
+def _format_building_error(error, task):
+    """Add the recipe and the fov index to an error raised while building a
+    stack.
+
+    Parameters
+    ----------
+    error : Exception
+        Error raised while building a stack.
+    task : tuple
+        Task (recipe, input_folder, i_fov, compiled_recipe) used to build the
+        stack.
+
+    Returns
+    -------
+    new_error : Exception
+        Error with the same type (or a RuntimeError if it can't be built from
+        a message) and a message mentioning the recipe and the fov index.
 
-        # load and generate tensors for each fov stored in a recipe
-        nb_fov = count_nb_fov(recipe)
-        for i_fov in range(nb_fov):
-            tensor = build_stack(
-                recipe,
-                input_folder,
-                input_dimension=input_dimension,
-                sanity_check=sanity_check,
-                i_fov=i_fov)
-            if return_origin:
-                yield tensor, input_folder, recipe, i_fov
-            else:
-                yield tensor
+    """
+    recipe, input_folder, i_fov, _ = task
+    message = ("Stack {0} from recipe {1} can't be built in directory {2}: "
+               "{3}".format(i_fov, recipe, input_folder, error))
+    try:
+        new_error = type(error)(message)
+    except Exception:
+        new_error = RuntimeError(message)
+
+    return new_error
 
 
 def build_stack(recipe, input_folder, input_dimension=None, sanity_check=False,
-                i_fov=0):
+                i_fov=0, n_jobs=1, rounds=None, channels=None, z_slice=None):
     """Build a 5-d stack from the same field of view (fov).
 
     The recipe dictionary for one field of view takes the form:
@@ -203,36 +361,58 @@ def build_stack(recipe, input_folder, input_dimension=None, sanity_check=False,
 
     Parameters
     ----------
-    recipe : dict
+    recipe : dict or CompiledRecipe
         Map the images according to their field of view, their round,
         their channel and their spatial dimensions. Can only contain the keys
-        'pattern', 'fov', 'r', 'c', 'z', 'ext' or 'opt'.
+        'pattern', 'fov', 'r', 'c', 'z', 'ext' or 'opt'. A recipe compiled
+        with :func:`compile_recipe` avoids parsing it for every fov.
     input_folder : str
         Path of the folder containing the images.
     input_dimension : int
-        Number of dimensions of the loaded files. Can speed up the function if
-        provided.
+        Number of dimensions of the loaded files. If provided, it is checked
+        against the dimensions of the first file.
     i_fov : int
         Index of the fov to build.
     sanity_check : bool
         Check the validity of the loaded tensor. Can slow down the function.
+    n_jobs : int, default=1
+        Number of threads used to read the files concurrently. Files are
+        still stacked in the order defined by the recipe.
+    rounds : int or List[int], optional
+        Indices of the rounds to load, along the round dimension of the 5-d
+        tensor. If None, every round is loaded.
+    channels : int or List[int], optional
+        Indices of the channels to load, along the channel dimension of the
+        5-d tensor. If None, every channel is loaded.
+    z_slice : slice, optional
+        Slice of the z dimension to load. If None, every z element is loaded.
 
     Returns
     -------
     tensor : np.ndarray
-        Tensor with shape (round, channel, z, y, x).
+        Tensor with shape (round, channel, z, y, x). Only the files (or the
+        pages of the files) of the selected rounds, channels and z elements
+        are read.
 
     """
     # check parameters
-    check_recipe(recipe)
+    recipe = compile_recipe(recipe)
     stack.check_parameter(
         input_folder=str,
         input_dimension=(int, type(None)),
         i_fov=int,
-        sanity_check=bool)
+        sanity_check=bool,
+        n_jobs=int,
+        rounds=(int, list, type(None)),
+        channels=(int, list, type(None)),
+        z_slice=(slice, type(None)))
+    if n_jobs < 1:
+        raise ValueError("Parameter 'n_jobs' should be a positive integer, "
+                         "not {0}.".format(n_jobs))
 
     # build stack from recipe and tif files
-    tensor = _load_stack(recipe, input_folder, input_dimension, i_fov)
+    tensor = _load_stack(recipe, input_folder, input_dimension, i_fov, n_jobs,
+                         rounds, channels, z_slice)
 
     # check the validity of the loaded tensor
     if sanity_check:
@@ -248,7 +428,8 @@ def build_stack(recipe, input_folder, input_dimension=None, sanity_check=False,
     return tensor
 
 
-def _load_stack(recipe, input_folder, input_dimension=None, i_fov=0):
+def _load_stack(recipe, input_folder, input_dimension=None, i_fov=0,
+                n_jobs=1, rounds=None, channels=None, z_slice=None):
     """Build a 5-d tensor from the same field of view (fov).
 
     The function stacks a set of images using a recipe mapping the
@@ -259,6 +440,11 @@ def _load_stack(recipe, input_folder, input_dimension=None, i_fov=0):
     added. This operation is repeated until we get a 5-d tensor. We first
     operate on the z dimension, then the channels and eventually the rounds.
 
+    The final tensor is allocated once, from the shape and the dtype of the
+    first file, then every file is read directly in its slot. Rounds,
+    channels and z elements can be selected: files out of the selection are
+    not read, and only the selected pages of the other files are decoded.
+
     The recipe dictionary for one field of view takes the form:
 
         {
@@ -284,16 +470,23 @@ def _load_stack(recipe, input_folder, input_dimension=None, i_fov=0):
 
     Parameters
     ----------
-    recipe : dict
+    recipe : CompiledRecipe
         Map the images according to their field of view, their round,
-        their channel and their spatial dimensions. Can only contain the keys
-        'pattern', 'fov', 'r', 'c', 'z', 'ext' or 'opt'.
+        their channel and their spatial dimensions.
     input_folder : str
         Path of the folder containing the images.
     input_dimension : int
         Number of dimensions of the loaded files.
     i_fov : int
         Index of the fov to build.
+    n_jobs : int
+        Number of threads used to read the files.
+    rounds : int or List[int], optional
+        Indices of the rounds to load.
+    channels : int or List[int], optional
+        Indices of the channels to load.
+    z_slice : slice, optional
+        Slice of the z dimension to load.
 
     Returns
     -------
@@ -301,262 +494,238 @@ def _load_stack(recipe, input_folder, input_dimension=None, i_fov=0):
         Tensor with shape (round, channel, z, y, x).
 
     """
-    # complete the recipe with unused morphemes
-    recipe = fit_recipe(recipe)
-
-    # if the initial dimension of the files is unknown, we read one of them
-    if input_dimension is None:
-        input_dimension = _get_input_dimension(recipe, input_folder)
-
-    # get the number of elements to stack per dimension
-    nb_r, nb_c, nb_z = get_nb_element_per_dimension(recipe)
-
-    # we stack our files according to their initial dimension
-    if input_dimension == 2:
-        stack_ = _build_stack_from_2d(
-            recipe,
-            input_folder,
-            fov=i_fov,
-            nb_r=nb_r,
-            nb_c=nb_c,
-            nb_z=nb_z)
-    elif input_dimension == 3:
-        stack_ = _build_stack_from_3d(
-            recipe,
-            input_folder,
-            fov=i_fov,
-            nb_r=nb_r,
-            nb_c=nb_c)
-    elif input_dimension == 4:
-        stack_ = _build_stack_from_4d(
-            recipe,
-            input_folder,
-            fov=i_fov,
-            nb_r=nb_r)
-    elif input_dimension == 5:
-        stack_ = _build_stack_from_5d(recipe, input_folder, fov=i_fov)
-    else:
+    # read the shape and the dtype of the first file (without decoding it if
+    # possible)
+    path = recipe.get_path(input_folder, fov=i_fov)
+    image = stack.read_image(path, lazy=True)
+    shape, dtype = tuple(image.shape), image.dtype
+    del image
+
+    # check the dimension of the files
+    if input_dimension is not None and input_dimension != len(shape):
+        raise ValueError("Files have {0} dimensions, not the {1} dimensions "
+                         "set with 'input_dimension'."
+                         .format(len(shape), input_dimension))
+    input_dimension = len(shape)
+    if input_dimension not in [2, 3, 4, 5]:
         raise ValueError("Files do not have the right number of dimensions: "
                          "{0}. The files we stack should have between 2 and "
-                         "5 dimensions.".format(input_dimension))
+                         "5 dimensions.".format(len(shape)))
+
+    # get the selected elements of the round, channel and z dimensions
+    nb_stacked = 5 - input_dimension
+    full_shape = (recipe.nb_r, recipe.nb_c, recipe.nb_z)[:nb_stacked] + shape
+    selections = [
+        _get_selection(rounds, full_shape[0], "rounds"),
+        _get_selection(channels, full_shape[1], "channels"),
+        z_slice if z_slice is not None else slice(None)]
+
+    # the first dimensions are built from different files...
+    file_selections = selections[:nb_stacked]
+    if nb_stacked == 3:
+        file_selections[2] = list(range(full_shape[2]))[selections[2]]
+
+    # ... and the next ones are read from the pages of each file
+    page_key = tuple(selections[nb_stacked:])
+    page_shape = list(shape)
+    is_full = True
+    for axis, k in enumerate(page_key):
+        elements = list(range(shape[axis]))
+        selected = k if isinstance(k, list) else elements[k]
+        page_shape[axis] = len(selected)
+        is_full &= selected == elements
+    page_shape = tuple(page_shape)
+    if is_full:
+        page_key = None
+
+    # get the path of every file with its position in the final tensor
+    slots = _get_stack_slots(recipe, input_folder, i_fov, file_selections)
+
+    # allocate the final tensor and read each file in its slot
+    leading_shape = tuple(len(selection) for selection in file_selections)
+    stack_ = np.empty(leading_shape + page_shape, dtype=dtype)
+    _read_stack_slots(stack_, slots, n_jobs, page_key, shape)
 
     return stack_
 
 
-def _build_stack_from_2d(recipe, input_folder, fov=0, nb_r=1, nb_c=1, nb_z=1):
-    """Load and stack 2-d tensors.
+def _get_selection(selection, nb_elements, name):
+    """Get the indices of the elements selected along a dimension.
 
     Parameters
     ----------
-    recipe : dict
-        Map the images according to their field of view, their round,
-        their channel and their spatial dimensions. Only contain the keys
-        'fov', 'r', 'c', 'z', 'ext' or 'opt'.
-    input_folder : str
-        Path of the folder containing the images.
-    fov : int
-        Index of the fov to build.
-    nb_r : int
-        Number of round file to stack in order to get a 5-d tensor.
-    nb_c : int
-        Number of channel file to stack in order to get a 4-d tensor.
-    nb_z : int
-        Number of z file to stack in order to get a 3-d tensor.
+    selection : int, List[int] or None
+        Indices of the selected elements. If None, every element is selected.
+    nb_elements : int
+        Number of elements along the dimension.
+    name : str
+        Name of the selection, to format error messages.
 
     Returns
     -------
-    tensor_5d : np.ndarray
-        Tensor with shape (round, channel, z, y, x).
+    indices : List[int]
+        Indices of the selected elements.
 
     """
-
-    # load and stack successively z, channel then round elements
-    tensors_4d = []
-    for r in range(nb_r):
-
-        # load and stack channel elements (3-d tensors)
-        tensors_3d = []
-        for c in range(nb_c):
-
-            # load and stack z elements (2-d tensors)
-            tensors_2d = []
-            for z in range(nb_z):
-                path = get_path_from_recipe(
-                    recipe,
-                    input_folder,
-                    fov=fov,
-                    r=r,
-                    c=c,
-                    z=z)
-                tensor_2d = stack.read_image(path)
-                tensors_2d.append(tensor_2d)
-
-            # stack 2-d tensors in 3-d
-            tensor_3d = np.stack(tensors_2d, axis=0)
-            tensors_3d.append(tensor_3d)
-
-        # stack 3-d tensors in 4-d
-        tensor_4d = np.stack(tensors_3d, axis=0)
-        tensors_4d.append(tensor_4d)
-
-    # stack 4-d tensors in 5-d
-    tensor_5d = np.stack(tensors_4d, axis=0)
-
-    return tensor_5d
-
-
-def _build_stack_from_3d(recipe, input_folder, fov=0, nb_r=1, nb_c=1):
-    """Load and stack 3-d tensors.
+    # select every element
+    if selection is None:
+        return list(range(nb_elements))
+
+    # enlist and check indices
+    if isinstance(selection, int):
+        selection = [selection]
+    indices = []
+    for i in selection:
+        if not isinstance(i, int) or not -nb_elements <= i < nb_elements:
+            raise ValueError("Parameter '{0}' should only contain indices "
+                             "between {1} and {2}, not {3}."
+                             .format(name, -nb_elements, nb_elements - 1,
+                                     selection))
+        indices.append(i % nb_elements)
+
+    return indices
+
+
+def _get_stack_slots(recipe, input_folder, fov, file_selections):
+    """Get the path of each file to stack, with its position in the 5-d
+    tensor.
+
+    Files are ordered by round, then channel, then z element. The number of
+    leading dimensions to build depends on the dimension of the files: 2-d
+    files are stacked along the round, channel and z dimensions, 3-d files
+    along the round and channel dimensions, 4-d files along the round
+    dimension and a 5-d file is read directly.
 
     Parameters
     ----------
-    recipe : dict
+    recipe : CompiledRecipe
         Map the images according to their field of view, their round,
-        their channel and their spatial dimensions. Only contain the keys
-        'fov', 'r', 'c', 'z', 'ext' or 'opt'.
+        their channel and their spatial dimensions.
     input_folder : str
         Path of the folder containing the images.
     fov : int
         Index of the fov to build.
-    nb_r : int
-        Number of round file to stack in order to get a 5-d tensor.
-    nb_c : int
-        Number of channel file to stack in order to get a 4-d tensor.
+    file_selections : List[List[int]]
+        Indices of the selected elements, for each dimension built from
+        different files (round, channel and z, or only some of them).
 
     Returns
     -------
-    tensor_5d : np.ndarray
-        Tensor with shape (round, channel, z, y, x).
+    slots : List[tuple]
+        List of (index, path) pairs, with 'index' the position of the file
+        along the leading dimensions of the 5-d tensor.
 
     """
-    # load and stack successively channel elements then round elements
-    tensors_4d = []
-    for r in range(nb_r):
-
-        # load and stack channel elements (3-d tensors)
-        tensors_3d = []
-        for c in range(nb_c):
-            path = get_path_from_recipe(
-                recipe,
-                input_folder,
-                fov=fov,
-                r=r,
-                c=c)
-            tensor_3d = stack.read_image(path)
-            tensors_3d.append(tensor_3d)
-
-        # stack 3-d tensors in 4-d
-        tensor_4d = np.stack(tensors_3d, axis=0)
-        tensors_4d.append(tensor_4d)
-
-    # stack 4-d tensors in 5-d
-    tensor_5d = np.stack(tensors_4d, axis=0)
+    # get the number of elements to stack per leading dimension
+    leading_shape = [len(selection) for selection in file_selections]
 
-    return tensor_5d
+    # build the path of each file
+    slots = []
+    for index in np.ndindex(*leading_shape):
+        indices = [selection[i]
+                   for selection, i in zip(file_selections, index)]
+        r, c, z = indices + [0] * (3 - len(indices))
+        path = recipe.get_path(input_folder, fov=fov, r=r, c=c, z=z)
+        slots.append((index, path))
 
+    return slots
 
-def _build_stack_from_4d(recipe, input_folder, fov=0, nb_r=1):
-    """Load and stack 4-d tensors.
 
-    Parameters
-    ----------
-    recipe : dict
-        Map the images according to their field of view, their round,
-        their channel and their spatial dimensions. Only contain the keys
-        'fov', 'r', 'c', 'z', 'ext' or 'opt'.
-    input_folder : str
-        Path of the folder containing the images.
-    fov : int
-        Index of the fov to build.
-    nb_r : int
-        Number of round file to stack in order to get a 5-d tensor.
-
-    Returns
-    -------
-    tensor_5d : np.ndarray
-        Tensor with shape (round, channel, z, y, x).
-
-    """
-    # load each file from a new round element and stack them
-    tensors_4d = []
-    for r in range(nb_r):
-        path = get_path_from_recipe(recipe, input_folder, fov=fov, r=r)
-        tensor_4d = stack.read_image(path)
-        tensors_4d.append(tensor_4d)
-
-    # stack 4-d tensors in 5-d
-    tensor_5d = np.stack(tensors_4d, axis=0)
-
-    return tensor_5d
-
-
-def _build_stack_from_5d(recipe, input_folder, fov=0):
-    """Load directly a 5-d tensor.
+def _read_stack_slots(tensor, slots, n_jobs=1, page_key=None,
+                      file_shape=None):
+    """Read files in their slot of a preallocated tensor, possibly with
+    several threads.
 
     Parameters
     ----------
-    recipe : dict
-        Map the images according to their field of view, their round,
-        their channel and their spatial dimensions. Only contain the keys
-        'fov', 'r', 'c', 'z', 'ext' or 'opt'.
-    input_folder : str
-        Path of the folder containing the images.
-    fov : int
-        Index of the fov to build.
-
-    Returns
-    -------
-    tensor_5d : np.ndarray
-        Tensor with shape (round, channel, z, y, x).
+    tensor : np.ndarray
+        Preallocated tensor.
+    slots : List[tuple]
+        List of (index, path) pairs, with 'index' the position of the file
+        along the leading dimensions of the tensor.
+    n_jobs : int
+        Number of threads used to read the files.
+    page_key : tuple, optional
+        Elements to read from each file, with a list of indices or a slice
+        per dimension. If None, files are entirely read.
+    file_shape : tuple, optional
+        Expected shape of the files, if 'page_key' is provided.
 
     """
-    # the recipe can only contain one file with a 5-d tensor per fov
-    path = get_path_from_recipe(recipe, input_folder, fov=fov)
-    tensor_5d = stack.read_image(path)
-
-    return tensor_5d
+    def read_slot(slot):
+        index, path = slot
+        if page_key is None:
+            stack.read_image(path, out=tensor[index])
+        else:
+            _read_image_selection(path, page_key, file_shape, tensor[index])
+
+    # file reading is mostly I/O and decompression, which release the GIL
+    if n_jobs == 1 or len(slots) < 2:
+        for slot in slots:
+            read_slot(slot)
+    else:
+        max_workers = min(n_jobs, len(slots))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(read_slot, slots))
 
 
-def _get_input_dimension(recipe, input_folder):
-    """ Load an arbitrary image to get the original dimension of the files.
+def _read_image_selection(path, key, shape, out):
+    """Read a selection of an image, decoding only the pages needed.
 
     Parameters
     ----------
-    recipe : dict
-        Map the images according to their field of view, their round,
-        their channel and their spatial dimensions. Only contain the keys
-        'fov', 'r', 'c', 'z', 'ext' or 'opt'.
-    input_folder : str
-        Path of the folder containing the images.
+    path : str
+        Path of the image to read.
+    key : tuple
+        Elements to read, with a list of indices or a slice per dimension.
+        Lists are indexed independently from each other (outer indexing).
+    shape : tuple
+        Expected shape of the image.
+    out : np.ndarray
+        Preallocated array filled with the selection.
 
     Returns
     -------
-    nb_dim : int
-        Number of dimensions of the original file.
+    out : np.ndarray
+        Preallocated array filled with the selection.
 
     """
-    # get a valid path from the recipe
-    path = get_path_from_recipe(recipe, input_folder)
-
-    # load the image and return the number of dimensions
-    image = stack.read_image(path)
-    nb_dim = image.ndim
-
-    return nb_dim
-
-
-def build_stack_no_recipe(paths, input_dimension=None, sanity_check=False):
+    # read image lazily
+    image = stack.read_image(path, lazy=True)
+    if tuple(image.shape) != shape:
+        raise ValueError("Image {0} has a shape {1} different from the first "
+                         "image of the stack {2}."
+                         .format(path, tuple(image.shape), shape))
+
+    # read the selection, one combination of the listed indices at a time
+    list_axes = [i for i, k in enumerate(key) if isinstance(k, list)]
+    positions = [range(len(key[i])) for i in list_axes]
+    for position in itertools.product(*positions):
+        image_key = list(key)
+        out_key = [slice(None)] * len(key)
+        for axis, i in zip(list_axes, position):
+            image_key[axis] = key[axis][i]
+            out_key[axis] = i
+        out[tuple(out_key)] = image[tuple(image_key)]
+
+    return out
+
+
+def build_stack_no_recipe(paths, input_dimension=None, sanity_check=False,
+                          n_jobs=1):
     """Build 5-d stack without recipe.
 
     Parameters
     ----------
     paths : List[str]
         List of the paths to stack.
-    input_dimension : str
-        Number of dimensions of the loaded files. Can speed up the function if
-        provided.
+    input_dimension : int
+        Number of dimensions of the loaded files. If provided, it is checked
+        against the dimensions of the first file.
     sanity_check : bool
         Check the validity of the loaded tensor. Can slow down the function.
+    n_jobs : int, default=1
+        Number of threads used to read the files concurrently.
 
     Returns
     -------
@@ -568,10 +737,14 @@ def build_stack_no_recipe(paths, input_dimension=None, sanity_check=False):
     stack.check_parameter(
         paths=(str, list),
         input_dimension=(int, type(None)),
-        sanity_check=bool)
+        sanity_check=bool,
+        n_jobs=int)
+    if n_jobs < 1:
+        raise ValueError("Parameter 'n_jobs' should be a positive integer, "
+                         "not {0}.".format(n_jobs))
 
     # build stack from tif files
-    tensor = _load_stack_no_recipe(paths, input_dimension)
+    tensor = _load_stack_no_recipe(paths, input_dimension, n_jobs)
 
     # check the validity of the loaded tensor
     if sanity_check:
@@ -587,7 +760,7 @@ def build_stack_no_recipe(paths, input_dimension=None, sanity_check=False):
     return tensor
 
 
-def _load_stack_no_recipe(paths, input_dimension=None):
+def _load_stack_no_recipe(paths, input_dimension=None, n_jobs=1):
     """Build a 5-d tensor from the same field of view (fov), without recipe.
 
     Files with a path listed are stacked together, then empty dimensions are
@@ -597,8 +770,10 @@ def _load_stack_no_recipe(paths, input_dimension=None):
     ----------
     paths : List[str]
         List of the file to stack.
-    input_dimension : str
+    input_dimension : int
         Number of dimensions of the loaded files.
+    n_jobs : int
+        Number of threads used to read the files.
 
     Returns
     -------
@@ -606,31 +781,37 @@ def _load_stack_no_recipe(paths, input_dimension=None):
         Tensor with shape (round, channel, z, y, x).
 
     """
-    # load an image and get the number of dimensions
-    if input_dimension is None:
-        testfile = stack.read_image(paths[0])
-        input_dimension = testfile.ndim
-
-    # get stacks
-    stacks = []
-    for path in paths:
-        s = stack.read_image(path)
-        stacks.append(s)
-
-    # we stack our files according to their initial dimension
-    if input_dimension == 2:
-        tensor_3d = np.stack(stacks, axis=0)
-        tensor_5d = tensor_3d[np.newaxis, np.newaxis, :, :, :]
-    elif input_dimension == 3:
-        tensor_4d = np.stack(stacks, axis=0)
-        tensor_5d = tensor_4d[np.newaxis, :, :, :, :]
-    elif input_dimension == 4:
-        tensor_5d = np.stack(stacks, axis=0)
-    elif input_dimension == 5 and len(stacks) == 1:
-        tensor_5d = stacks[0]
-    else:
+    # enlist path if necessary
+    if isinstance(paths, str):
+        paths = [paths]
+
+    # read the shape and the dtype of the first file
+    image = stack.read_image(paths[0], lazy=True)
+    shape, dtype = tuple(image.shape), image.dtype
+    del image
+
+    # check the dimension of the files
+    if input_dimension is not None and input_dimension != len(shape):
+        raise ValueError("Files have {0} dimensions, not the {1} dimensions "
+                         "set with 'input_dimension'."
+                         .format(len(shape), input_dimension))
+    input_dimension = len(shape)
+    if (input_dimension not in [2, 3, 4, 5]
+            or (input_dimension == 5 and len(paths) != 1)):
         raise ValueError("Files do not have the right number of dimensions: "
                          "{0}. The files we stack should have between 2 and "
                          "5 dimensions.".format(input_dimension))
 
+    # allocate the stacked tensor and read each file in its slot
+    tensor = np.empty((len(paths),) + shape, dtype=dtype)
+    slots = [((i,), path) for i, path in enumerate(paths)]
+    _read_stack_slots(tensor, slots, n_jobs)
+
+    # add empty dimensions up to 5
+    if input_dimension == 5:
+        tensor_5d = tensor[0]
+    else:
+        new_shape = (1,) * (4 - input_dimension) + tensor.shape
+        tensor_5d = tensor.reshape(new_shape)
+
     return tensor_5d
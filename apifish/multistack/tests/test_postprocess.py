@@ -1,4 +1,4 @@
-apifishapifishapifish# -*- coding: utf-8 -*-
+# -*- coding: utf-8 -*-
 # Author: Arthur Imbert <arthur.imbert.pro@gmail.com>
 # License: BSD 3 clause
 
@@ -6,17 +6,17 @@ apifishapifishapifish# -*- coding: utf-8 -*-
 Unitary tests for apifish.multistack.postprocess module.
 """
 
+import os
 import pytest
 
 import numpy as np
 
+import apifish.stack as stack
 import apifish.multistack as multistack
 
 from numpy.testing import assert_array_equal
 
 
-# TODO add test apifish.multistack.match_nuc_cell
-# TODO add test apifish.multistack.extract_cell
 # TODO add test apifish.multistack.extract_spots_from_frame
 # TODO add test apifish.multistack.summarize_extraction_results
 
@@ -100,3 +100,376 @@ def test_remove_transcription_site(ndim, mask_dtype, spot_dtype):
     assert foci_.dtype == foci.dtype
     assert_array_equal(ts_, ts)
     assert ts_.dtype == ts.dtype
+
+
+@pytest.mark.parametrize("spot_dtype", [
+    np.int64, np.float64])
+def test_assign_objects_to_labels(spot_dtype):
+    # simulate labelled cells and spots
+    label = np.zeros((10, 10), dtype=np.int64)
+    label[0:4, 0:4] = 1
+    label[5:10, 5:10] = 3
+    rna_coord = np.array([[7, 8],
+                          [1, 1],
+                          [4, 4],
+                          [2, 3],
+                          [6, 6]], dtype=spot_dtype)
+    foci_coord = np.array([[0, 9, 0, 2]], dtype=spot_dtype)
+
+    # single array
+    object_labels, order, offsets = multistack.assign_objects_to_labels(
+        label, rna_coord, ndim=2)
+    assert_array_equal(object_labels, [3, 1, 0, 1, 3])
+    assert_array_equal(order, [2, 1, 3, 0, 4])
+    assert_array_equal(offsets, [0, 1, 3, 3, 5])
+    assert_array_equal(rna_coord[order[offsets[3]:offsets[4]]],
+                       rna_coord[[0, 4]])
+
+    # several arrays
+    assignments = multistack.assign_objects_to_labels(
+        label, {"rna": rna_coord, "foci": foci_coord}, ndim=2)
+    assert set(assignments) == {"rna", "foci"}
+    assert_array_equal(assignments["rna"][1], order)
+    object_labels, order, offsets = assignments["foci"]
+    assert_array_equal(object_labels, [0])
+    assert_array_equal(np.diff(offsets), [1, 0, 0, 0])
+
+    # 3-d labelled image with 3-d coordinates
+    label_3d = np.stack([label, label[::-1]])
+    rna_coord_3d = np.array([[0, 1, 1],
+                             [1, 1, 1],
+                             [1, 1, 8]], dtype=spot_dtype)
+    object_labels, _, offsets = multistack.assign_objects_to_labels(
+        label_3d, rna_coord_3d, ndim=3)
+    assert_array_equal(object_labels, [1, 0, 3])
+    assert_array_equal(np.diff(offsets), [1, 1, 0, 1])
+
+    # 3-d labelled image requires 3-d coordinates
+    with pytest.raises(ValueError):
+        multistack.assign_objects_to_labels(label_3d, rna_coord, ndim=2)
+
+
+@pytest.mark.parametrize("label_dtype", [np.uint8, np.uint16, np.int64])
+def test_match_nuc_cell(label_dtype):
+    # simulate labelled cells and nuclei
+    cell_label = np.zeros((10, 12), dtype=label_dtype)
+    cell_label[0:5, 0:6] = 2
+    cell_label[5:10, 0:6] = 3
+    cell_label[0:10, 7:12] = 5
+    nuc_label = np.zeros((10, 12), dtype=label_dtype)
+    nuc_label[1:3, 1:3] = 1
+    nuc_label[2:5, 4:7] = 4
+    nuc_label[7:9, 8:10] = 6
+
+    # several nuclei per cell and cells without nucleus
+    cell_label_copy = cell_label.copy()
+    new_nuc_label, new_cell_label = multistack.match_nuc_cell(
+        nuc_label, cell_label, single_nuc=False, cell_alone=True)
+    assert_array_equal(cell_label, cell_label_copy)
+    assert new_nuc_label.dtype == label_dtype
+    assert new_cell_label.dtype == label_dtype
+    expected_nuc_label = np.zeros((10, 12), dtype=label_dtype)
+    expected_nuc_label[nuc_label == 1] = 1
+    expected_nuc_label[nuc_label == 4] = 2
+    expected_nuc_label[nuc_label == 6] = 3
+    assert_array_equal(new_nuc_label, expected_nuc_label)
+    expected_cell_label = np.zeros((10, 12), dtype=label_dtype)
+    expected_cell_label[(cell_label == 2) | (nuc_label == 4)] = 2
+    expected_cell_label[cell_label == 5] = 3
+    expected_cell_label[cell_label == 3] = 4
+    assert_array_equal(new_cell_label, expected_cell_label)
+
+    # one nucleus per cell and no cell without nucleus
+    new_nuc_label, new_cell_label = multistack.match_nuc_cell(
+        nuc_label, cell_label, single_nuc=True, cell_alone=False)
+    expected_nuc_label = np.zeros((10, 12), dtype=label_dtype)
+    expected_nuc_label[nuc_label == 1] = 1
+    expected_nuc_label[nuc_label == 6] = 2
+    assert_array_equal(new_nuc_label, expected_nuc_label)
+    expected_cell_label = np.zeros((10, 12), dtype=label_dtype)
+    expected_cell_label[cell_label == 2] = 1
+    expected_cell_label[cell_label == 5] = 2
+    assert_array_equal(new_cell_label, expected_cell_label)
+
+
+@pytest.mark.parametrize("ndim", [2, 3])
+def test_extract_cell(ndim):
+    # simulate labelled cells and nuclei
+    cell_label = np.zeros((20, 20), dtype=np.int64)
+    cell_label[2:8, 2:9] = 1
+    cell_label[10:18, 3:12] = 3
+    cell_label[12:20, 14:19] = 4
+    nuc_label = np.zeros((20, 20), dtype=np.int64)
+    nuc_label[3:6, 3:6] = 1
+    nuc_label[12:15, 5:13] = 3
+    nuc_label[14:16, 15:17] = 4
+    image = np.arange(400, dtype=np.uint16).reshape((20, 20))
+
+    # simulate spots
+    rna_coord = np.array([[4, 7, 0],
+                          [1, 1, 0],
+                          [3, 2, 1],
+                          [11, 4, 1],
+                          [15, 15, 0],
+                          [17, 11, 1],
+                          [5, 5, 0]], dtype=np.int64)
+    if ndim == 3:
+        rna_coord = np.insert(rna_coord, 0, 2, axis=1)
+
+    # extract cells
+    fov_results = multistack.extract_cell(
+        cell_label, ndim, nuc_label=nuc_label, rna_coord=rna_coord,
+        others_coord={"foci": rna_coord[:3]}, image=image,
+        check_nuc_in_cell=False)
+    assert [r["cell_id"] for r in fov_results] == [1, 3]
+    cell_results = fov_results[0]
+    assert cell_results["bbox"] == (2, 2, 8, 9)
+    assert_array_equal(cell_results["cell_mask"], np.ones((6, 7), dtype=bool))
+    assert_array_equal(cell_results["nuc_mask"],
+                       nuc_label[2:8, 2:9] == 1)
+    assert_array_equal(cell_results["image"], image[2:8, 2:9])
+    expected_rna = rna_coord[[0, 2, 6]]
+    expected_rna[:, ndim - 2] -= 2
+    expected_rna[:, ndim - 1] -= 2
+    assert_array_equal(cell_results["rna_coord"], expected_rna)
+    assert_array_equal(cell_results["foci"], expected_rna[:2])
+    assert cell_results["cell_coord"].min() == -1
+    assert cell_results["cell_coord"][:, 0].max() == 6
+    assert cell_results["cell_coord"][:, 1].max() == 7
+    cell_results = fov_results[1]
+    expected_rna = rna_coord[[3, 5]]
+    expected_rna[:, ndim - 2] -= 10
+    expected_rna[:, ndim - 1] -= 3
+    assert_array_equal(cell_results["rna_coord"], expected_rna)
+    assert cell_results["foci"].shape == (0, rna_coord.shape[1])
+    assert cell_results["nuc_coord"][:, 1].max() == 10
+
+    # check nuclei in cells and cells cropped by the frame
+    fov_results = multistack.extract_cell(
+        cell_label, ndim, nuc_label=nuc_label, rna_coord=rna_coord)
+    assert [r["cell_id"] for r in fov_results] == [1]
+    fov_results = multistack.extract_cell(
+        cell_label, ndim, nuc_label=nuc_label, remove_cropped_cell=False)
+    assert [r["cell_id"] for r in fov_results] == [1, 4]
+
+
+@pytest.mark.parametrize("check_nuc_in_cell", [True, False])
+def test_extract_cell_without_nucleus(check_nuc_in_cell):
+    # simulate labelled cells, with a nucleus for the first cell only
+    cell_label = np.zeros((20, 20), dtype=np.uint16)
+    cell_label[2:8, 2:9] = 1
+    cell_label[10:18, 3:12] = 2
+    nuc_label = np.zeros((20, 20), dtype=np.uint16)
+    nuc_label[3:6, 3:6] = 1
+    rna_coord = np.array([[4, 4],
+                          [4, 7],
+                          [11, 4],
+                          [15, 10]], dtype=np.int64)
+
+    # extract cells
+    fov_results = multistack.extract_cell(
+        cell_label, 2, nuc_label=nuc_label, rna_coord=rna_coord,
+        check_nuc_in_cell=check_nuc_in_cell)
+    assert [r["cell_id"] for r in fov_results] == [1, 2]
+    assert fov_results[1]["nuc_coord"].shape == (0, 2)
+    assert fov_results[1]["nuc_coord"].dtype == np.int64
+    assert not fov_results[1]["nuc_mask"].any()
+
+    # count spots with and without the extracted cells
+    expected_df = multistack.summarize_extraction_results(fov_results, 2)
+    df = multistack.summarize_cell_counts(
+        cell_label, 2, nuc_label=nuc_label, rna_coord=rna_coord,
+        check_nuc_in_cell=check_nuc_in_cell)
+    assert_array_equal(df.to_numpy(), expected_df.to_numpy())
+    assert list(df["nb_rna_in_nuc"]) == [1, 0]
+    assert list(df["nb_rna_out_nuc"]) == [1, 2]
+
+
+@pytest.mark.parametrize("remove_cropped_cell", [True, False])
+@pytest.mark.parametrize("check_nuc_in_cell", [True, False])
+def test_summarize_cell_counts(remove_cropped_cell, check_nuc_in_cell):
+    # simulate labelled cells and nuclei
+    cell_label = np.zeros((20, 20), dtype=np.uint16)
+    cell_label[2:8, 2:9] = 1
+    cell_label[10:18, 3:12] = 3
+    cell_label[12:20, 14:19] = 4
+    nuc_label = np.zeros((20, 20), dtype=np.uint16)
+    nuc_label[3:6, 3:6] = 1
+    nuc_label[12:15, 5:13] = 3
+    nuc_label[14:16, 15:17] = 4
+
+    # simulate spots
+    rna_coord = np.array([[4, 7],
+                          [1, 1],
+                          [3, 2],
+                          [4, 4],
+                          [11, 4],
+                          [15, 15],
+                          [17, 11],
+                          [5, 5]], dtype=np.int64)
+
+    # count spots with and without the extracted cells
+    fov_results = multistack.extract_cell(
+        cell_label, 2, nuc_label=nuc_label, rna_coord=rna_coord,
+        others_coord={"foci": rna_coord[:3]},
+        remove_cropped_cell=remove_cropped_cell,
+        check_nuc_in_cell=check_nuc_in_cell)
+    expected_df = multistack.summarize_extraction_results(fov_results, 2)
+    df = multistack.summarize_cell_counts(
+        cell_label, 2, nuc_label=nuc_label, rna_coord=rna_coord,
+        others_coord={"foci": rna_coord[:3]},
+        remove_cropped_cell=remove_cropped_cell,
+        check_nuc_in_cell=check_nuc_in_cell)
+    assert list(df.columns) == list(expected_df.columns)
+    assert_array_equal(df.to_numpy(), expected_df.to_numpy())
+    if remove_cropped_cell and check_nuc_in_cell:
+        assert list(df["cell_id"]) == [1]
+        assert list(df["nb_rna_in_nuc"]) == [2]
+        assert list(df["nb_rna_out_nuc"]) == [2]
+        assert list(df["nb_foci"]) == [2]
+
+    # without nuclei
+    df = multistack.summarize_cell_counts(
+        cell_label, 2, rna_coord=rna_coord,
+        remove_cropped_cell=remove_cropped_cell)
+    assert np.isnan(df["nb_rna_in_nuc"]).all()
+
+    # without cells
+    df_empty = multistack.summarize_cell_counts(
+        np.zeros_like(cell_label), 2, nuc_label=nuc_label,
+        rna_coord=rna_coord, others_coord={"foci": rna_coord[:3]})
+    assert len(df_empty) == 0
+    assert list(df_empty.columns) == list(expected_df.columns)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_from_label_to_coord(n_jobs):
+    # simulate labelled cells
+    label = np.zeros((20, 20), dtype=np.uint16)
+    label[0:5, 0:6] = 1
+    label[10:18, 3:12] = 3
+    label[12:20, 14:19] = 4
+
+    # extract boundaries of every cell at once
+    coord, offsets = multistack.from_label_to_coord(label, n_jobs=n_jobs)
+    assert coord.dtype == np.int64
+    assert offsets.shape == (6,)
+    assert offsets[1] == offsets[0] == 0
+    assert offsets[3] == offsets[2]
+    assert offsets[-1] == len(coord)
+    for i in [1, 3, 4]:
+        expected_coord = multistack.from_binary_to_coord(label == i)
+        expected_coord = multistack.complete_coord_boundaries(expected_coord)
+        assert_array_equal(coord[offsets[i]:offsets[i + 1]], expected_coord)
+    assert coord.min() == -1
+
+    # without completion
+    coord, offsets = multistack.from_label_to_coord(
+        label, complete=False, n_jobs=n_jobs)
+    expected_coord = multistack.from_binary_to_coord(label == 3)
+    assert_array_equal(coord[offsets[3]:offsets[4]], expected_coord)
+
+    # empty labelled image
+    coord, offsets = multistack.from_label_to_coord(
+        np.zeros((5, 5), dtype=np.uint16), n_jobs=n_jobs)
+    assert coord.shape == (0, 2)
+    assert_array_equal(offsets, [0, 0])
+
+
+@pytest.mark.parametrize("z_margin", [None, 0, 1])
+def test_extract_cell_3d(z_margin):
+    # simulate labelled cells, 3-d images and spots
+    cell_label = np.zeros((20, 20), dtype=np.int64)
+    cell_label[2:8, 2:9] = 1
+    cell_label[10:18, 3:12] = 3
+    image = np.arange(2000, dtype=np.uint16).reshape((5, 20, 20))
+    mask = image % 3 == 0
+    rna_coord = np.array([[1, 4, 7],
+                          [2, 3, 2],
+                          [4, 11, 4]], dtype=np.int64)
+    foci_coord = np.array([[3, 5, 5]], dtype=np.int64)
+
+    # crop 3-d images and masks
+    fov_results = multistack.extract_cell(
+        cell_label, 3, rna_coord=rna_coord, others_coord={"foci": foci_coord},
+        image=image, others_image={"mask": mask, "projection": image[0]},
+        z_margin=z_margin)
+    assert len(fov_results) == 2
+    cell_results = fov_results[0]
+    if z_margin is None:
+        z_slice = slice(None)
+        assert "z_range" not in cell_results
+    elif z_margin == 0:
+        z_slice = slice(1, 4)
+        assert cell_results["z_range"] == (1, 4)
+        assert fov_results[1]["z_range"] == (4, 5)
+    else:
+        z_slice = slice(0, 5)
+        assert cell_results["z_range"] == (0, 5)
+        assert fov_results[1]["z_range"] == (3, 5)
+    assert_array_equal(cell_results["image"], image[z_slice, 2:8, 2:9])
+    assert_array_equal(cell_results["mask"], mask[z_slice, 2:8, 2:9])
+    assert_array_equal(cell_results["projection"], image[0, 2:8, 2:9])
+    assert np.shares_memory(cell_results["image"], image)
+    assert np.shares_memory(cell_results["mask"], mask)
+
+    # 'z_margin' requires 3-d coordinates and images
+    with pytest.raises(ValueError):
+        multistack.extract_cell(
+            cell_label, 2, rna_coord=rna_coord[:, 1:], image=image,
+            z_margin=1)
+    with pytest.raises(ValueError):
+        multistack.extract_cell(
+            cell_label, 3, rna_coord=rna_coord, image=image[0], z_margin=1)
+
+
+@pytest.mark.parametrize("n_jobs, max_in_flight", [
+    (1, None), (2, None), (2, 1)])
+def test_extract_cells_to_store(tmpdir, n_jobs, max_in_flight):
+    # simulate labelled cells, nuclei and spots for several fields of view
+    cell_label = np.zeros((20, 20), dtype=np.int64)
+    cell_label[2:8, 2:9] = 1
+    cell_label[10:18, 3:12] = 3
+    nuc_label = np.zeros((20, 20), dtype=np.int64)
+    nuc_label[3:6, 3:6] = 1
+    nuc_label[12:15, 5:10] = 3
+    image = np.arange(400, dtype=np.uint16).reshape((20, 20))
+    rna_coord = np.array([[4, 7],
+                          [1, 1],
+                          [3, 2],
+                          [11, 4]], dtype=np.int64)
+
+    def get_fovs():
+        for i in range(3):
+            yield (cell_label, nuc_label, rna_coord[i:], image,
+                   {"foci": rna_coord[:i]})
+
+    # extract and store cells
+    path = os.path.join(tmpdir, "plate")
+    cell_store = multistack.extract_cells_to_store(
+        get_fovs(), path, 2, n_jobs=n_jobs, max_in_flight=max_in_flight)
+    assert len(cell_store) == 6
+    for i, fov in enumerate(get_fovs()):
+        fov_results = multistack.extract_cell(
+            fov[0], 2, nuc_label=fov[1], rna_coord=fov[2], image=fov[3],
+            others_coord=fov[4])
+        for j, cell_results in enumerate(fov_results):
+            stored_results = cell_store[2 * i + j]
+            assert stored_results["fov_id"] == i
+            assert stored_results["cell_id"] == cell_results["cell_id"]
+            for key in ["cell_coord", "cell_mask", "nuc_mask", "rna_coord",
+                        "foci", "image"]:
+                assert_array_equal(stored_results[key], cell_results[key])
+
+    # a failing field of view leaves no truncated store behind
+    fovs = list(get_fovs())
+    fovs[1] = (cell_label, nuc_label)
+    with pytest.raises(ValueError):
+        multistack.extract_cells_to_store(
+            fovs, path, 2, n_jobs=n_jobs, max_in_flight=max_in_flight)
+    assert len(stack.read_fov_extracted(path + ".cells")) == 6
+    path_failed = os.path.join(tmpdir, "plate_failed")
+    with pytest.raises(ValueError):
+        multistack.extract_cells_to_store(
+            fovs, path_failed, 2, n_jobs=n_jobs, max_in_flight=max_in_flight)
+    assert os.listdir(tmpdir) == ["plate.cells"]
@@ -1,4 +1,4 @@
-apifishapifishapifish# -*- coding: utf-8 -*-
+# -*- coding: utf-8 -*-
 # Author: Arthur Imbert <arthur.imbert.pro@gmail.com>
 # License: BSD 3 clause
 
@@ -99,6 +99,73 @@ def test_build_stacks_from_recipe():
                                    input_dimension=3)
 
 
+@pytest.mark.parametrize("input_dimension", [2, 3, 4, 5])
+def test_build_stack_dimension(input_dimension):
+    # build a temporary directory and save tensors inside
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        expected_tensor = np.random.randint(0, 256, size=(2, 3, 4, 5, 6))
+        expected_tensor = expected_tensor.astype(np.uint16)
+        rounds = ["r1", "r2"]
+        channels = ["nuc", "cyt", "rna"]
+        planes = ["z1", "z2", "z3", "z4"]
+
+        # define recipe and save files according to their dimension
+        keys = ["r", "c", "z"][:5 - input_dimension]
+        morphemes = [rounds, channels, planes][:5 - input_dimension]
+        recipe = {"fov": "fov1",
+                  "ext": "tif",
+                  "pattern": "_".join(["fov"] + keys) + ".ext"}
+        for key, elements in zip(keys, morphemes):
+            recipe[key] = elements
+        for index in np.ndindex(*expected_tensor.shape[:5 - input_dimension]):
+            elements = [morpheme[i] for morpheme, i in zip(morphemes, index)]
+            filename = "_".join(["fov1"] + elements) + ".tif"
+            path = os.path.join(tmp_dir, filename)
+            stack.save_image(expected_tensor[index], path)
+
+        # build tensor
+        tensor = multistack.build_stack(recipe, input_folder=tmp_dir,
+                                        sanity_check=True)
+        assert_array_equal(tensor, expected_tensor)
+        assert tensor.dtype == np.uint16
+        tensor = multistack.build_stack(recipe, input_folder=tmp_dir,
+                                        input_dimension=input_dimension)
+        assert_array_equal(tensor, expected_tensor)
+        with pytest.raises(ValueError, match="set with 'input_dimension'"):
+            multistack.build_stack(recipe, input_folder=tmp_dir,
+                                   input_dimension=input_dimension + 1)
+
+        # build tensor with concurrent reading
+        tensor = multistack.build_stack(recipe, input_folder=tmp_dir,
+                                        n_jobs=3)
+        assert_array_equal(tensor, expected_tensor)
+        with pytest.raises(ValueError):
+            multistack.build_stack(recipe, input_folder=tmp_dir, n_jobs=0)
+
+        # build a selection of the tensor
+        tensor = multistack.build_stack(recipe, input_folder=tmp_dir,
+                                        rounds=[1], channels=[2, 0],
+                                        z_slice=slice(1, 3))
+        assert_array_equal(tensor, expected_tensor[[1]][:, [2, 0], 1:3])
+        tensor = multistack.build_stack(recipe, input_folder=tmp_dir,
+                                        channels=-1, n_jobs=2)
+        assert_array_equal(tensor, expected_tensor[:, [2]])
+        tensor = multistack.build_stack(recipe, input_folder=tmp_dir,
+                                        channels=[0, 1, 2])
+        assert_array_equal(tensor, expected_tensor)
+        with pytest.raises(ValueError):
+            multistack.build_stack(recipe, input_folder=tmp_dir, channels=3)
+        with pytest.raises(TypeError):
+            multistack.build_stack(recipe, input_folder=tmp_dir,
+                                   z_slice=[0, 1])
+
+        # wrong input dimension
+        wrong_dimension = 3 if input_dimension == 2 else 2
+        with pytest.raises(ValueError):
+            multistack.build_stack(recipe, input_folder=tmp_dir,
+                                   input_dimension=wrong_dimension)
+
+
 def test_build_stacks_from_datamap():
     # build a temporary directory and save tensors inside
     with tempfile.TemporaryDirectory() as tmp_dir:
@@ -175,6 +242,65 @@ def test_build_stacks_from_datamap():
             next(generator)
 
 
+@pytest.mark.parametrize("prefetch", [0, 1, 2])
+def test_build_stacks_prefetch(prefetch):
+    # build a temporary directory and save tensors inside
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        expected_tensors = []
+        for fov in ["1", "2", "3"]:
+            test = np.random.randint(0, 256, size=(2, 4, 6)).astype(np.uint8)
+            for i, c in enumerate(["nuc", "rna"]):
+                path = os.path.join(tmp_dir, "{0}_{1}.tif".format(c, fov))
+                stack.save_image(test[i], path)
+            expected_tensors.append(test[np.newaxis, :, np.newaxis])
+        recipe_1 = {"fov": ["1", "2", "3"],
+                    "c": ["nuc", "rna"],
+                    "ext": "tif",
+                    "pattern": "c_fov.ext"}
+        recipe_2 = {"fov": ["2", "4", "1"],
+                    "c": ["nuc", "rna"],
+                    "ext": "tif",
+                    "pattern": "c_fov.ext"}
+
+        # build stacks in order
+        data_map = [(recipe_1, tmp_dir)]
+        generator = multistack.build_stacks(
+            data_map, return_origin=True, prefetch=prefetch)
+        for i, (tensor, _, recipe, i_fov) in enumerate(generator):
+            assert_array_equal(tensor, expected_tensors[i])
+            assert recipe == recipe_1
+            assert i_fov == i
+
+        # build a selection of the stacks
+        generator = multistack.build_stacks(
+            data_map, channels=1, prefetch=prefetch)
+        for i, tensor in enumerate(generator):
+            assert_array_equal(tensor, expected_tensors[i][:, [1]])
+
+        # stop early
+        generator = multistack.build_stacks(data_map, prefetch=prefetch)
+        tensor = next(generator)
+        assert_array_equal(tensor, expected_tensors[0])
+        generator.close()
+
+        # errors are raised with the recipe and the fov index
+        path = os.path.join(tmp_dir, "nuc_4.tif")
+        stack.save_image(np.zeros((4, 6), dtype=np.uint8), path)
+        path = os.path.join(tmp_dir, "rna_4.tif")
+        stack.save_image(np.zeros((5, 6), dtype=np.uint8), path)
+        data_map = [(recipe_1, tmp_dir), (recipe_2, tmp_dir)]
+        generator = multistack.build_stacks(data_map, prefetch=prefetch)
+        for _ in range(4):
+            next(generator)
+        with pytest.raises(ValueError, match="Stack 1 from recipe"):
+            next(generator)
+
+        # wrong parameter
+        generator = multistack.build_stacks(data_map, prefetch=-1)
+        with pytest.raises(ValueError):
+            next(generator)
+
+
 def test_build_stack_from_path():
     # build a temporary directory and save tensors inside
     with tempfile.TemporaryDirectory() as tmp_dir:
@@ -195,8 +321,13 @@ def test_build_stack_from_path():
         expected_tensor = np.zeros((1, 3, 8, 8, 8), dtype=np.uint8)
         assert_array_equal(tensor, expected_tensor)
         assert tensor.dtype == np.uint8
+        tensor = multistack.build_stack_no_recipe(paths, n_jobs=2)
+        assert_array_equal(tensor, expected_tensor)
+        assert tensor.dtype == np.uint8
 
         # wrong paths
         paths = [path_nuc, path_cyt, "/foo/bar/test_rna.tif"]
         with pytest.raises(FileNotFoundError):
             multistack.build_stack_no_recipe(paths, input_dimension=3)
+        with pytest.raises(FileNotFoundError):
+            multistack.build_stack_no_recipe(paths, n_jobs=2)
@@ -1,4 +1,4 @@
-apifishapifishapifish# -*- coding: utf-8 -*-
+# -*- coding: utf-8 -*-
 # Author: Arthur Imbert <arthur.imbert.pro@gmail.com>
 # License: BSD 3 clause
 
@@ -130,6 +130,60 @@ def test_path_from_recipe():
         assert os.path.isfile(path_dapi)
 
 
+def test_compiled_recipe():
+    # build a temporary directory with several files
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filenames = ["experience_1_dapi_fov_1.tif",
+                     "experience_1_smfish_fov_1.tif",
+                     "experience_1_dapi_fov_2.tif",
+                     "experience_1_dapi_fov_3.tif",
+                     "experience_1_smfish_fov_3.tif",
+                     "experience_2_dapi_fov_1.tif",
+                     "experience_1_dapi_fov_1.png"]
+        for filename in filenames:
+            with open(os.path.join(tmp_dir, filename), 'w') as f:
+                f.write("file")
+        recipe = {"fov": ["fov_1", "fov_2"],
+                  "c": ["dapi", "smfish"],
+                  "opt": "experience_1",
+                  "ext": "tif",
+                  "pattern": "opt_c_fov.ext"}
+
+        # compile recipe
+        compiled_recipe = multistack.compile_recipe(recipe)
+        assert isinstance(compiled_recipe, multistack.CompiledRecipe)
+        assert multistack.compile_recipe(compiled_recipe) is compiled_recipe
+        assert len(compiled_recipe) == 2
+        assert compiled_recipe.nb_r == 1
+        assert compiled_recipe.nb_c == 2
+        assert compiled_recipe.nb_z == 1
+
+        # resolve paths consistently with 'get_path_from_recipe'
+        expected_paths = [
+            multistack.get_path_from_recipe(recipe, tmp_dir, fov=fov, c=c)
+            for fov in range(2) for c in range(2)]
+        assert compiled_recipe.get_paths(tmp_dir) == expected_paths
+        assert compiled_recipe.get_paths(tmp_dir, fov=1) == expected_paths[2:]
+        assert compiled_recipe.get_path(tmp_dir, fov=1, c=0) == (
+            expected_paths[2])
+
+        # check files against a directory index
+        index = multistack.index_directory(tmp_dir)
+        assert index == set(filenames)
+        missing, extra = compiled_recipe.check_directory(tmp_dir, index=index)
+        assert missing == ["experience_1_smfish_fov_2.tif"]
+        assert extra == ["experience_1_dapi_fov_3.tif",
+                         "experience_1_smfish_fov_3.tif"]
+        with pytest.raises(FileNotFoundError, match="1 file"):
+            multistack.check_recipe(recipe, data_directory=tmp_dir)
+
+        # wrong recipe or directory
+        with pytest.raises(KeyError):
+            multistack.compile_recipe({"fov": "fov_1"})
+        with pytest.raises(NotADirectoryError):
+            multistack.index_directory("/foo/bar")
+
+
 def test_element_per_dimension():
     # build a recipe to test
     good_recipe = {"fov": "fov_1",
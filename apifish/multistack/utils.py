@@ -9,6 +9,9 @@ Utility functions for apifish.multistack subpackage.
 import os
 import re
 import copy
+import itertools
+
+from functools import lru_cache
 
 import apifish.stack as stack
 
@@ -72,26 +75,44 @@ def check_recipe(recipe, data_directory=None):
 
     # check that requested files exist
     if data_directory is not None:
-        if not os.path.isdir(data_directory):
-            raise NotADirectoryError("Directory does not exist: {0}"
-                                     .format(data_directory))
-        recipe = fit_recipe(recipe)
-        nb_r, nb_c, nb_z = get_nb_element_per_dimension(recipe)
-        nb_fov = count_nb_fov(recipe)
-        for fov in range(nb_fov):
-            for r in range(nb_r):
-                for c in range(nb_c):
-                    for z in range(nb_z):
-                        path = get_path_from_recipe(
-                            recipe,
-                            data_directory,
-                            fov=fov,
-                            r=r,
-                            c=c,
-                            z=z)
-                        if not os.path.isfile(path):
-                            raise FileNotFoundError("File does not exist: {0}"
-                                                    .format(path))
+        index = index_directory(data_directory)
+        _check_recipe_files(recipe, data_directory, index)
+
+    return True
+
+
+def _check_recipe_files(recipe, data_directory, index):
+    """Check that the files described in a recipe exist.
+
+    Parameters
+    ----------
+    recipe : dict or CompiledRecipe
+        Map the images according to their field of view, their round,
+        their channel and their spatial dimensions.
+    data_directory : str
+        Path of the directory with the files describes in the recipe.
+    index : frozenset
+        Filenames in the directory (see :func:`index_directory`).
+
+    Returns
+    -------
+    _ : bool
+        Assert if the files exist.
+
+    """
+    # compile the recipe if necessary
+    if not isinstance(recipe, CompiledRecipe):
+        recipe = CompiledRecipe(recipe)
+
+    # report every missing file at once
+    missing, _ = recipe.check_directory(data_directory, index=index)
+    if len(missing) > 0:
+        paths = [os.path.join(data_directory, filename)
+                 for filename in missing[:5]]
+        if len(missing) > 5:
+            paths.append("...")
+        raise FileNotFoundError("{0} file(s) do not exist: {1}"
+                                .format(len(missing), ", ".join(paths)))
 
     return True
 
@@ -219,8 +240,7 @@ def get_path_from_recipe(recipe, input_folder, fov=0, r=0, c=0, z=0):
 
     # get filename pattern and decompose it
     recipe_pattern = recipe["pattern"]
-    path_elements = re.findall("fov|r|c|z|ext|opt", recipe_pattern)
-    path_separators = re.split("fov|r|c|z|ext|opt", recipe_pattern)
+    path_elements, path_separators = _parse_recipe_pattern(recipe_pattern)
 
     # get filename recombining elements of the recipe
     filename = path_separators[0]  # usually an empty string
@@ -247,6 +267,292 @@ def get_path_from_recipe(recipe, input_folder, fov=0, r=0, c=0, z=0):
     return path
 
 
+@lru_cache(maxsize=128)
+def _parse_recipe_pattern(recipe_pattern):
+    """Decompose a filename pattern in elements and separators.
+
+    Parameters
+    ----------
+    recipe_pattern : str
+        Filename pattern of a recipe.
+
+    Returns
+    -------
+    path_elements : Tuple[str]
+        Elements of the pattern, among `fov`, `r`, `c`, `z`, `ext` and `opt`.
+    path_separators : Tuple[str]
+        Strings before, between and after the elements.
+
+    """
+    path_elements = re.findall("fov|r|c|z|ext|opt", recipe_pattern)
+    path_separators = re.split("fov|r|c|z|ext|opt", recipe_pattern)
+
+    return tuple(path_elements), tuple(path_separators)
+
+
+def compile_recipe(recipe):
+    """Compile a recipe to resolve its files in bulk.
+
+    The recipe is checked, fitted and its filename pattern parsed once.
+
+    Parameters
+    ----------
+    recipe : dict
+        Map the images according to their field of view, their round,
+        their channel and their spatial dimensions. Can only contain the keys
+        `pattern`, `fov`, `r`, `c`, `z`, `ext` or `opt`.
+
+    Returns
+    -------
+    compiled_recipe : CompiledRecipe
+        Compiled recipe.
+
+    """
+    # check parameters
+    stack.check_parameter(recipe=(dict, CompiledRecipe))
+
+    # compile recipe
+    if isinstance(recipe, CompiledRecipe):
+        return recipe
+    compiled_recipe = CompiledRecipe(recipe)
+
+    return compiled_recipe
+
+
+class CompiledRecipe(object):
+    """Recipe with a parsed filename pattern.
+
+    Filenames are built without parsing the pattern again, and all the files
+    of a recipe can be checked against a directory index at once.
+
+    Parameters
+    ----------
+    recipe : dict
+        Map the images according to their field of view, their round,
+        their channel and their spatial dimensions. Can only contain the keys
+        `pattern`, `fov`, `r`, `c`, `z`, `ext` or `opt`.
+
+    Attributes
+    ----------
+    recipe : dict
+        Fitted recipe.
+    nb_fov : int
+        Number of fields of view in the recipe.
+    nb_r : int
+        Number of rounds to be stacked.
+    nb_c : int
+        Number of channels to be stacked.
+    nb_z : int
+        Number of z layers to be stacked.
+
+    """
+
+    def __init__(self, recipe):
+        check_recipe(recipe)
+        self.recipe = fit_recipe(recipe)
+        self.nb_fov = count_nb_fov(self.recipe)
+        self.nb_r, self.nb_c, self.nb_z = get_nb_element_per_dimension(
+            self.recipe)
+
+        # parse the filename pattern
+        elements, separators = _parse_recipe_pattern(self.recipe["pattern"])
+        self._elements = elements
+        self._separators = separators
+
+        # regular expression matching any filename with the same structure
+        regex = re.escape(separators[0])
+        for element, separator in zip(elements, separators[1:]):
+            if element in ["ext", "opt"]:
+                regex += re.escape(self.recipe[element])
+            else:
+                regex += ".+?"
+            regex += re.escape(separator)
+        self._regex = re.compile(regex)
+
+    def __len__(self):
+        return self.nb_fov
+
+    def __repr__(self):
+        return ("CompiledRecipe(pattern={0}, nb_fov={1}, nb_r={2}, "
+                "nb_c={3}, nb_z={4})".format(self.recipe["pattern"],
+                                             self.nb_fov, self.nb_r,
+                                             self.nb_c, self.nb_z))
+
+    def get_filename(self, fov=0, r=0, c=0, z=0):
+        """Build the filename of a file from the indices of its elements.
+
+        Parameters
+        ----------
+        fov : int
+            Index of the `fov` element in the recipe.
+        r : int
+            Index of the `r` element in the recipe.
+        c : int
+            Index of the `c` element in the recipe.
+        z : int
+            Index of the `z` element in the recipe.
+
+        Returns
+        -------
+        filename : str
+            Filename of the file.
+
+        """
+        recipe = self.recipe
+        map_element = {
+            "fov": recipe["fov"][fov],
+            "r": recipe["r"][r],
+            "c": recipe["c"][c],
+            "z": recipe["z"][z],
+            "ext": recipe["ext"],
+            "opt": recipe["opt"]}
+        parts = [self._separators[0]]
+        for element, separator in zip(self._elements, self._separators[1:]):
+            parts.append(map_element[element])
+            parts.append(separator)
+        filename = "".join(parts)
+
+        return filename
+
+    def get_path(self, input_folder, fov=0, r=0, c=0, z=0):
+        """Build the path of a file from the indices of its elements.
+
+        Parameters
+        ----------
+        input_folder : str
+            Path of the folder containing the images.
+        fov : int
+            Index of the `fov` element in the recipe.
+        r : int
+            Index of the `r` element in the recipe.
+        c : int
+            Index of the `c` element in the recipe.
+        z : int
+            Index of the `z` element in the recipe.
+
+        Returns
+        -------
+        path : str
+            Path of the file.
+
+        """
+        filename = self.get_filename(fov=fov, r=r, c=c, z=z)
+        path = os.path.join(input_folder, filename)
+
+        return path
+
+    def get_filenames(self, fov=None):
+        """Build the filenames of all the files of the recipe, ordered by
+        fov, round, channel and z element.
+
+        Parameters
+        ----------
+        fov : int, optional
+            Index of the `fov` to use. If None, files of every fov are
+            returned.
+
+        Returns
+        -------
+        filenames : List[str]
+            Filenames of the files.
+
+        """
+        fovs = range(self.nb_fov) if fov is None else [fov]
+        filenames = [
+            self.get_filename(fov=fov_, r=r, c=c, z=z)
+            for fov_, r, c, z in itertools.product(
+                fovs, range(self.nb_r), range(self.nb_c), range(self.nb_z))]
+
+        return filenames
+
+    def get_paths(self, input_folder, fov=None):
+        """Build the paths of all the files of the recipe, ordered by fov,
+        round, channel and z element.
+
+        Parameters
+        ----------
+        input_folder : str
+            Path of the folder containing the images.
+        fov : int, optional
+            Index of the `fov` to use. If None, files of every fov are
+            returned.
+
+        Returns
+        -------
+        paths : List[str]
+            Paths of the files.
+
+        """
+        paths = [os.path.join(input_folder, filename)
+                 for filename in self.get_filenames(fov=fov)]
+
+        return paths
+
+    def check_directory(self, input_folder, index=None):
+        """Compare the files of the recipe with the content of a directory.
+
+        Parameters
+        ----------
+        input_folder : str
+            Path of the folder containing the images.
+        index : frozenset, optional
+            Filenames in the directory (see :func:`index_directory`). If
+            None, the directory is listed.
+
+        Returns
+        -------
+        missing : List[str]
+            Filenames of the recipe not found in the directory.
+        extra : List[str]
+            Filenames of the directory with the same structure as the recipe
+            pattern (same separators, `opt` and `ext` elements), but not
+            described by the recipe.
+
+        """
+        # list the directory once
+        if index is None:
+            index = index_directory(input_folder)
+
+        # compare files
+        filenames = self.get_filenames()
+        missing = [filename for filename in filenames
+                   if filename not in index]
+        expected = set(filenames)
+        extra = sorted(filename for filename in index
+                       if filename not in expected
+                       and self._regex.fullmatch(filename))
+
+        return missing, extra
+
+
+def index_directory(input_folder):
+    """List the files of a directory once, to check or resolve the files of
+    several recipes.
+
+    Parameters
+    ----------
+    input_folder : str
+        Path of the directory.
+
+    Returns
+    -------
+    index : frozenset
+        Filenames of the files in the directory.
+
+    """
+    # check parameters
+    stack.check_parameter(input_folder=str)
+    if not os.path.isdir(input_folder):
+        raise NotADirectoryError("Directory does not exist: {0}"
+                                 .format(input_folder))
+
+    # list files
+    with os.scandir(input_folder) as entries:
+        index = frozenset(entry.name for entry in entries if entry.is_file())
+
+    return index
+
+
 def get_nb_element_per_dimension(recipe):
     """Count the number of element to stack for each dimension (`r`, `c`
     and `z`).
@@ -327,6 +633,7 @@ def check_datamap(data_map):
 
     """
     stack.check_parameter(data_map=list)
+    indices = {}
     for pair in data_map:
         if not isinstance(pair, (tuple, list)):
             raise TypeError("A data map is a list with tuples or lists. "
@@ -341,6 +648,11 @@ def check_datamap(data_map):
             raise TypeError("A data map map a recipe (dict) to an input "
                             "directory (string). Not ({0}, {1})"
                             .format(type(recipe), type(input_folder)))
-        check_recipe(recipe, data_directory=input_folder)
+
+        # list each directory only once
+        check_recipe(recipe)
+        if input_folder not in indices:
+            indices[input_folder] = index_directory(input_folder)
+        _check_recipe_files(recipe, input_folder, indices[input_folder])
 
     return True
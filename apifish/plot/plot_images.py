@@ -13,13 +13,8 @@ import apifish.multistack as multistack
 
 from .utils import save_plot, get_minmax_values, create_colormap
 
-import matplotlib.pyplot as plt
 import numpy as np
 
-from skimage.segmentation import find_boundaries
-from matplotlib.colors import ListedColormap
-from matplotlib.patches import RegularPolygon
-
 
 # ### General plot ###
 
@@ -58,6 +53,9 @@ def plot_yx(image, r=0, c=0, z=0, rescale=False, contrast=False,
         Show the figure or not.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+
     # check parameters
     stack.check_array(
         image,
@@ -141,6 +139,9 @@ def plot_images(images, rescale=False, contrast=False, titles=None,
 
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+
     # enlist image if necessary
     if isinstance(images, np.ndarray):
         images = [images]
@@ -277,6 +278,10 @@ def plot_segmentation(image, mask, rescale=False, contrast=False, title=None,
         Show the figure or not.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import ListedColormap
+
     # check parameters
     stack.check_array(
         image,
@@ -382,6 +387,11 @@ def plot_segmentation_boundary(image, cell_label=None, nuc_label=None,
         Show the figure or not.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import ListedColormap
+    from skimage.segmentation import find_boundaries
+
     # check parameters
     stack.check_array(
         image,
@@ -494,6 +504,9 @@ def plot_segmentation_diff(image, mask_pred, mask_gt, rescale=False,
         Show the figure or not.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+
     # check parameters
     stack.check_parameter(
         rescale=bool,
@@ -622,6 +635,9 @@ def plot_detection(image, spots, shape="circle", radius=3, color="red",
         Show the figure or not.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+
     # check parameters
     stack.check_array(
         image,
@@ -761,6 +777,10 @@ def _define_patch(x, y, shape, radius, color, linewidth, fill):
         Geometric form to add to a plot.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import RegularPolygon
+
     # circle
     if shape == "circle":
         x = plt.Circle(
@@ -822,6 +842,9 @@ def plot_reference_spot(reference_spot, rescale=False, contrast=False,
         Show the figure or not.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+
     # check parameters
     stack.check_array(
         reference_spot,
@@ -931,6 +954,10 @@ def plot_cell(ndim, cell_coord=None, nuc_coord=None, rna_coord=None,
         Show the figure or not.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import ListedColormap
+
     if cell_coord is None and image is None:
         return
 
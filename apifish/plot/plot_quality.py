@@ -1,4 +1,4 @@
-apifishapifishapifish# -*- coding: utf-8 -*-
+# -*- coding: utf-8 -*-
 # Author: Arthur Imbert <arthur.imbert.pro@gmail.com>
 # License: BSD 3 clause
 
@@ -10,7 +10,6 @@ import apifish.stack as stack
 import apifish.detection as detection
 import apifish.multistack as multistack
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 from .utils import save_plot
@@ -51,6 +50,9 @@ def plot_sharpness(focus_measures, labels=None, title=None, framesize=(5, 5),
         Show the figure or not.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+
     # enlist values if necessary
     if isinstance(focus_measures, np.ndarray):
         focus_measures = [focus_measures]
@@ -157,6 +159,9 @@ def plot_elbow(images, voxel_size=None, spot_radius=None, log_kernel_size=None,
         Show the figure or not.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+
     # check parameters
     stack.check_parameter(
         title=(str, list, type(None)),
@@ -246,6 +251,9 @@ def plot_elbow_colocalized(spots_1, spots_2, voxel_size, threshold_max=None,
         Show the figure or not.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+
     # check parameters
     stack.check_parameter(
         threshold_max=(int, float, type(None)),
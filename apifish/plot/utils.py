@@ -6,7 +6,6 @@
 Utility functions for apifish.plot subpackage.
 """
 
-import matplotlib.pyplot as plt
 import numpy as np
 
 
@@ -22,6 +21,9 @@ def save_plot(path_output, ext):
         will be saved several times.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+
     # add extension at the end of the filename
     extension = "." + ext
     if extension not in path_output:
@@ -87,6 +89,9 @@ def create_colormap():
         Colormap for matplotlib.
 
     """
+    # import matplotlib lazily
+    import matplotlib.pyplot as plt
+
     values = np.linspace(0, 1, 256)
     np.random.shuffle(values)
     colormap = plt.cm.colors.ListedColormap(plt.cm.YlGnBu(values))
@@ -16,11 +16,9 @@ import numpy as np
 from scipy import ndimage as ndi
 
 import skimage
-from sklearn.utils.fixes import parse_version
-if parse_version(skimage.__version__) < parse_version("0.17.0"):
-    from skimage.morphology import watershed
-else:
-    from skimage.segmentation import watershed
+
+# sklearn is imported in the functions using watershed, to keep
+# 'import apifish.segmentation' fast
 
 
 # ### Unet models ###
@@ -232,6 +230,13 @@ def from_distance_to_instances(label_x_nuc, label_2_cell, label_distance,
         value.
 
     """
+    # import scikit-learn and scikit-image lazily
+    from sklearn.utils.fixes import parse_version
+    if parse_version(skimage.__version__) < parse_version("0.17.0"):
+        from skimage.morphology import watershed
+    else:
+        from skimage.segmentation import watershed
+
     # check parameters
     stack.check_parameter(
         nuc_3_classes=bool,
@@ -447,6 +452,13 @@ def apply_watershed(watershed_relief, nuc_label, cell_mask):
         Segmentation of cells with shape (y, x).
 
     """
+    # import scikit-learn and scikit-image lazily
+    from sklearn.utils.fixes import parse_version
+    if parse_version(skimage.__version__) < parse_version("0.17.0"):
+        from skimage.morphology import watershed
+    else:
+        from skimage.segmentation import watershed
+
     # check parameters
     stack.check_array(
         watershed_relief,
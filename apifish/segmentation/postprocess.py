@@ -177,17 +177,46 @@ def _fill_hole(image):
     if image.dtype == bool:
         image_cleaned = ndi.binary_fill_holes(image)
 
-    # fill holes in a labelled image
+    # fill holes in a labelled image, instance by instance within their
+    # bounding box (padded by one pixel)
     else:
         image_cleaned = np.zeros_like(image)
-        for i in range(1, image.max() + 1):
-            image_binary = image == i
+        for i, instance_slice in enumerate(ndi.find_objects(image)):
+            if instance_slice is None:
+                continue
+            instance_slice = _pad_slice(instance_slice, image.shape)
+            image_binary = image[instance_slice] == i + 1
             image_binary = ndi.binary_fill_holes(image_binary)
-            image_cleaned[image_binary] = i
+            image_cleaned[instance_slice][image_binary] = i + 1
 
     return image_cleaned
 
 
+def _pad_slice(instance_slice, shape, pad=1):
+    """Enlarge a bounding box, without exceeding the image frame.
+
+    Parameters
+    ----------
+    instance_slice : Tuple[slice]
+        Bounding box of the instance.
+    shape : Tuple[int]
+        Shape of the image.
+    pad : int
+        Number of pixels to add on each side.
+
+    Returns
+    -------
+    instance_slice_padded : Tuple[slice]
+        Enlarged bounding box.
+
+    """
+    instance_slice_padded = tuple(
+        slice(max(s.start - pad, 0), min(s.stop + pad, size))
+        for s, size in zip(instance_slice, shape))
+
+    return instance_slice_padded
+
+
 def _smooth_instance(image, radius):
     """Apply a median filter to smooth instance boundaries.
 
@@ -287,38 +316,27 @@ def remove_disjoint(image):
         cast_to_bool = bool
         image = image.astype(np.uint8)
 
-    # initialize cleaned labels
-    image_cleaned = np.zeros_like(image)
-
-    # loop over instances
-    max_label = image.max()
-    for i in range(1, max_label + 1):
-
-        # get instance mask
-        mask = image == i
-
-        # check if an instance is labelled with this value
-        if mask.sum() == 0:
-            continue
-
-        # get an index for each disconnected part of the instance
-        labelled_mask = label(mask)
-        indices = sorted(list(set(labelled_mask.ravel())))
-        if 0 in indices:
-            indices = indices[1:]
-
-        # keep the largest part of the instance
-        max_area = 0
-        mask_instance = None
-        for j in indices:
-            mask_part_j = labelled_mask == j
-            area_j = mask_part_j.sum()
-            if area_j > max_area:
-                max_area = area_j
-                mask_instance = mask_part_j
-
-        # add instance in the final label
-        image_cleaned[mask_instance] = i
+    # get an index for each disconnected part of every instance (connected
+    # pixels with the same instance value), in a single pass
+    parts = label(image, background=0)
+    nb_parts = int(parts.max())
+
+    # get the area and the instance of each part
+    area = np.bincount(parts.ravel(), minlength=nb_parts + 1)
+    part_instance = np.zeros(nb_parts + 1, dtype=np.int64)
+    part_instance[parts.ravel()] = image.ravel()
+
+    # keep the largest part of each instance (the first one in case of tie)
+    indices = np.arange(1, nb_parts + 1)
+    order = np.lexsort((indices, -area[1:], part_instance[1:]))
+    sorted_instance = part_instance[1:][order]
+    is_first = np.ones(nb_parts, dtype=bool)
+    is_first[1:] = sorted_instance[1:] != sorted_instance[:-1]
+    keep = np.zeros(nb_parts + 1, dtype=bool)
+    keep[indices[order][is_first]] = True
+
+    # add instances in the final label
+    image_cleaned = np.where(keep[parts], image, 0).astype(image.dtype)
 
     if cast_to_bool:
         image_cleaned = image_cleaned.astype(bool)
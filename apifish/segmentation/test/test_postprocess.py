@@ -6,11 +6,18 @@
 Unitary tests for apifish.segmentation.postprocess module.
 """
 
+import pytest
+
+import numpy as np
+
+import apifish.segmentation as segmentation
+
+from numpy.testing import assert_array_equal
+
 
 # TODO add test for apifish.segmentation.label_instances
 # TODO add test for apifish.segmentation.merge_labels
 # TODO add test for apifish.segmentation.clean_segmentation
-# TODO add test for apifish.segmentation.remove_disjoint
 # TODO add test for apifish.segmentation.center_mask_coord
 # TODO add test for apifish.segmentation.from_boundaries_to_surface
 # TODO add test for apifish.segmentation.from_surface_to_boundaries
@@ -18,3 +25,78 @@ Unitary tests for apifish.segmentation.postprocess module.
 # TODO add test for apifish.segmentation.complete_coord_boundaries
 # TODO add test for apifish.segmentation.from_coord_to_frame
 # TODO add test for apifish.segmentation.from_coord_to_surface
+
+
+def test_clean_segmentation_fill_holes():
+    # simulate labelled instances with holes
+    image = np.zeros((12, 14), dtype=np.int64)
+    image[1:6, 1:6] = 1
+    image[3, 3] = 0
+    image[2:4, 2:3] = 0
+    image[7:11, 2:12] = 2
+    image[8:10, 4:6] = 0
+    image[8:10, 8:10] = 4
+
+    # instance with overlapping bounding box (around instance 4)
+    image[0:6, 7:13] = 3
+    image[2:4, 9:11] = 0
+
+    # instances touching the image border, with a hole and a notch open to
+    # the border
+    image[6:12, 11:14] = 5
+    image[8, 13] = 0
+    image[9:11, 12] = 0
+
+    image_cleaned = segmentation.clean_segmentation(image, fill_holes=True)
+    assert image_cleaned.dtype == np.int64
+    expected_image = image.copy()
+    expected_image[3, 3] = 1
+    expected_image[2:4, 2:3] = 1
+    expected_image[8:10, 4:6] = 2
+    expected_image[2:4, 9:11] = 3
+    expected_image[9:11, 12] = 5
+    assert_array_equal(image_cleaned, expected_image)
+
+    # binary mask
+    image_cleaned = segmentation.clean_segmentation(image > 0,
+                                                    fill_holes=True)
+    assert image_cleaned.dtype == bool
+    assert_array_equal(image_cleaned, expected_image > 0)
+
+
+@pytest.mark.parametrize("dtype", [
+    np.uint8, np.uint16, np.int64, bool])
+def test_remove_disjoint(dtype):
+    # simulate labelled instances with disconnected parts
+    image = np.zeros((10, 12), dtype=np.int64)
+    image[0:3, 0:3] = 1
+    image[5:6, 0:2] = 1
+    image[0:2, 6:8] = 2
+    image[8:10, 6:8] = 2
+    image[4:9, 9:12] = 4
+    image[9, 0] = 4
+    if dtype == bool:
+        image = image == 2
+    image = image.astype(dtype)
+
+    # keep the largest part (the first one in case of tie)
+    image_cleaned = segmentation.remove_disjoint(image)
+    assert image_cleaned.dtype == dtype
+    expected_image = image.copy()
+    expected_image[5:6, 0:2] = 0
+    expected_image[8:10, 6:8] = 0
+    expected_image[9, 0] = 0
+    assert_array_equal(image_cleaned, expected_image)
+
+    # 3-d image: parts are connected through the z axis
+    image_3d = np.zeros((2, 10, 12), dtype=dtype)
+    image_3d[0] = image
+    image_3d[1, 2:9, 6:8] = image[0, 6]
+    image_3d[1, 9, 0] = 1
+    image_cleaned = segmentation.remove_disjoint(image_3d)
+    expected_image_3d = image_3d.copy()
+    expected_image_3d[1, 9, 0] = 0
+    if dtype != bool:
+        expected_image_3d[0, 5:6, 0:2] = 0
+        expected_image_3d[0, 9, 0] = 0
+    assert_array_equal(image_cleaned, expected_image_3d)
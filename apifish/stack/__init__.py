@@ -19,18 +19,35 @@ from .utils import compute_hash
 from .utils import check_input_data
 from .utils import moving_average
 from .utils import centered_moving_average
+from .utils import get_float_dtype
+from .utils import pad_reflect
+from .utils import box_sum
 
 from .io import read_image
+from .io import read_image_planes
+from .io import LazyTiffImage
 from .io import read_dv
 from .io import read_array
 from .io import read_uncompressed
 from .io import read_cell_extracted
+from .io import read_fov_extracted
+from .io import read_spot_table
+from .io import read_array_from_spot_table
+from .io import read_dataframe_from_spot_table
 from .io import read_array_from_csv
 from .io import read_dataframe_from_csv
 from .io import save_image
 from .io import save_array
 from .io import save_cell_extracted
+from .io import save_fov_extracted
+from .io import CellStore
+from .io import CellStoreWriter
+from .io import save_spot_table
+from .io import append_spot_table
 from .io import save_data_to_csv
+from .io import save_chunked_array
+from .io import read_chunked_array
+from .io import ChunkedArray
 
 from .preprocess import rescale
 from .preprocess import cast_img_uint8
@@ -56,6 +73,9 @@ from .projection import maximum_projection
 from .projection import mean_projection
 from .projection import median_projection
 from .projection import focus_projection
+from .projection import maximum_projection_from_planes
+from .projection import mean_projection_from_planes
+from .projection import median_projection_from_planes
 from .projection import in_focus_selection
 from .projection import get_in_focus_indices
 
@@ -79,20 +99,37 @@ _utils = [
     "compute_hash",
     "check_input_data",
     "moving_average",
-    "centered_moving_average"]
+    "centered_moving_average",
+    "get_float_dtype",
+    "pad_reflect",
+    "box_sum"]
 
 _io = [
     "read_image",
+    "read_image_planes",
+    "LazyTiffImage",
     "read_dv",
     "read_array",
     "read_uncompressed",
     "read_cell_extracted",
+    "read_fov_extracted",
+    "read_spot_table",
+    "read_array_from_spot_table",
+    "read_dataframe_from_spot_table",
     "read_array_from_csv",
     "read_dataframe_from_csv",
     "save_image",
     "save_array",
     "save_cell_extracted",
-    "save_data_to_csv"]
+    "save_fov_extracted",
+    "CellStore",
+    "CellStoreWriter",
+    "save_spot_table",
+    "append_spot_table",
+    "save_data_to_csv",
+    "save_chunked_array",
+    "read_chunked_array",
+    "ChunkedArray"]
 
 _preprocess = [
     "rescale",
@@ -122,7 +159,10 @@ _projection = [
     "median_projection",
     "in_focus_selection",
     "get_in_focus_indices",
-    "focus_projection"]
+    "focus_projection",
+    "maximum_projection_from_planes",
+    "mean_projection_from_planes",
+    "median_projection_from_planes"]
 
 _augmentation = [
     "augment_2d",
@@ -4,30 +4,24 @@
 
 """Filtering functions."""
 
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 from .utils import check_array
 from .utils import check_parameter
-
-from .preprocess import cast_img_float32
-from .preprocess import cast_img_float64
-from .preprocess import cast_img_uint8
-from .preprocess import cast_img_uint16
-
-from skimage.morphology.selem import square
-from skimage.morphology.selem import diamond
-from skimage.morphology.selem import rectangle
-from skimage.morphology.selem import disk
-from skimage.morphology import binary_dilation
-from skimage.morphology import dilation
-from skimage.morphology import binary_erosion
-from skimage.morphology import erosion
-from skimage.filters import rank
-from skimage.filters import gaussian
+from .utils import check_range_value
+from .utils import pad_reflect
+from .utils import box_sum
+from .utils import get_float_dtype
 
 from scipy.ndimage import gaussian_laplace
 from scipy.ndimage import convolve
 
+# skimage.morphology, skimage.filters and scipy.signal are imported in the
+# functions using them, to keep 'import apifish.stack' fast
+
 
 # ### Filters ###
 
@@ -53,6 +47,12 @@ def _define_kernel(shape, size, dtype):
         Kernel to use with a skimage filter.
 
     """
+    # import scikit-image lazily
+    from skimage.morphology.selem import square
+    from skimage.morphology.selem import diamond
+    from skimage.morphology.selem import rectangle
+    from skimage.morphology.selem import disk
+
     # build the kernel
     if shape == "diamond":
         kernel = diamond(size, dtype=dtype)
@@ -73,6 +73,11 @@ def _define_kernel(shape, size, dtype):
 def mean_filter(image, kernel_shape, kernel_size):
     """Apply a mean filter to a 2-d through convolution filter.
 
+    Square and rectangular kernels are computed with summed-area tables, in
+    constant time per pixel whatever the kernel size. Large disk and diamond
+    kernels are applied with a FFT convolution. Boundaries are handled like
+    :func:`scipy.ndimage.convolve` (``reflect`` mode).
+
     Parameters
     ----------
     image : np.ndarray, np.uint or np.float
@@ -105,42 +110,96 @@ def mean_filter(image, kernel_shape, kernel_size):
         size=kernel_size,
         dtype=np.float64)
     n = kernel.sum()
-    kernel /= n
 
-    # apply convolution filter
-    image_filtered = convolve(image, kernel)
+    # sum pixel values within the kernel, using the fastest method available
+    if kernel_shape in ["square", "rectangle"]:
+        image_sum = box_sum(image, kernel.shape)
+    elif kernel.size > 225:
+        image_sum = _fft_sum(image, kernel)
+    else:
+        kernel /= n
+        image_filtered = convolve(image, kernel)
+        return image_filtered
+
+    # average and cast filtered image (truncation for integers, like a
+    # convolution filter)
+    image_filtered = np.divide(image_sum, n, out=image_sum)
+    image_filtered = image_filtered.astype(image.dtype)
 
     return image_filtered
 
 
-def median_filter(image, kernel_shape, kernel_size):
-    """Apply a median filter to a 2-d image.
+def _fft_sum(image, kernel):
+    """Sum pixel values within a kernel, with a FFT convolution.
 
     Parameters
     ----------
-    image : np.ndarray, np.uint
+    image : np.ndarray
         Image with shape (y, x).
+    kernel : np.ndarray, np.float64
+        Binary kernel with shape (height, width).
+
+    Returns
+    -------
+    image_sum : np.ndarray, np.float64
+        Sum of the pixel values within the kernel centered on each pixel,
+        with shape (y, x).
+
+    """
+    # import scipy lazily
+    from scipy.signal import fftconvolve
+
+    # pad image
+    image_padded = pad_reflect(image.astype(np.float64), kernel.shape)
+
+    # compute convolution in the Fourier domain
+    image_sum = fftconvolve(image_padded, kernel, mode="valid")
+
+    # sums of integers are integers (remove FFT rounding errors)
+    if image.dtype.kind in ["u", "i"]:
+        image_sum = np.rint(image_sum, out=image_sum)
+
+    return image_sum
+
+
+def median_filter(image, kernel_shape, kernel_size, n_jobs=1):
+    """Apply a median filter to a 2-d or 3-d image.
+
+    For a 3-d image, each z-slice is filtered independently with the same 2-d
+    kernel.
+
+    Parameters
+    ----------
+    image : np.ndarray, np.uint
+        Image with shape (z, y, x) or (y, x).
     kernel_shape : str
         Shape of the kernel used to compute the filter (`diamond`, `disk`,
         `rectangle` or `square`).
     kernel_size : int, Tuple(int) or List(int)
         The size of the kernel. For the rectangle we expect two integers
         (`height`, `width`).
+    n_jobs : int, default=1
+        Number of threads used to filter the image by chunks along the y and
+        x dimensions. Results do not depend on it.
 
     Returns
     -------
     image_filtered : np.ndarray, np.uint
-        Filtered 2-d image with shape (y, x).
+        Filtered image with shape (z, y, x) or (y, x).
 
     """
+    # import scikit-image lazily
+    from skimage.filters import rank
+
     # check parameters
     check_array(
         image,
-        ndim=2,
+        ndim=[2, 3],
         dtype=[np.uint8, np.uint16])
     check_parameter(
         kernel_shape=str,
-        kernel_size=(int, tuple, list))
+        kernel_size=(int, tuple, list),
+        n_jobs=int)
 
     # get kernel
     kernel = _define_kernel(
@@ -149,39 +208,53 @@ def median_filter(image, kernel_shape, kernel_size):
         dtype=image.dtype)
 
     # apply filter
-    image_filtered = rank.median(image, kernel)
+    image_filtered = _filter_by_chunk(
+        partial(_rank_filter_chunk, kernel=kernel, method=rank.median),
+        image,
+        halo=(kernel.shape[0] // 2, kernel.shape[1] // 2),
+        n_jobs=n_jobs)
 
     return image_filtered
 
 
-def maximum_filter(image, kernel_shape, kernel_size):
-    """Apply a maximum filter to a 2-d image.
+def maximum_filter(image, kernel_shape, kernel_size, n_jobs=1):
+    """Apply a maximum filter to a 2-d or 3-d image.
+
+    For a 3-d image, each z-slice is filtered independently with the same 2-d
+    kernel.
+    The filter is computed with the van Herk/Gil-Werman algorithm, in constant
+    time per pixel for a square or a rectangular kernel. Disk and diamond
+    kernels are decomposed in rows.
 
     Parameters
     ----------
     image : np.ndarray, np.uint
-        Image with shape (y, x).
+        Image with shape (z, y, x) or (y, x).
     kernel_shape : str
         Shape of the kernel used to compute the filter (`diamond`, `disk`,
         `rectangle` or `square`).
     kernel_size : int, Tuple(int) or List(int)
         The size of the kernel. For the rectangle we expect two integers
         (`height`, `width`).
+    n_jobs : int, default=1
+        Number of threads used to filter the image by chunks along the y and
+        x dimensions. Results do not depend on it.
 
     Returns
     -------
     image_filtered : np.ndarray, np.uint
-        Filtered 2-d image with shape (y, x).
+        Filtered image with shape (z, y, x) or (y, x).
 
     """
     # check parameters
     check_array(
         image,
-        ndim=2,
+        ndim=[2, 3],
         dtype=[np.uint8, np.uint16])
     check_parameter(
         kernel_shape=str,
-        kernel_size=(int, tuple, list))
+        kernel_size=(int, tuple, list),
+        n_jobs=int)
 
     # get kernel
     kernel = _define_kernel(
@@ -190,39 +263,54 @@ def maximum_filter(image, kernel_shape, kernel_size):
         dtype=image.dtype)
 
     # apply filter
-    image_filtered = rank.maximum(image, kernel)
+    image_filtered = _filter_by_chunk(
+        partial(_extremum_filter_chunk, kernel=kernel,
+                function=np.maximum),
+        image,
+        halo=(kernel.shape[0] // 2, kernel.shape[1] // 2),
+        n_jobs=n_jobs)
 
     return image_filtered
 
 
-def minimum_filter(image, kernel_shape, kernel_size):
-    """Apply a minimum filter to a 2-d image.
+def minimum_filter(image, kernel_shape, kernel_size, n_jobs=1):
+    """Apply a minimum filter to a 2-d or 3-d image.
+
+    For a 3-d image, each z-slice is filtered independently with the same 2-d
+    kernel.
+    The filter is computed with the van Herk/Gil-Werman algorithm, in constant
+    time per pixel for a square or a rectangular kernel. Disk and diamond
+    kernels are decomposed in rows.
 
     Parameters
     ----------
     image : np.ndarray, np.uint
-        Image with shape (y, x).
+        Image with shape (z, y, x) or (y, x).
     kernel_shape : str
         Shape of the kernel used to compute the filter (`diamond`, `disk`,
         `rectangle` or `square`).
     kernel_size : int, Tuple(int) or List(int)
         The size of the kernel. For the rectangle we expect two integers
         (`height`, `width`).
+    n_jobs : int, default=1
+        Number of threads used to filter the image by chunks along the y and
+        x dimensions. Results do not depend on it.
 
     Returns
     -------
     image_filtered : np.ndarray, np.uint
-        Filtered 2-d image with shape (y, x).
+        Filtered image with shape (z, y, x) or (y, x).
 
     """
     # check parameters
     check_array(
         image,
-        ndim=2,
+        ndim=[2, 3],
         dtype=[np.uint8, np.uint16])
     check_parameter(
         kernel_shape=str,
-        kernel_size=(int, tuple, list))
+        kernel_size=(int, tuple, list),
+        n_jobs=int)
 
     # get kernel
     kernel = _define_kernel(
@@ -231,12 +319,248 @@ def minimum_filter(image, kernel_shape, kernel_size):
         dtype=image.dtype)
 
     # apply filter
-    image_filtered = rank.minimum(image, kernel)
+    image_filtered = _filter_by_chunk(
+        partial(_extremum_filter_chunk, kernel=kernel,
+                function=np.minimum),
+        image,
+        halo=(kernel.shape[0] // 2, kernel.shape[1] // 2),
+        n_jobs=n_jobs)
+
+    return image_filtered
+
+
+def _rank_filter_chunk(image, kernel, method, core=None, out=None):
+    """Apply a rank filter to an image (or a chunk of an image).
+
+    Parameters
+    ----------
+    image : np.ndarray, np.uint
+        Image with shape (z, y, x) or (y, x).
+    kernel : np.ndarray
+        2-d kernel used to compute the filter.
+    method : callable
+        Rank filter from :mod:`skimage.filters.rank`.
+    core : Tuple(slice), optional
+        Part of the filtered image to keep (the image without its halo).
+    out : np.ndarray, optional
+        Preallocated array to write the filtered image in.
+
+    Returns
+    -------
+    image_filtered : np.ndarray, np.uint
+        Filtered image.
+
+    """
+    # apply filter (slice by slice for a 3-d image)
+    if image.ndim == 3:
+        image_filtered = np.empty_like(image)
+        for z in range(image.shape[0]):
+            image_filtered[z] = method(image[z], kernel)
+    else:
+        image_filtered = method(image, kernel)
+
+    # keep the core of the chunk
+    image_filtered = _write_chunk(image_filtered, core, out)
 
     return image_filtered
 
 
-def log_filter(image, sigma):
+def _extremum_filter_chunk(image, kernel, function, core=None, out=None):
+    """Apply a maximum or minimum filter to an image (or a chunk of an image).
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image with shape (..., y, x).
+    kernel : np.ndarray
+        2-d kernel used to compute the filter.
+    function : {np.maximum, np.minimum}
+        Function used to combine pixel values.
+    core : Tuple(slice), optional
+        Part of the filtered image to keep (the image without its halo).
+    out : np.ndarray, optional
+        Preallocated array to write the filtered image in.
+
+    Returns
+    -------
+    image_filtered : np.ndarray
+        Filtered image.
+
+    """
+    # apply filter
+    image_filtered = _extremum_filter(image, kernel, function)
+
+    # keep the core of the chunk
+    image_filtered = _write_chunk(image_filtered, core, out)
+
+    return image_filtered
+
+
+def _extremum_filter(image, kernel, function):
+    """Apply a maximum or minimum filter over the last two dimensions of an
+    image.
+
+    The kernel is decomposed in rows. Each row is a 1-d window along the x
+    axis, computed with the van Herk/Gil-Werman algorithm. For a rectangular
+    kernel, the rows are combined with another 1-d window along the y axis.
+    Otherwise, each row is shifted along the y axis and combined with the
+    others. Pixels outside the image are ignored, like with
+    :mod:`skimage.filters.rank`.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image with shape (..., y, x).
+    kernel : np.ndarray
+        2-d kernel, with a contiguous segment of nonzero values in each
+        nonempty row. The kernel is centered on shape // 2.
+    function : {np.maximum, np.minimum}
+        Function used to combine pixel values.
+
+    Returns
+    -------
+    image_filtered : np.ndarray
+        Filtered image with the same shape and dtype.
+
+    """
+    # handle boolean images
+    if image.dtype == bool:
+        image_filtered = _extremum_filter(
+            image.view(np.uint8), kernel, function)
+        image_filtered = image_filtered.view(bool)
+        return image_filtered
+
+    # get the window along x for each row of the kernel
+    center_y, center_x = kernel.shape[0] // 2, kernel.shape[1] // 2
+    rows = {}
+    for i, row in enumerate(kernel):
+        (nonzero,) = np.nonzero(row)
+        if nonzero.size == 0:
+            continue
+        if nonzero.size != nonzero[-1] - nonzero[0] + 1:
+            raise ValueError("Each row of the kernel should have contiguous "
+                             "nonzero values.")
+        rows[i - center_y] = (nonzero[0] - center_x, nonzero[-1] - center_x)
+
+    # rectangular kernel: separable filter along x then y
+    windows_x = set(rows.values())
+    offsets_y = sorted(rows)
+    if (len(windows_x) == 1
+            and len(offsets_y) == offsets_y[-1] - offsets_y[0] + 1):
+        (window_x,) = windows_x
+        image_filtered = _extremum_filter_1d(
+            image, window_x, function, axis=-1)
+        image_filtered = _extremum_filter_1d(
+            image_filtered, (offsets_y[0], offsets_y[-1]), function, axis=-2)
+        return image_filtered
+
+    # other kernels: combine the shifted rows
+    identity = _get_identity_value(image.dtype, function)
+    image_rows = {}
+    for window_x in windows_x:
+        image_rows[window_x] = _extremum_filter_1d(
+            image, window_x, function, axis=-1)
+    image_filtered = np.full_like(image, identity)
+    size_y = image.shape[-2]
+    for offset_y, window_x in rows.items():
+        y_min, y_max = max(0, -offset_y), min(size_y, size_y - offset_y)
+        if y_min >= y_max:
+            continue
+        function(
+            image_filtered[..., y_min:y_max, :],
+            image_rows[window_x][..., y_min + offset_y:y_max + offset_y, :],
+            out=image_filtered[..., y_min:y_max, :])
+
+    return image_filtered
+
+
+def _extremum_filter_1d(image, window, function, axis=-1):
+    """Apply a 1-d maximum or minimum filter with the van Herk/Gil-Werman
+    algorithm.
+
+    The image is split in blocks with the size of the window. Cumulative
+    extrema are computed forward and backward within each block, so every
+    window is covered by the end of a backward and the start of a forward
+    cumulative extremum. The cost per pixel does not depend on the window
+    size.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to filter.
+    window : Tuple(int)
+        First and last offsets (included) of the window around each pixel.
+    function : {np.maximum, np.minimum}
+        Function used to combine pixel values.
+    axis : int, default=-1
+        Axis along which the filter is applied.
+
+    Returns
+    -------
+    image_filtered : np.ndarray
+        Filtered image with the same shape and dtype.
+
+    """
+    offset_min, offset_max = window
+    size = offset_max - offset_min + 1
+    image = np.moveaxis(image, axis, -1)
+    n = image.shape[-1]
+
+    # pad the image with neutral values to align windows with blocks
+    identity = _get_identity_value(image.dtype, function)
+    pad_left = max(0, -offset_min)
+    nb_blocks = -(-(n + pad_left + max(0, offset_max)) // size)
+    image_padded = np.full(
+        image.shape[:-1] + (nb_blocks * size,), identity, dtype=image.dtype)
+    image_padded[..., pad_left:pad_left + n] = image
+    start = pad_left + offset_min
+
+    # compute forward and backward cumulative extrema within blocks
+    blocks = image_padded.reshape(image.shape[:-1] + (nb_blocks, size))
+    forward = function.accumulate(blocks, axis=-1)
+    forward = forward.reshape(image_padded.shape)
+    backward = function.accumulate(blocks[..., ::-1], axis=-1)[..., ::-1]
+    backward = backward.reshape(image_padded.shape)
+
+    # combine them
+    image_filtered = function(
+        backward[..., start:start + n],
+        forward[..., start + size - 1:start + size - 1 + n])
+    image_filtered = np.moveaxis(image_filtered, -1, axis)
+
+    return image_filtered
+
+
+def _get_identity_value(dtype, function):
+    """Get the neutral value of a maximum or minimum for a dtype.
+
+    Parameters
+    ----------
+    dtype : type
+        Dtype of the image.
+    function : {np.maximum, np.minimum}
+        Function used to combine pixel values.
+
+    Returns
+    -------
+    identity : int or float
+        Neutral value.
+
+    """
+    if np.issubdtype(dtype, np.floating):
+        lowest, highest = -np.inf, np.inf
+    else:
+        info = np.iinfo(dtype)
+        lowest, highest = info.min, info.max
+    if function is np.maximum:
+        identity = lowest
+    else:
+        identity = highest
+
+    return identity
+
+
+def log_filter(image, sigma, precision=None, out=None, n_jobs=1):
     """Apply a Laplacian of Gaussian filter to a 2-d or 3-d image.
 
     The function returns the inverse of the filtered image such that the pixels
@@ -252,6 +576,17 @@ def log_filter(image, sigma):
         Standard deviation used for the gaussian kernel (one for each
         dimension). If it's a scalar, the same standard deviation is applied
         to every dimensions.
+    precision : {None, `float32`, `float64`}, default=None
+        Float precision used to compute the filter. If None, np.uint8 images
+        are filtered in np.float32, np.uint16 images in np.float64 and float
+        images with their own dtype. Use `float32` to halve the memory used
+        by the intermediate arrays.
+    out : np.ndarray, optional
+        Preallocated array to write the filtered image in, with the same
+        shape and dtype than `image`.
+    n_jobs : int, default=1
+        Number of threads used to filter the image by chunks along the y and
+        x dimensions. Results do not depend on it.
 
     Returns
     -------
@@ -264,15 +599,12 @@ def log_filter(image, sigma):
         image,
         ndim=[2, 3],
         dtype=[np.uint8, np.uint16, np.float32, np.float64])
-    check_parameter(sigma=(float, int, tuple, list))
-
-    # we cast the data in np.float to allow negative values
-    if image.dtype == np.uint8:
-        image_float = cast_img_float32(image)
-    elif image.dtype == np.uint16:
-        image_float = cast_img_float64(image)
-    else:
-        image_float = image
+    check_parameter(
+        sigma=(float, int, tuple, list),
+        precision=(str, type(None)),
+        out=(np.ndarray, type(None)),
+        n_jobs=int)
+    _check_out(image, out)
 
     # check sigma
     if isinstance(sigma, (tuple, list)):
@@ -280,25 +612,67 @@ def log_filter(image, sigma):
             raise ValueError("'sigma' must be a scalar or a sequence with {0} "
                              "elements.".format(image.ndim))
 
-    # we apply LoG filter
-    image_filtered = gaussian_laplace(image_float, sigma=sigma)
+    # apply filter
+    float_dtype = get_float_dtype(image.dtype, precision)
+    image_filtered = _filter_by_chunk(
+        partial(_log_filter_chunk, sigma=sigma, float_dtype=float_dtype),
+        image,
+        halo=_get_gaussian_halo(sigma, image.ndim),
+        n_jobs=n_jobs,
+        out=out)
+
+    return image_filtered
+
+
+def _log_filter_chunk(image, sigma, float_dtype, core=None, out=None):
+    """Apply a Laplacian of Gaussian filter to an image (or a chunk of an
+    image).
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image with shape (z, y, x) or (y, x).
+    sigma : int, float, Tuple(float, int) or List(float, int)
+        Standard deviation used for the gaussian kernel.
+    float_dtype : type
+        Float dtype used to compute the filter.
+    core : Tuple(slice), optional
+        Part of the filtered image to keep (the image without its halo).
+    out : np.ndarray, optional
+        Preallocated array to write the filtered image in.
+
+    Returns
+    -------
+    image_filtered : np.ndarray
+        Filtered image.
+
+    """
+    # we cast the data in np.float to allow negative values
+    image_float = _cast_img_float(image, float_dtype)
+
+    # we apply LoG filter (directly in the output array if possible)
+    if core is None and out is not None and out.dtype == float_dtype:
+        image_filtered = gaussian_laplace(image_float, sigma=sigma, output=out)
+    else:
+        image_filtered = gaussian_laplace(image_float, sigma=sigma)
+
+    # keep the core of the chunk
+    if core is not None:
+        image_filtered = image_filtered[core]
 
     # as the LoG filter makes the peaks in the original image appear as a
     # reversed mexican hat, we inverse the result and clip negative values to 0
-    image_filtered = np.clip(-image_filtered, a_min=0, a_max=None)
+    np.negative(image_filtered, out=image_filtered)
+    np.clip(image_filtered, a_min=0, a_max=None, out=image_filtered)
 
     # cast filtered image
-    if image.dtype == np.uint8:
-        image_filtered = cast_img_uint8(image_filtered)
-    elif image.dtype == np.uint16:
-        image_filtered = cast_img_uint16(image_filtered)
-    else:
-        pass
+    image_filtered = _cast_img_from_float(image_filtered, image.dtype, out)
 
     return image_filtered
 
 
-def gaussian_filter(image, sigma, allow_negative=False):
+def gaussian_filter(image, sigma, allow_negative=False, precision=None,
+                    out=None, n_jobs=1):
     """Apply a Gaussian filter to a 2-d or 3-d image.
 
     Parameters
@@ -312,6 +686,17 @@ def gaussian_filter(image, sigma, allow_negative=False):
     allow_negative : bool
         Allow negative values after the filtering or clip them to 0. Not
         compatible with unsigned integer images.
+    precision : {None, `float32`, `float64`}, default=None
+        Float precision used to compute the filter. If None, np.uint8 images
+        are filtered in np.float32, np.uint16 images in np.float64 and float
+        images with their own dtype. Use `float32` to halve the memory used
+        by the intermediate arrays.
+    out : np.ndarray, optional
+        Preallocated array to write the filtered image in, with the same
+        shape and dtype than `image`.
+    n_jobs : int, default=1
+        Number of threads used to filter the image by chunks along the y and
+        x dimensions. Results do not depend on it.
 
     Returns
     -------
@@ -326,7 +711,11 @@ def gaussian_filter(image, sigma, allow_negative=False):
         dtype=[np.uint8, np.uint16, np.float32, np.float64])
     check_parameter(
         sigma=(float, int, tuple, list),
-        allow_negative=bool)
+        allow_negative=bool,
+        precision=(str, type(None)),
+        out=(np.ndarray, type(None)),
+        n_jobs=int)
+    _check_out(image, out)
 
     # check parameters consistency
     if image.dtype in [np.uint8, np.uint16] and allow_negative:
@@ -338,28 +727,325 @@ def gaussian_filter(image, sigma, allow_negative=False):
             raise ValueError("'sigma' must be a scalar or a sequence with {0} "
                              "elements.".format(image.ndim))
 
+    # apply filter
+    float_dtype = get_float_dtype(image.dtype, precision)
+    image_filtered = _filter_by_chunk(
+        partial(_gaussian_filter_chunk, sigma=sigma, float_dtype=float_dtype,
+                allow_negative=allow_negative),
+        image,
+        halo=_get_gaussian_halo(sigma, image.ndim),
+        n_jobs=n_jobs,
+        out=out)
+
+    return image_filtered
+
+
+def _gaussian_filter_chunk(image, sigma, float_dtype, allow_negative,
+                           core=None, out=None):
+    """Apply a Gaussian filter to an image (or a chunk of an image).
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image with shape (z, y, x) or (y, x).
+    sigma : int, float, Tuple(float, int) or List(float, int)
+        Standard deviation used for the gaussian kernel.
+    float_dtype : type
+        Float dtype used to compute the filter.
+    allow_negative : bool
+        Allow negative values after the filtering or clip them to 0.
+    core : Tuple(slice), optional
+        Part of the filtered image to keep (the image without its halo).
+    out : np.ndarray, optional
+        Preallocated array to write the filtered image in.
+
+    Returns
+    -------
+    image_filtered : np.ndarray
+        Filtered image.
+
+    """
+    # import scikit-image lazily
+    from skimage.filters import gaussian
+
     # we cast the data in np.float to allow negative values
-    if image.dtype == np.uint8:
-        image_float = cast_img_float32(image)
-    elif image.dtype == np.uint16:
-        image_float = cast_img_float64(image)
+    image_float = _cast_img_float(image, float_dtype)
+
+    # we apply gaussian filter (directly in the output array if possible)
+    if core is None and out is not None and out.dtype == float_dtype:
+        image_filtered = gaussian(image_float, sigma=sigma, output=out)
     else:
-        image_float = image
+        image_filtered = gaussian(image_float, sigma=sigma)
 
-    # we apply gaussian filter
-    image_filtered = gaussian(image_float, sigma=sigma)
+    # keep the core of the chunk
+    if core is not None:
+        image_filtered = image_filtered[core]
 
     # we clip negative values to 0
     if not allow_negative:
-        image_filtered = np.clip(image_filtered, a_min=0, a_max=1)
+        np.clip(image_filtered, a_min=0, a_max=1, out=image_filtered)
 
     # cast filtered image
-    if image.dtype == np.uint8:
-        image_filtered = cast_img_uint8(image_filtered)
-    elif image.dtype == np.uint16:
-        image_filtered = cast_img_uint16(image_filtered)
+    image_filtered = _cast_img_from_float(image_filtered, image.dtype, out)
+
+    return image_filtered
+
+
+def _check_out(image, out):
+    """Check a preallocated output array is consistent with the input image.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to filter.
+    out : np.ndarray or None
+        Preallocated output array.
+
+    """
+    if out is None:
+        return
+    if out.shape != image.shape or out.dtype != image.dtype:
+        raise ValueError("Parameter 'out' should have the same shape and "
+                         "dtype than 'image' ({0}, {1}), not ({2}, {3})."
+                         .format(image.shape, image.dtype,
+                                 out.shape, out.dtype))
+    if np.may_share_memory(out, image):
+        raise ValueError("Parameter 'out' can't share memory with 'image'.")
+
+
+def _cast_img_float(image, float_dtype):
+    """Cast an image in float, without copy if the dtype is already right.
+
+    Unsigned integer values are scaled between 0 and 1, in the same way as
+    :func:`apifish.stack.cast_img_float32` and
+    :func:`apifish.stack.cast_img_float64`.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image to cast.
+    float_dtype : type
+        Float dtype to cast the image in.
+
+    Returns
+    -------
+    image_float : np.ndarray
+        Image cast.
+
+    """
+    if image.dtype in [np.uint8, np.uint16]:
+        image_float = np.multiply(
+            image, 1. / np.iinfo(image.dtype).max,
+            dtype=float_dtype)
+    else:
+        image_float = image.astype(float_dtype, copy=False)
+
+    return image_float
+
+
+def _cast_img_from_float(image_float, dtype, out=None):
+    """Cast back a filtered float image, modifying it in place.
+
+    Float values are scaled between 0 and the maximum value of an unsigned
+    integer dtype, in the same way as :func:`apifish.stack.cast_img_uint8`
+    and :func:`apifish.stack.cast_img_uint16`.
+
+    Parameters
+    ----------
+    image_float : np.ndarray
+        Float image to cast. Its values can be modified in place.
+    dtype : type
+        Dtype to cast the image in.
+    out : np.ndarray, optional
+        Preallocated array to write the image in, with the dtype `dtype`.
+
+    Returns
+    -------
+    image : np.ndarray
+        Image cast.
+
+    """
+    # scale values for unsigned integer images
+    if dtype in [np.uint8, np.uint16]:
+        check_range_value(image_float, min_=0, max_=1)
+        imax = np.iinfo(dtype).max
+        np.multiply(image_float, imax, out=image_float)
+        np.rint(image_float, out=image_float)
+        np.clip(image_float, 0, imax, out=image_float)
+
+    # cast image
+    if out is None:
+        image = image_float.astype(dtype, copy=False)
     else:
-        pass
+        if image_float is not out:
+            np.copyto(out, image_float, casting="unsafe")
+        image = out
+
+    return image
+
+
+def _get_gaussian_halo(sigma, ndim):
+    """Get the radius of a gaussian kernel along the y and x dimensions.
+
+    Parameters
+    ----------
+    sigma : int, float, Tuple(float, int) or List(float, int)
+        Standard deviation used for the gaussian kernel (one for each
+        dimension).
+    ndim : int
+        Number of dimensions of the image.
+
+    Returns
+    -------
+    halo : Tuple(int)
+        Radius of the kernel along the y and x dimensions.
+
+    """
+    # same radius as scipy.ndimage (with the default truncate=4.0)
+    if not isinstance(sigma, (tuple, list)):
+        sigma = [sigma] * ndim
+    halo = tuple(int(4.0 * float(s) + 0.5) for s in sigma[-2:])
+
+    return halo
+
+
+def _filter_by_chunk(filter_chunk, image, halo, n_jobs=1, out=None):
+    """Apply a filter by chunks along the y and x dimensions, in parallel.
+
+    Each chunk is extended with a halo large enough to compute its core
+    exactly as if the full image was filtered at once. Chunks are filtered in
+    a thread pool and written in a shared output array.
+
+    Parameters
+    ----------
+    filter_chunk : callable
+        Function to filter a chunk, with the signature
+        ``filter_chunk(image, core=None, out=None)``. It filters `image` and
+        writes its `core` in `out`.
+    image : np.ndarray
+        Image with shape (..., y, x).
+    halo : Tuple(int)
+        Number of pixels the filter needs around a chunk along the y and x
+        dimensions.
+    n_jobs : int, default=1
+        Number of threads used to filter the image.
+    out : np.ndarray, optional
+        Preallocated array to write the filtered image in, with the same
+        shape and dtype than `image`.
+
+    Returns
+    -------
+    image_filtered : np.ndarray
+        Filtered image.
+
+    """
+    # check parameters
+    if n_jobs < 1:
+        raise ValueError("Parameter 'n_jobs' should be a positive integer, "
+                         "not {0}.".format(n_jobs))
+
+    # split y and x dimensions
+    chunks = _get_chunks(image.shape, halo, n_jobs)
+
+    # filter the full image at once
+    if len(chunks) == 1:
+        image_filtered = filter_chunk(image, out=out)
+        return image_filtered
+
+    # filter chunks in parallel
+    if out is None:
+        out = np.empty_like(image)
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        futures = []
+        for chunk_slice, core, core_slice in chunks:
+            future = executor.submit(
+                filter_chunk,
+                image[chunk_slice],
+                core=core,
+                out=out[core_slice])
+            futures.append(future)
+        for future in futures:
+            future.result()
+
+    return out
+
+
+def _get_chunks(shape, halo, n_jobs, min_size=64):
+    """Split the y and x dimensions of an image in chunks with halos.
+
+    Parameters
+    ----------
+    shape : Tuple(int)
+        Shape of the image (..., y, x).
+    halo : Tuple(int)
+        Number of pixels to add around a chunk along the y and x dimensions.
+    n_jobs : int
+        Number of chunks to build (at most).
+    min_size : int, default=64
+        Minimum size of a chunk (without its halo) along the y and x
+        dimensions.
+
+    Returns
+    -------
+    chunks : List(Tuple)
+        List of chunks. Each chunk is described with three tuples of slices:
+        the chunk with its halo in the image, its core in the chunk and its
+        core in the image.
+
+    """
+    # number of chunks along each dimension (larger than the halo)
+    size_y, size_x = shape[-2:]
+    max_y = max(1, size_y // max(min_size, 2 * halo[0]))
+    max_x = max(1, size_x // max(min_size, 2 * halo[1]))
+    nb_y = min(n_jobs, max_y)
+    nb_x = min(int(np.ceil(n_jobs / nb_y)), max_x)
+    bounds_y = np.linspace(0, size_y, nb_y + 1).astype(np.int64)
+    bounds_x = np.linspace(0, size_x, nb_x + 1).astype(np.int64)
+
+    # get slices
+    ellipsis = (slice(None),) * (len(shape) - 2)
+    chunks = []
+    for y_min, y_max in zip(bounds_y[:-1], bounds_y[1:]):
+        y_min_halo = max(0, y_min - halo[0])
+        y_max_halo = min(size_y, y_max + halo[0])
+        for x_min, x_max in zip(bounds_x[:-1], bounds_x[1:]):
+            x_min_halo = max(0, x_min - halo[1])
+            x_max_halo = min(size_x, x_max + halo[1])
+            chunk_slice = ellipsis + (slice(y_min_halo, y_max_halo),
+                                      slice(x_min_halo, x_max_halo))
+            core = ellipsis + (
+                slice(y_min - y_min_halo, y_max - y_min_halo),
+                slice(x_min - x_min_halo, x_max - x_min_halo))
+            core_slice = ellipsis + (slice(y_min, y_max),
+                                     slice(x_min, x_max))
+            chunks.append((chunk_slice, core, core_slice))
+
+    return chunks
+
+
+def _write_chunk(image_filtered, core=None, out=None):
+    """Keep the core of a filtered chunk and write it in an output array.
+
+    Parameters
+    ----------
+    image_filtered : np.ndarray
+        Filtered chunk.
+    core : Tuple(slice), optional
+        Part of the filtered chunk to keep (the chunk without its halo).
+    out : np.ndarray, optional
+        Preallocated array to write the core of the chunk in.
+
+    Returns
+    -------
+    image_filtered : np.ndarray
+        Core of the filtered chunk.
+
+    """
+    if core is not None:
+        image_filtered = image_filtered[core]
+    if out is not None:
+        out[...] = image_filtered
+        image_filtered = out
 
     return image_filtered
 
@@ -401,7 +1087,8 @@ def remove_background_mean(image, kernel_shape="disk", kernel_size=200):
     return image_without_back
 
 
-def remove_background_gaussian(image, sigma):
+def remove_background_gaussian(image, sigma, precision=None, out=None,
+                               n_jobs=1):
     """Remove background noise from a 2-d or 3-d image, subtracting a gaussian
     filtering.
 
@@ -413,6 +1100,14 @@ def remove_background_gaussian(image, sigma):
         Standard deviation used for the gaussian kernel (one for each
         dimension). If it's a scalar, the same standard deviation is applied
         to every dimensions.
+    precision : {None, `float32`, `float64`}, default=None
+        Float precision used to compute the gaussian filter. See
+        :func:`apifish.stack.gaussian_filter`.
+    out : np.ndarray, optional
+        Preallocated array to write the processed image in, with the same
+        shape and dtype than `image`.
+    n_jobs : int, default=1
+        Number of threads used to compute the gaussian filter by chunks.
 
     Returns
     -------
@@ -421,15 +1116,21 @@ def remove_background_gaussian(image, sigma):
 
     """
     # apply a gaussian filter
-    image_filtered = gaussian_filter(image, sigma, allow_negative=False)
+    image_filtered = gaussian_filter(
+        image, sigma,
+        allow_negative=False,
+        precision=precision,
+        out=out,
+        n_jobs=n_jobs)
 
-    # subtract the gaussian filter
-    out = np.zeros_like(image)
+    # subtract the gaussian filter (in place), clipping negative values to 0
+    mask = image > image_filtered
     image_no_background = np.subtract(
         image, image_filtered,
-        out=out,
-        where=(image > image_filtered),
+        out=image_filtered,
+        where=mask,
         dtype=image.dtype)
+    image_no_background[~mask] = 0
 
     return image_no_background
 
@@ -474,10 +1175,14 @@ def dilation_filter(image, kernel_shape=None, kernel_size=None):
             size=kernel_size,
             dtype=image.dtype)
 
-    # apply filter
-    if image.dtype == bool:
+    # apply filter (centered kernels use the van Herk/Gil-Werman algorithm)
+    if kernel is not None and kernel.shape[0] % 2 == kernel.shape[1] % 2 == 1:
+        image_filtered = _extremum_filter(image, kernel, np.maximum)
+    elif image.dtype == bool:
+        from skimage.morphology import binary_dilation
         image_filtered = binary_dilation(image, kernel)
     else:
+        from skimage.morphology import dilation
         image_filtered = dilation(image, kernel)
 
     return image_filtered
@@ -523,10 +1228,14 @@ def erosion_filter(image, kernel_shape=None, kernel_size=None):
             size=kernel_size,
             dtype=image.dtype)
 
-    # apply filter
-    if image.dtype == bool:
+    # apply filter (centered kernels use the van Herk/Gil-Werman algorithm)
+    if kernel is not None and kernel.shape[0] % 2 == kernel.shape[1] % 2 == 1:
+        image_filtered = _extremum_filter(image, kernel, np.minimum)
+    elif image.dtype == bool:
+        from skimage.morphology import binary_erosion
         image_filtered = binary_erosion(image, kernel)
     else:
+        from skimage.morphology import erosion
         image_filtered = erosion(image, kernel)
 
     return image_filtered
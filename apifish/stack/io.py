@@ -7,24 +7,36 @@ Functions used to read data from various sources and store them in a
 multidimensional tensor (numpy.ndarray).
 """
 
-import mrc
+import os
+import re
+import bz2
+import json
+import lzma
+import zlib
 import warnings
+import importlib
+import itertools
+import tifffile
+
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
-import pandas as pd
 
-from skimage import io
 from .utils import check_array
 from .utils import check_parameter
+from .utils import _check_dtype_array
+from .utils import _check_dim_array
 
-from astropy.table import Table
+# heavy dependencies (mrc, pandas, skimage.io, astropy) are imported in the
+# functions using them, to keep 'import apifish.stack' fast
 
 # TODO add general read function with mime types
 # TODO saving data in csv does not preserve dtypes
 
 # ### Read ###
 
-def read_image(path, sanity_check=False):
+def read_image(path, sanity_check=False, lazy=False, out=None):
     """Read an image with ``png``, ``jpg``, ``jpeg``, ``tif`` or ``tiff``
     extension.
 
@@ -33,36 +45,305 @@ def read_image(path, sanity_check=False):
     path : str
         Path of the image to read.
     sanity_check : bool
-        Check if the array returned fits with apifish pipeline.
+        Check if the array returned fits with apifish pipeline. With a lazy
+        image, only dtype and dimensions are checked.
+    lazy : bool
+        Read a ``tif`` or ``tiff`` image lazily. An uncompressed image is
+        memory-mapped (np.memmap). A compressed image is returned as a
+        :class:`LazyTiffImage`, which decodes only the pages needed when it is
+        sliced. Other extensions are always read entirely.
+    out : np.ndarray
+        Preallocated array to decode the image into, with the same shape and
+        dtype as the image. A ``tif`` or ``tiff`` image is decoded directly in
+        this array, without intermediate copy. Can't be used with a lazy
+        reading.
 
     Returns
     -------
-    image : ndarray, np.uint or np.int
-        Image read.
+    image : ndarray, np.memmap or LazyTiffImage, np.uint or np.int
+        Image read (``out`` if it is provided).
 
     """
     # check path
     check_parameter(
         path=str,
-        sanity_check=bool)
+        sanity_check=bool,
+        lazy=bool,
+        out=(np.ndarray, type(None)))
+    if lazy and out is not None:
+        raise ValueError("An image can't be read lazily in a preallocated "
+                         "array.")
 
     # read image
-    image = io.imread(path)
+    is_lazy = lazy and path.split(".")[-1] in ["tif", "tiff"]
+    if out is not None:
+        image = _read_image_into(path, out)
+    elif is_lazy:
+        try:
+            image = tifffile.memmap(path, mode="r")
+        except ValueError:
+            image = LazyTiffImage(path)
+    else:
+        from skimage import io
+        image = io.imread(path)
 
     # check the output image
     if sanity_check:
-        check_array(
-            image,
-            dtype=[np.uint8, np.uint16, np.uint32, np.uint64,
-                   np.int8, np.int16, np.int32, np.int64,
-                   np.float16, np.float32, np.float64,
-                   bool],
-            ndim=[2, 3, 4, 5],
-            allow_nan=False)
+        dtype = [np.uint8, np.uint16, np.uint32, np.uint64,
+                 np.int8, np.int16, np.int32, np.int64,
+                 np.float16, np.float32, np.float64,
+                 bool]
+        ndim = [2, 3, 4, 5]
+        if is_lazy:
+            _check_dtype_array(image, dtype)
+            _check_dim_array(image, ndim)
+        else:
+            check_array(
+                image,
+                dtype=dtype,
+                ndim=ndim,
+                allow_nan=False)
 
     return image
 
 
+def _read_image_into(path, out):
+    """Read an image in a preallocated array.
+
+    Parameters
+    ----------
+    path : str
+        Path of the image to read.
+    out : np.ndarray
+        Preallocated array with the same shape and dtype as the image.
+
+    Returns
+    -------
+    out : np.ndarray
+        Preallocated array filled with the image.
+
+    """
+    if path.split(".")[-1] in ["tif", "tiff"]:
+        with tifffile.TiffFile(path) as tif:
+            series = tif.series[0]
+            _check_output_array(out, series.shape, series.dtype)
+            tif.asarray(out=out)
+    else:
+        from skimage import io
+        image = io.imread(path)
+        _check_output_array(out, image.shape, image.dtype)
+        out[...] = image
+
+    return out
+
+
+def _check_output_array(out, shape, dtype):
+    """Check a preallocated array can receive an image.
+
+    Parameters
+    ----------
+    out : np.ndarray
+        Preallocated array.
+    shape : tuple
+        Shape of the image.
+    dtype : np.dtype
+        Dtype of the image.
+
+    Returns
+    -------
+    _ : bool
+        Assert if the array can receive the image.
+
+    """
+    if out.shape != tuple(shape) or out.dtype != np.dtype(dtype):
+        raise ValueError("An image with shape {0} and dtype {1} can't be "
+                         "read in an array with shape {2} and dtype {3}."
+                         .format(tuple(shape), np.dtype(dtype), out.shape,
+                                 out.dtype))
+    if not out.flags["C_CONTIGUOUS"] or not out.flags["WRITEABLE"]:
+        raise ValueError("Images can only be read in a writeable and "
+                         "C-contiguous array.")
+
+    return True
+
+
+class LazyTiffImage(object):
+    """Image stored in a ``tif`` or ``tiff`` file, read on demand.
+
+    The image can be sliced like a np.ndarray. Only the pages (usually the 2-d
+    planes) selected by the leading dimensions are decoded. The file is
+    opened for each read, so the object can be shared between threads or
+    processes.
+
+    Parameters
+    ----------
+    path : str
+        Path of the image to read.
+
+    Attributes
+    ----------
+    path : str
+        Path of the image.
+    shape : Tuple[int]
+        Shape of the image.
+    dtype : np.dtype
+        Dtype of the image.
+    ndim : int
+        Number of dimensions of the image.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with tifffile.TiffFile(path) as tif:
+            series = tif.series[0]
+            self.shape = tuple(series.shape)
+            self.dtype = np.dtype(series.dtype)
+            nb_pages = len(series.pages)
+            page_ndim = len(series.pages[0].shape)
+        self.ndim = len(self.shape)
+
+        # pages are indexed by the leading dimensions
+        self._nb_leading = max(0, self.ndim - page_ndim)
+        if int(np.prod(self.shape[:self._nb_leading])) != nb_pages:
+            self._nb_leading = 0
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None):
+        image = self[...]
+        if dtype is not None:
+            image = image.astype(dtype, copy=False)
+        return image
+
+    def __getitem__(self, key):
+        # split the key between leading and page dimensions
+        key = _expand_key(key, self.ndim)
+        leading_key = key[:self._nb_leading]
+        page_key = key[self._nb_leading:]
+
+        # read the whole image if pages can't be addressed
+        if self._nb_leading == 0:
+            image = tifffile.imread(self.path)
+            return image[page_key]
+
+        # get the indices of the pages to read
+        leading_shape = self.shape[:self._nb_leading]
+        page_indices = np.arange(int(np.prod(leading_shape)))
+        page_indices = page_indices.reshape(leading_shape)[leading_key]
+
+        # decode the pages selected
+        page_shape = self.shape[self._nb_leading:]
+        cropped_shape = np.broadcast_to(
+            np.empty((), dtype=self.dtype), page_shape)[page_key].shape
+        image = np.empty(page_indices.shape + cropped_shape, dtype=self.dtype)
+        with tifffile.TiffFile(self.path) as tif:
+            pages = tif.series[0].pages
+            for index, page_index in np.ndenumerate(page_indices):
+                page = pages[int(page_index)].asarray()
+                image[index] = page.reshape(page_shape)[page_key]
+
+        return image
+
+    def __repr__(self):
+        return "LazyTiffImage(path={0}, shape={1}, dtype={2})".format(
+            self.path, self.shape, self.dtype)
+
+
+def _expand_key(key, ndim):
+    """Expand an indexing key into a tuple with one element per dimension.
+
+    Parameters
+    ----------
+    key : int, slice, Ellipsis, List[int] or tuple
+        Indexing key.
+    ndim : int
+        Number of dimensions of the indexed array.
+
+    Returns
+    -------
+    key : tuple
+        Indexing key with one element per dimension.
+
+    """
+    if not isinstance(key, tuple):
+        key = (key,)
+    if any(k is None for k in key):
+        raise IndexError("New axes are not supported.")
+    nb_ellipsis = sum(k is Ellipsis for k in key)
+    if nb_ellipsis > 1:
+        raise IndexError("An index can only have a single ellipsis.")
+    if nb_ellipsis == 1:
+        i = [k is Ellipsis for k in key].index(True)
+        nb_missing = ndim - len(key) + 1
+        key = key[:i] + (slice(None),) * nb_missing + key[i + 1:]
+    if len(key) > ndim:
+        raise IndexError("Too many indices: {0} dimensions but {1} were "
+                         "indexed.".format(ndim, len(key)))
+    key = key + (slice(None),) * (ndim - len(key))
+
+    return key
+
+
+def read_image_planes(path):
+    """Read the 2-d planes of a ``tif`` or ``tiff`` image, one at a time.
+
+    The image is never loaded entirely. An uncompressed image is memory-mapped
+    and each plane is a view on the file. Otherwise, pages are decoded one by
+    one.
+
+    Parameters
+    ----------
+    path : str
+        Path of the image to read. Its dimensions should be ordered (..., y,
+        x).
+
+    Returns
+    -------
+    planes : Generator
+        Iterator over the 2-d planes of the image, with shape (y, x).
+
+    """
+    # check path
+    check_parameter(path=str)
+
+    # read planes lazily
+    planes = _read_image_planes(path)
+
+    return planes
+
+
+def _read_image_planes(path):
+    """Iterate over the 2-d planes of a ``tif`` or ``tiff`` image.
+
+    Parameters
+    ----------
+    path : str
+        Path of the image to read.
+
+    Returns
+    -------
+    planes : Generator
+        Iterator over the 2-d planes of the image, with shape (y, x).
+
+    """
+    # memory-map uncompressed image
+    try:
+        image = tifffile.memmap(path, mode="r")
+    except ValueError:
+        image = None
+    if image is not None:
+        yield from image.reshape((-1,) + image.shape[-2:])
+        return
+
+    # decode pages one by one
+    with tifffile.TiffFile(path) as tif:
+        for page in tif.series[0].pages:
+            page = page.asarray()
+            yield from page.reshape((-1,) + page.shape[-2:])
+
+
 def read_dv(path, sanity_check=False):
     """Read a video file with ``dv`` extension.
 
@@ -79,6 +360,9 @@ def read_dv(path, sanity_check=False):
         Video read.
 
     """
+    # import mrc lazily
+    import mrc
+
     # check path
     check_parameter(
         path=str,
@@ -98,25 +382,31 @@ def read_dv(path, sanity_check=False):
     return video
 
 
-def read_array(path):
+def read_array(path, mmap_mode=None):
     """Read a numpy array with ``npy`` extension.
 
     Parameters
     ----------
     path : str
         Path of the array to read.
+    mmap_mode : {None, `r`, `r+`, `c`}, default=None
+        If not None, memory-map the file instead of reading it (see
+        :func:`numpy.load`). Slicing the array then only reads the bytes
+        needed.
 
     Returns
     -------
-    array : ndarray
+    array : ndarray or np.memmap
         Array read.
 
     """
     # check path
-    check_parameter(path=str)
+    check_parameter(
+        path=str,
+        mmap_mode=(str, type(None)))
 
     # read array file
-    array = np.load(path)
+    array = np.load(path, mmap_mode=mmap_mode)
 
     return array
 
@@ -184,6 +474,9 @@ def read_dataframe_from_csv(path, delimiter=";", encoding="utf-8"):
         Pandas object read.
 
     """
+    # import pandas lazily
+    import pandas as pd
+
     # check parameters
     check_parameter(
         path=str,
@@ -213,8 +506,10 @@ def read_table_from_ecsv(path):
     df : pd.DataFrame
         Pandas object read.
 
-
     """
+    # import astropy lazily
+    from astropy.table import Table
+
     # check parameters
     check_parameter(
         path=str,)
@@ -386,6 +681,7 @@ def save_image(image, path, extension="tif"):
     # save image without warnings
     with warnings.catch_warnings():
         warnings.filterwarnings(action="ignore", category=UserWarning)
+        from skimage import io
         io.imsave(path, image)
 
 
@@ -437,6 +733,9 @@ def save_data_to_csv(data, path, delimiter=";"):
         Delimiter used to separate columns.
 
     """
+    # import pandas lazily
+    import pandas as pd
+
     # check parameters
     check_parameter(
         data=(pd.DataFrame, pd.Series, np.ndarray),
@@ -497,12 +796,14 @@ def save_table_to_ecsv(data, path):
         Path of the saved ``ecsv`` file.
 
     """
+    # import astropy lazily
+    from astropy.table import Table
+
     # check parameters
     check_parameter(
         data=(Table),
         path=str,)
 
-
     # add extension if necessary
     if ".ecsv" not in path:
         path += ".ecsv"
@@ -543,3 +844,1139 @@ def save_cell_extracted(cell_results, path):
 
     # save compressed file
     np.savez(path, **cell_results)
+
+
+# ### Chunked arrays ###
+
+def save_chunked_array(array, path, chunks=None, codec="zlib", level=None,
+                       n_jobs=1):
+    """Save an array in a directory of compressed chunks, with ``zarr``
+    extension.
+
+    The layout follows the zarr (v2) directory format: a ``.zarray`` json file
+    with the metadata, and one file per chunk named after its indices (e.g.
+    ``0.2.1``). Chunks only filled with zeros are not written.
+
+    The input array should have between 2 and 5 dimensions, with boolean,
+    (unsigned) integer, or float.
+
+    Parameters
+    ----------
+    array : np.ndarray
+        Array to save.
+    path : str
+        Path of the saved directory.
+    chunks : Tuple[int] or List[int], optional
+        Shape of the chunks. If None, chunks are 2-d tiles of 512x512 pixels
+        (at most) along the last two dimensions.
+    codec : {`zlib`, `bz2`, `lzma`, `lz4`, `zstd`, `blosc`, None}
+        Codec used to compress each chunk. Codecs `lz4`, `zstd` and `blosc`
+        require the packages ``lz4``, ``zstandard`` and ``blosc``
+        respectively. If None, chunks are not compressed.
+    level : int, optional
+        Compression level. If None, a default level is used for each codec.
+    n_jobs : int, default=1
+        Number of threads used to compress and write the chunks.
+
+    """
+    # check array and parameters
+    check_parameter(
+        path=str,
+        chunks=(tuple, list, type(None)),
+        codec=(str, type(None)),
+        level=(int, type(None)),
+        n_jobs=int)
+    check_array(
+        array,
+        dtype=[np.uint8, np.uint16, np.uint32, np.uint64,
+               np.int8, np.int16, np.int32, np.int64,
+               np.float16, np.float32, np.float64,
+               bool],
+        ndim=[2, 3, 4, 5])
+    if n_jobs < 1:
+        raise ValueError("Parameter 'n_jobs' should be a positive integer, "
+                         "not {0}.".format(n_jobs))
+
+    # get chunks shape
+    if chunks is None:
+        chunks = (1,) * (array.ndim - 2)
+        chunks += tuple(min(512, size) for size in array.shape[-2:])
+    chunks = tuple(chunks)
+    if len(chunks) != array.ndim or any(c < 1 for c in chunks):
+        raise ValueError("Parameter 'chunks' should have one positive "
+                         "integer per dimension of the array ({0}), not {1}."
+                         .format(array.ndim, chunks))
+
+    # get codec
+    compress, compressor = _get_codec(codec, level)
+
+    # add extension if necessary
+    if ".zarr" not in path:
+        path += ".zarr"
+
+    # prepare directory and remove previous chunks
+    os.makedirs(path, exist_ok=True)
+    for filename in os.listdir(path):
+        if re.fullmatch(r"\d+(\.\d+)*", filename):
+            os.remove(os.path.join(path, filename))
+
+    # save metadata
+    fill_value = np.zeros((), dtype=array.dtype).item()
+    metadata = {
+        "zarr_format": 2,
+        "shape": list(array.shape),
+        "chunks": list(chunks),
+        "dtype": array.dtype.str,
+        "compressor": compressor,
+        "fill_value": fill_value,
+        "order": "C",
+        "filters": None}
+    with open(os.path.join(path, ".zarray"), "w") as f:
+        json.dump(metadata, f, indent=4)
+
+    # save chunks
+    def save_chunk(chunk_index):
+        chunk_slice = tuple(
+            slice(i * c, (i + 1) * c) for i, c in zip(chunk_index, chunks))
+        data = array[chunk_slice]
+        if not data.any():
+            return
+        if data.shape != chunks:
+            data_padded = np.zeros(chunks, dtype=array.dtype)
+            data_padded[tuple(slice(0, s) for s in data.shape)] = data
+            data = data_padded
+        filename = ".".join(str(i) for i in chunk_index)
+        with open(os.path.join(path, filename), "wb") as f:
+            f.write(compress(np.ascontiguousarray(data).tobytes()))
+
+    nb_chunks = [-(-s // c) for s, c in zip(array.shape, chunks)]
+    chunk_indices = itertools.product(*[range(n) for n in nb_chunks])
+    if n_jobs == 1:
+        for chunk_index in chunk_indices:
+            save_chunk(chunk_index)
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(save_chunk, chunk_indices))
+
+
+def read_chunked_array(path, lazy=False, n_jobs=1):
+    """Read an array saved in a directory of compressed chunks, with ``zarr``
+    extension.
+
+    Parameters
+    ----------
+    path : str
+        Path of the directory to read.
+    lazy : bool
+        Return a :class:`ChunkedArray` instead of reading the whole array.
+        Slicing it only reads and decompresses the chunks needed.
+    n_jobs : int, default=1
+        Number of threads used to read and decompress the chunks.
+
+    Returns
+    -------
+    array : np.ndarray or ChunkedArray
+        Array read.
+
+    """
+    # check parameters
+    check_parameter(
+        path=str,
+        lazy=bool,
+        n_jobs=int)
+
+    # read array
+    array = ChunkedArray(path, n_jobs=n_jobs)
+    if not lazy:
+        array = array[...]
+
+    return array
+
+
+class ChunkedArray(object):
+    """Array saved in a directory of compressed chunks, read on demand.
+
+    The array can be sliced like a np.ndarray. Only the chunks overlapping
+    with the selection are read and decompressed.
+
+    Parameters
+    ----------
+    path : str
+        Path of the directory, written with
+        :func:`apifish.stack.save_chunked_array`.
+    n_jobs : int, default=1
+        Number of threads used to read and decompress the chunks.
+
+    Attributes
+    ----------
+    path : str
+        Path of the directory.
+    shape : Tuple[int]
+        Shape of the array.
+    chunks : Tuple[int]
+        Shape of the chunks.
+    dtype : np.dtype
+        Dtype of the array.
+    ndim : int
+        Number of dimensions of the array.
+
+    """
+
+    def __init__(self, path, n_jobs=1):
+        if n_jobs < 1:
+            raise ValueError("Parameter 'n_jobs' should be a positive "
+                             "integer, not {0}.".format(n_jobs))
+        with open(os.path.join(path, ".zarray"), "r") as f:
+            metadata = json.load(f)
+        if metadata["filters"] or metadata["order"] != "C":
+            raise ValueError("Filters and Fortran order are not supported.")
+        self.path = path
+        self.n_jobs = n_jobs
+        self.shape = tuple(metadata["shape"])
+        self.chunks = tuple(metadata["chunks"])
+        self.dtype = np.dtype(metadata["dtype"])
+        self.ndim = len(self.shape)
+        self.fill_value = metadata["fill_value"]
+        self._decompress = _get_decompressor(metadata["compressor"])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None):
+        array = self[...]
+        if dtype is not None:
+            array = array.astype(dtype, copy=False)
+        return array
+
+    def __getitem__(self, key):
+        # get the region to read along each dimension and the key within it
+        key = _expand_key(key, self.ndim)
+        bounds, region_key = [], []
+        for k, size in zip(key, self.shape):
+            if isinstance(k, slice):
+                start, stop, step = k.indices(size)
+                indices = range(start, stop, step)
+                if len(indices) == 0:
+                    bounds.append((0, 0))
+                    region_key.append(slice(0, 0))
+                    continue
+                lower = min(indices[0], indices[-1])
+                upper = max(indices[0], indices[-1]) + 1
+                stop = stop - lower if stop - lower >= 0 else None
+                region_key.append(slice(start - lower, stop, step))
+            else:
+                k = np.asarray(k)
+                if k.dtype.kind not in ["i", "u"]:
+                    raise IndexError("Only integers, slices and integer "
+                                     "arrays are valid indices.")
+                if ((k < -size) | (k >= size)).any():
+                    raise IndexError("Index out of bounds for a dimension "
+                                     "with size {0}.".format(size))
+                k = np.where(k < 0, k + size, k)
+                if k.size == 0:
+                    lower, upper = 0, 0
+                else:
+                    lower, upper = int(k.min()), int(k.max()) + 1
+                region_key.append(k - lower if k.ndim else int(k) - lower)
+            bounds.append((lower, upper))
+
+        # read region
+        region = self._read_region(bounds)
+
+        return region[tuple(region_key)]
+
+    def __repr__(self):
+        return "ChunkedArray(path={0}, shape={1}, chunks={2}, dtype={3})" \
+            .format(self.path, self.shape, self.chunks, self.dtype)
+
+    def _read_region(self, bounds):
+        """Read a rectangular region of the array.
+
+        Parameters
+        ----------
+        bounds : List[Tuple[int]]
+            Lower (included) and upper (excluded) bounds of the region along
+            each dimension.
+
+        Returns
+        -------
+        region : np.ndarray
+            Region read.
+
+        """
+        region = np.full(
+            [upper - lower for lower, upper in bounds], self.fill_value,
+            dtype=self.dtype)
+        if region.size == 0:
+            return region
+
+        # read chunks overlapping the region
+        def read_chunk(chunk_index):
+            filename = ".".join(str(i) for i in chunk_index)
+            path = os.path.join(self.path, filename)
+            if not os.path.isfile(path):
+                return
+            with open(path, "rb") as f:
+                data = self._decompress(f.read())
+            data = np.frombuffer(data, dtype=self.dtype).reshape(self.chunks)
+            chunk_slice, region_slice = [], []
+            for i, c, (lower, upper) in zip(chunk_index, self.chunks, bounds):
+                start, stop = max(i * c, lower), min((i + 1) * c, upper)
+                chunk_slice.append(slice(start - i * c, stop - i * c))
+                region_slice.append(slice(start - lower, stop - lower))
+            region[tuple(region_slice)] = data[tuple(chunk_slice)]
+
+        chunk_indices = itertools.product(*[
+            range(lower // c, (upper - 1) // c + 1)
+            for (lower, upper), c in zip(bounds, self.chunks)])
+        if self.n_jobs == 1:
+            for chunk_index in chunk_indices:
+                read_chunk(chunk_index)
+        else:
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                list(executor.map(read_chunk, chunk_indices))
+
+        return region
+
+
+def _get_codec(codec, level):
+    """Get the functions and the metadata of a compression codec.
+
+    Parameters
+    ----------
+    codec : {`zlib`, `bz2`, `lzma`, `lz4`, `zstd`, `blosc`, None}
+        Codec used to compress the chunks.
+    level : int, optional
+        Compression level. If None, a default level is used.
+
+    Returns
+    -------
+    compress : callable
+        Function to compress bytes.
+    compressor : Dict or None
+        Metadata of the codec, with the zarr (numcodecs) conventions.
+
+    """
+    if codec is None:
+        compressor = None
+    elif codec == "zlib":
+        compressor = {"id": "zlib", "level": 1 if level is None else level}
+    elif codec == "bz2":
+        compressor = {"id": "bz2", "level": 1 if level is None else level}
+    elif codec == "lzma":
+        compressor = {"id": "lzma", "format": 1, "check": -1,
+                      "preset": level, "filters": None}
+    elif codec == "lz4":
+        compressor = {"id": "lz4", "acceleration": 1}
+    elif codec == "zstd":
+        compressor = {"id": "zstd", "level": 1 if level is None else level}
+    elif codec == "blosc":
+        compressor = {"id": "blosc", "cname": "lz4",
+                      "clevel": 5 if level is None else level,
+                      "shuffle": 1, "blocksize": 0}
+    else:
+        raise ValueError("Parameter 'codec' should be 'zlib', 'bz2', 'lzma', "
+                         "'lz4', 'zstd', 'blosc' or None, not '{0}'."
+                         .format(codec))
+    compress = _get_compressor(compressor)
+
+    return compress, compressor
+
+
+def _get_compressor(compressor):
+    """Get the function to compress bytes with a codec.
+
+    Parameters
+    ----------
+    compressor : Dict or None
+        Metadata of the codec, with the zarr (numcodecs) conventions.
+
+    Returns
+    -------
+    compress : callable
+        Function to compress bytes.
+
+    """
+    if compressor is None:
+        return bytes
+    codec = compressor["id"]
+    if codec == "zlib":
+        return partial(zlib.compress, level=compressor["level"])
+    elif codec == "bz2":
+        return partial(bz2.compress, compresslevel=compressor["level"])
+    elif codec == "lzma":
+        return partial(lzma.compress, preset=compressor["preset"])
+    elif codec == "lz4":
+        lz4_block = _import_codec_package("lz4.block", "lz4")
+        return lz4_block.compress
+    elif codec == "zstd":
+        zstandard = _import_codec_package("zstandard", "zstandard")
+        return zstandard.ZstdCompressor(level=compressor["level"]).compress
+    else:
+        blosc = _import_codec_package("blosc", "blosc")
+        return partial(blosc.compress, clevel=compressor["clevel"],
+                       shuffle=compressor["shuffle"],
+                       cname=compressor["cname"])
+
+
+def _get_decompressor(compressor):
+    """Get the function to decompress bytes with a codec.
+
+    Parameters
+    ----------
+    compressor : Dict or None
+        Metadata of the codec, with the zarr (numcodecs) conventions.
+
+    Returns
+    -------
+    decompress : callable
+        Function to decompress bytes.
+
+    """
+    if compressor is None:
+        return bytes
+    codec = compressor["id"]
+    if codec == "zlib":
+        return zlib.decompress
+    elif codec == "bz2":
+        return bz2.decompress
+    elif codec == "lzma":
+        return lzma.decompress
+    elif codec == "lz4":
+        lz4_block = _import_codec_package("lz4.block", "lz4")
+        return lz4_block.decompress
+    elif codec == "zstd":
+        zstandard = _import_codec_package("zstandard", "zstandard")
+        return zstandard.ZstdDecompressor().decompress
+    elif codec == "blosc":
+        blosc = _import_codec_package("blosc", "blosc")
+        return blosc.decompress
+    else:
+        raise ValueError("Codec '{0}' is not supported.".format(codec))
+
+
+def _import_codec_package(module, package):
+    """Import the optional package of a compression codec.
+
+    Parameters
+    ----------
+    module : str
+        Name of the module to import.
+    package : str
+        Name of the package to install.
+
+    Returns
+    -------
+    module : module
+        Module imported.
+
+    """
+    try:
+        module = importlib.import_module(module)
+    except ImportError:
+        raise ImportError(
+            "{0} package is missing. You can install it by running the "
+            "command 'pip install {0}' in a bash shell.".format(package))
+
+    return module
+
+
+# ### Cell store ###
+
+def save_fov_extracted(fov_results, path):
+    """Save the results of :func:`apifish.multistack.extract_cell` for a
+    field of view (or a plate) in a single file with ``cells`` extension.
+
+    Each array is appended to a single buffer and indexed by cell and key, so
+    the file can be read lazily with :func:`apifish.stack.read_fov_extracted`.
+    Use :class:`apifish.stack.CellStoreWriter` to write cells one by one.
+
+    Parameters
+    ----------
+    fov_results : List[Dict]
+        List of dictionaries with the results of each cell (image, masks,
+        coordinates arrays), like the ones saved with
+        :func:`apifish.stack.save_cell_extracted`.
+    path : str
+        Path of the saved file.
+
+    """
+    # check parameters
+    check_parameter(
+        fov_results=list,
+        path=str)
+
+    # save cells
+    with CellStoreWriter(path) as writer:
+        for cell_results in fov_results:
+            writer.write(cell_results)
+
+
+def read_fov_extracted(path):
+    """Open a file with ``cells`` extension, previously written with
+    :func:`apifish.stack.save_fov_extracted`.
+
+    The file is memory-mapped: arrays are only read when they are accessed.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file to read.
+
+    Returns
+    -------
+    cell_store : CellStore
+        Lazy store of the cells. ``cell_store[i]`` returns the dictionary of
+        the i-th cell and ``cell_store.get(key)`` the list of arrays of all
+        cells for a key.
+
+    """
+    # check parameters
+    check_parameter(path=str)
+
+    # open file
+    cell_store = CellStore(path)
+
+    return cell_store
+
+
+_CELL_STORE_MAGIC = b"APIFISH-CELLS-V1"
+_CELL_STORE_ALIGNMENT = 64
+
+
+class CellStoreWriter(object):
+    """Write the results of several cells in a single file with ``cells``
+    extension, one cell at a time.
+
+    Arrays are appended to a temporary file as they come, then an index with
+    the offset, dtype and shape of each array is written and the file is
+    renamed when the writer is closed. The writer can be used as a context
+    manager: if an exception is raised, the writing is aborted and no file
+    is left behind (a previous file with the same path is kept).
+
+    Parameters
+    ----------
+    path : str
+        Path of the saved file.
+
+    Attributes
+    ----------
+    path : str
+        Path of the saved file.
+    nb_cells : int
+        Number of cells written.
+
+    """
+
+    def __init__(self, path):
+        check_parameter(path=str)
+        if ".cells" not in path:
+            path += ".cells"
+        self.path = path
+        self.nb_cells = 0
+        self._keys = {}
+        self._offsets = {}
+        self._shapes = {}
+        self._path_tmp = path + ".tmp"
+        self._file = open(self._path_tmp, "wb")
+        self._file.write(_CELL_STORE_MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, cell_results):
+        """Write the results of a cell.
+
+        Parameters
+        ----------
+        cell_results : Dict
+            Dictionary with the results of the cell (image, masks, coordinates
+            arrays).
+
+        """
+        check_parameter(cell_results=dict)
+
+        # check the whole cell before writing anything
+        values = {}
+        for key, value in cell_results.items():
+            value = np.asarray(value)
+            if value.dtype.hasobject:
+                raise TypeError("Object arrays can't be saved (key '{0}')."
+                                .format(key))
+
+            # check dtype consistency between cells
+            if key in self._keys and self._keys[key] != value.dtype.str:
+                raise ValueError("Key '{0}' should have the same dtype for "
+                                 "all cells ({1}), not {2}."
+                                 .format(key, self._keys[key],
+                                         value.dtype.str))
+            values[key] = value
+
+        for key, value in values.items():
+            if key not in self._keys:
+                self._keys[key] = value.dtype.str
+                self._offsets[key] = [-1] * self.nb_cells
+                self._shapes[key] = [None] * self.nb_cells
+
+            # append array
+            self._offsets[key].append(self._write_buffer(value))
+            self._shapes[key].append(list(value.shape))
+
+        # missing keys
+        for key in self._keys:
+            if key not in cell_results:
+                self._offsets[key].append(-1)
+                self._shapes[key].append(None)
+        self.nb_cells += 1
+
+    def close(self):
+        """Write the index, close the file and move it to its final path."""
+        if self._file.closed:
+            return
+        try:
+            index = {"nb_cells": self.nb_cells, "keys": {}}
+            for key, dtype in self._keys.items():
+                index["keys"][key] = {
+                    "dtype": dtype,
+                    "offsets": self._offsets[key],
+                    "shapes": self._shapes[key]}
+            index = json.dumps(index).encode("utf-8")
+            self._file.write(index)
+            self._file.write(np.array(len(index), dtype="<u8").tobytes())
+            self._file.close()
+        except BaseException:
+            self.abort()
+            raise
+        os.replace(self._path_tmp, self.path)
+
+    def abort(self):
+        """Close the file without writing the index and remove it."""
+        if self._file.closed:
+            return
+        self._file.close()
+        if os.path.isfile(self._path_tmp):
+            os.remove(self._path_tmp)
+
+    def _write_buffer(self, array):
+        """Write an array aligned on 64 bytes and return its offset."""
+        position = self._file.tell()
+        padding = -position % _CELL_STORE_ALIGNMENT
+        self._file.write(b"\0" * padding)
+        self._file.write(np.ascontiguousarray(array).tobytes())
+
+        return position + padding
+
+
+class CellStore(object):
+    """Results of several cells, read lazily from a single file with
+    ``cells`` extension.
+
+    The file is memory-mapped. Arrays returned are read-only views on the
+    file.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file, written with :func:`apifish.stack.save_fov_extracted`
+        or :class:`apifish.stack.CellStoreWriter`.
+
+    Attributes
+    ----------
+    path : str
+        Path of the file.
+    keys : List[str]
+        Keys available (some cells may miss some keys).
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(buffer[:len(_CELL_STORE_MAGIC)]) != _CELL_STORE_MAGIC:
+            raise ValueError("{0} is not a cell store.".format(path))
+        index_size = int(buffer[-8:].view("<u8")[0])
+        index = bytes(buffer[-8 - index_size:-8]).decode("utf-8")
+        index = json.loads(index)
+        self._buffer = buffer
+        self._nb_cells = index["nb_cells"]
+        self._index = index["keys"]
+        self.keys = list(self._index)
+
+    def __len__(self):
+        return self._nb_cells
+
+    def __iter__(self):
+        for i in range(self._nb_cells):
+            yield self[i]
+
+    def __getitem__(self, i):
+        """Get the results of a cell.
+
+        Parameters
+        ----------
+        i : int
+            Index of the cell.
+
+        Returns
+        -------
+        cell_results : Dict
+            Dictionary with the results of the cell.
+
+        """
+        if not -self._nb_cells <= i < self._nb_cells:
+            raise IndexError("Cell {0} is out of range ({1} cells)."
+                             .format(i, self._nb_cells))
+        i = i % self._nb_cells
+        cell_results = {}
+        for key in self.keys:
+            array = self._get_array(key, i)
+            if array is not None:
+                cell_results[key] = array
+
+        return cell_results
+
+    def __repr__(self):
+        return "CellStore(path={0}, nb_cells={1}, keys={2})".format(
+            self.path, self._nb_cells, self.keys)
+
+    def get(self, key):
+        """Get the arrays of all cells for a key.
+
+        Parameters
+        ----------
+        key : str
+            Key to read.
+
+        Returns
+        -------
+        arrays : List[np.ndarray]
+            Arrays of each cell (None if the cell misses the key).
+
+        """
+        if key not in self._index:
+            raise KeyError("Key '{0}' is not available. Available keys: {1}."
+                           .format(key, self.keys))
+        arrays = [self._get_array(key, i) for i in range(self._nb_cells)]
+
+        return arrays
+
+    def _get_array(self, key, i):
+        """Get the array of a cell for a key (None if missing)."""
+        index = self._index[key]
+        offset = index["offsets"][i]
+        if offset < 0:
+            return None
+        dtype = np.dtype(index["dtype"])
+        shape = tuple(index["shapes"][i])
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        array = self._buffer[offset:offset + nbytes].view(dtype).reshape(shape)
+
+        return array
+
+
+# ### Spot tables ###
+
+def save_spot_table(data, path, columns=None, codec=None, level=None):
+    """Save spots (or any table) in a binary columnar format, with ``spots``
+    extension.
+
+    The table is a directory with a ``table.json`` file describing the
+    columns, and one binary file per column. Each column keeps its dtype.
+    Uncompressed columns can be memory-mapped when they are read. Rows can
+    be added with :func:`apifish.stack.append_spot_table`.
+
+    Parameters
+    ----------
+    data : np.ndarray, pd.Series, pd.DataFrame or Dict
+        Data to save. A numpy array should have 2 dimensions (one column per
+        coordinate, like the spots and clusters arrays). A dictionary maps
+        column names to 1-d arrays with the same length.
+    path : str
+        Path of the saved table.
+    columns : List[str], optional
+        Names of the columns of a numpy array. If None, columns are named
+        ``0``, ``1``, etc.
+    codec : {`zlib`, `bz2`, `lzma`, `lz4`, `zstd`, `blosc`, None}
+        Codec used to compress the columns. Compressed columns can't be
+        memory-mapped.
+    level : int, optional
+        Compression level. If None, a default level is used for each codec.
+
+    """
+    # import pandas lazily
+    import pandas as pd
+
+    # check parameters
+    check_parameter(
+        data=(np.ndarray, dict, pd.DataFrame, pd.Series),
+        path=str,
+        columns=(list, type(None)),
+        codec=(str, type(None)),
+        level=(int, type(None)))
+
+    # get columns and codec
+    data = _get_spot_columns(data, columns)
+    _, compressor = _get_codec(codec, level)
+
+    # add extension if necessary
+    if ".spots" not in path:
+        path += ".spots"
+
+    # prepare directory and remove previous columns
+    os.makedirs(path, exist_ok=True)
+    for filename in os.listdir(path):
+        if re.fullmatch(r"column_\d+(\.\d+)?\.bin", filename):
+            os.remove(os.path.join(path, filename))
+
+    # save metadata and columns
+    metadata = {
+        "columns": [{"name": name, "dtype": column.dtype.str}
+                    for name, column in data.items()],
+        "compressor": compressor,
+        "batches": []}
+    _append_spot_columns(data, path, metadata)
+
+
+def append_spot_table(data, path, columns=None):
+    """Append rows to a table with ``spots`` extension, previously written with
+    :func:`apifish.stack.save_spot_table`.
+
+    The table is created if it does not exist.
+
+    Parameters
+    ----------
+    data : np.ndarray, pd.Series, pd.DataFrame or Dict
+        Rows to append, with the same columns as the table. Values are cast
+        to the dtype of the table columns if no information is lost: the cast
+        should be safe, or integer values should fit in the integer dtype of
+        the column.
+    path : str
+        Path of the table.
+    columns : List[str], optional
+        Names of the columns of a numpy array. If None, columns are named
+        ``0``, ``1``, etc.
+
+    """
+    # import pandas lazily
+    import pandas as pd
+
+    # check parameters
+    check_parameter(
+        data=(np.ndarray, dict, pd.DataFrame, pd.Series),
+        path=str,
+        columns=(list, type(None)))
+
+    # create table if necessary
+    if ".spots" not in path:
+        path += ".spots"
+    if not os.path.isfile(os.path.join(path, "table.json")):
+        save_spot_table(data, path, columns=columns)
+        return
+
+    # get columns
+    data = _get_spot_columns(data, columns)
+    metadata = _read_spot_metadata(path)
+    names = [column["name"] for column in metadata["columns"]]
+    if list(data) != names:
+        raise ValueError("Columns to append ({0}) should be the same as the "
+                         "table columns ({1}).".format(list(data), names))
+    for column in metadata["columns"]:
+        dtype = np.dtype(column["dtype"])
+        values = data[column["name"]]
+        if not _can_cast_values(values, dtype):
+            raise TypeError("Column '{0}' with dtype {1} can't be appended to "
+                            "a column with dtype {2}."
+                            .format(column["name"], values.dtype, dtype))
+        data[column["name"]] = values.astype(dtype, copy=False)
+
+    # append columns
+    _append_spot_columns(data, path, metadata)
+
+
+def _can_cast_values(values, dtype):
+    """Check if values can be cast to a dtype without losing information.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Values to cast.
+    dtype : np.dtype
+        Dtype to cast the values to.
+
+    Returns
+    -------
+    _ : bool
+        True if the cast is safe, or if the integer values fit in the integer
+        dtype.
+
+    """
+    if np.can_cast(values.dtype, dtype, casting="safe"):
+        return True
+    if values.dtype.kind not in ["u", "i"] or dtype.kind not in ["u", "i"]:
+        return False
+    if values.size == 0:
+        return True
+    info = np.iinfo(dtype)
+
+    return info.min <= values.min() and values.max() <= info.max
+
+
+def read_spot_table(path, columns=None):
+    """Read the columns of a table with ``spots`` extension.
+
+    Uncompressed columns are memory-mapped: values are only read when they
+    are accessed.
+
+    Parameters
+    ----------
+    path : str
+        Path of the table to read.
+    columns : List[str], optional
+        Names of the columns to read. If None, all columns are read.
+
+    Returns
+    -------
+    data : Dict
+        Dictionary mapping the column names to 1-d arrays (np.memmap if the
+        table is not compressed).
+
+    """
+    # check parameters
+    check_parameter(
+        path=str,
+        columns=(list, type(None)))
+
+    # read metadata
+    metadata = _read_spot_metadata(path)
+    names = [column["name"] for column in metadata["columns"]]
+    if columns is None:
+        columns = names
+    for name in columns:
+        if name not in names:
+            raise ValueError("Column '{0}' is not in the table. Available "
+                             "columns are: {1}.".format(name, names))
+
+    # read columns
+    compressor = metadata["compressor"]
+    nb_rows = sum(metadata["batches"])
+    data = {}
+    for name in columns:
+        i = names.index(name)
+        dtype = np.dtype(metadata["columns"][i]["dtype"])
+        if nb_rows == 0:
+            data[name] = np.empty((0,), dtype=dtype)
+        elif compressor is None:
+            data[name] = np.memmap(
+                os.path.join(path, "column_{0}.bin".format(i)),
+                dtype=dtype, mode="r", shape=(nb_rows,))
+        else:
+            decompress = _get_decompressor(compressor)
+            batches = []
+            for j in range(len(metadata["batches"])):
+                filename = "column_{0}.{1}.bin".format(i, j)
+                with open(os.path.join(path, filename), "rb") as f:
+                    batches.append(
+                        np.frombuffer(decompress(f.read()), dtype=dtype))
+            data[name] = np.concatenate(batches)
+
+    return data
+
+
+def read_array_from_spot_table(path, columns=None, dtype=None):
+    """Read a table with ``spots`` extension as a 2-d numpy array.
+
+    Parameters
+    ----------
+    path : str
+        Path of the table to read.
+    columns : List[str], optional
+        Names of the columns to read, in the order of the array columns. If
+        None, all columns are read.
+    dtype : type, optional
+        Expected dtype to cast the array. If None, columns are cast to their
+        common dtype.
+
+    Returns
+    -------
+    data : np.ndarray
+        Array read with shape (nb_rows, nb_columns).
+
+    """
+    # check parameters
+    check_parameter(dtype=(type, type(None)))
+
+    # read columns
+    data = read_spot_table(path, columns)
+    if dtype is None:
+        dtype = np.result_type(*data.values())
+    array = np.empty((_get_nb_rows(data), len(data)), dtype=dtype)
+    for i, column in enumerate(data.values()):
+        array[:, i] = column
+
+    return array
+
+
+def read_dataframe_from_spot_table(path, columns=None):
+    """Read a table with ``spots`` extension as a pandas DataFrame.
+
+    Parameters
+    ----------
+    path : str
+        Path of the table to read.
+    columns : List[str], optional
+        Names of the columns to read. If None, all columns are read.
+
+    Returns
+    -------
+    df : pd.DataFrame
+        Pandas object read.
+
+    """
+    # import pandas lazily
+    import pandas as pd
+
+    # read columns
+    data = read_spot_table(path, columns)
+    df = pd.DataFrame(
+        {name: np.array(column) for name, column in data.items()})
+
+    return df
+
+
+def _get_spot_columns(data, columns):
+    """Split data in named 1-d columns.
+
+    Parameters
+    ----------
+    data : np.ndarray, pd.Series, pd.DataFrame or Dict
+        Data to split.
+    columns : List[str], optional
+        Names of the columns of a numpy array.
+
+    Returns
+    -------
+    data : Dict
+        Dictionary mapping the column names to 1-d arrays.
+
+    """
+    # import pandas lazily
+    import pandas as pd
+
+    # get columns from a pandas object, a numpy array or a dictionary
+    if isinstance(data, pd.Series):
+        data = data.to_frame()
+    if isinstance(data, pd.DataFrame):
+        data = {str(name): data[name].to_numpy() for name in data.columns}
+    elif isinstance(data, np.ndarray):
+        check_array(
+            data,
+            dtype=[np.uint8, np.uint16, np.uint32, np.uint64,
+                   np.int8, np.int16, np.int32, np.int64,
+                   np.float16, np.float32, np.float64,
+                   bool],
+            ndim=2)
+        if columns is None:
+            columns = [str(i) for i in range(data.shape[1])]
+        elif len(columns) != data.shape[1]:
+            raise ValueError("Parameter 'columns' should have one name per "
+                             "column ({0}), not {1}."
+                             .format(data.shape[1], len(columns)))
+        data = {str(name): data[:, i] for i, name in enumerate(columns)}
+    else:
+        data = {str(name): np.asarray(column)
+                for name, column in data.items()}
+
+    # check columns
+    for name, column in data.items():
+        if column.ndim != 1:
+            raise ValueError("Column '{0}' should have 1 dimension, not {1}."
+                             .format(name, column.ndim))
+        if column.dtype.hasobject or column.dtype.kind in ["U", "S"]:
+            raise TypeError("Column '{0}' with dtype {1} is not supported."
+                            .format(name, column.dtype))
+    _get_nb_rows(data)
+
+    return data
+
+
+def _get_nb_rows(data):
+    """Get the number of rows of columns with the same length.
+
+    Parameters
+    ----------
+    data : Dict
+        Dictionary mapping the column names to 1-d arrays.
+
+    Returns
+    -------
+    nb_rows : int
+        Number of rows.
+
+    """
+    lengths = set(len(column) for column in data.values())
+    if len(lengths) > 1:
+        raise ValueError("Columns should have the same length, not {0}."
+                         .format(sorted(lengths)))
+    nb_rows = lengths.pop() if lengths else 0
+
+    return nb_rows
+
+
+def _read_spot_metadata(path):
+    """Read the metadata of a table with ``spots`` extension.
+
+    Parameters
+    ----------
+    path : str
+        Path of the table.
+
+    Returns
+    -------
+    metadata : Dict
+        Metadata of the table.
+
+    """
+    with open(os.path.join(path, "table.json"), "r") as f:
+        metadata = json.load(f)
+
+    return metadata
+
+
+def _append_spot_columns(data, path, metadata):
+    """Append columns to the files of a table and update its metadata.
+
+    Parameters
+    ----------
+    data : Dict
+        Dictionary mapping the column names to 1-d arrays.
+    path : str
+        Path of the table.
+    metadata : Dict
+        Metadata of the table.
+
+    """
+    # append columns
+    compressor = metadata["compressor"]
+    compress = _get_compressor(compressor)
+    batch = len(metadata["batches"])
+    for i, column in enumerate(data.values()):
+        column = np.ascontiguousarray(column)
+        if compressor is None:
+            filename = "column_{0}.bin".format(i)
+            with open(os.path.join(path, filename), "ab") as f:
+                f.write(column.tobytes())
+        else:
+            filename = "column_{0}.{1}.bin".format(i, batch)
+            with open(os.path.join(path, filename), "wb") as f:
+                f.write(compress(column.tobytes()))
+
+    # update metadata
+    metadata["batches"].append(_get_nb_rows(data))
+    with open(os.path.join(path, "table.json"), "w") as f:
+        json.dump(metadata, f, indent=4)
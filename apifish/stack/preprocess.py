@@ -19,9 +19,6 @@ from skimage import img_as_ubyte
 from skimage import img_as_float32
 from skimage import img_as_float64
 from skimage import img_as_uint
-from skimage.exposure import rescale_intensity
-from skimage.transform import resize
-from sklearn.utils.fixes import parse_version
 
 
 # TODO replace 'tensor' by 'image'
@@ -218,6 +215,9 @@ def _rescale_5d(tensor, channel_to_stretch, stretching_percentile):
         Tensor rescaled.
 
     """
+    # import scikit-image lazily
+    from skimage.exposure import rescale_intensity
+
     # target intensity range
     target_range = 'dtype'
     dtype = tensor.dtype
@@ -280,6 +280,9 @@ def cast_img_uint8(tensor):
         Image cast.
 
     """
+    # import scikit-learn lazily
+    from sklearn.utils.fixes import parse_version
+
     # check tensor dtype
     check_array(
         tensor,
@@ -332,6 +335,9 @@ def cast_img_uint16(tensor):
         Image cast.
 
     """
+    # import scikit-learn lazily
+    from sklearn.utils.fixes import parse_version
+
     # check tensor dtype
     check_array(
         tensor,
@@ -382,6 +388,9 @@ def cast_img_float32(tensor):
         image cast.
 
     """
+    # import scikit-learn lazily
+    from sklearn.utils.fixes import parse_version
+
     # check tensor dtype
     check_array(
         tensor,
@@ -452,6 +461,9 @@ def resize_image(image, output_shape, method="bilinear"):
         Resized image.
 
     """
+    # import scikit-image lazily
+    from skimage.transform import resize
+
     # check parameters
     check_parameter(output_shape=tuple, method=str)
     check_array(image, ndim=[2, 3], dtype=[np.uint8, np.uint16, np.float32])
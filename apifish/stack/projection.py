@@ -4,10 +4,15 @@
 
 """2-d projection functions."""
 
+import os
+import tempfile
+
 import numpy as np
 
 from .utils import check_array
 from .utils import check_parameter
+from .io import read_image
+from .io import read_image_planes
 from .quality import compute_focus
 
 
@@ -100,6 +105,238 @@ def median_projection(image):
     return projected_image
 
 
+# ### Streaming projections 2-d ###
+
+def maximum_projection_from_planes(planes):
+    """Project the z-dimension of an image read plane by plane, keeping the
+    maximum intensity of each yx pixel.
+
+    Only one plane and the running maximum are kept in memory.
+
+    Parameters
+    ----------
+    planes : str or Iterable[np.ndarray]
+        Path of a ``tif`` or ``tiff`` image, or iterator over 2-d images with
+        shape (y, x), the same dtype and the same shape.
+
+    Returns
+    -------
+    projected_image : np.ndarray
+        A 2-d image with shape (y, x).
+
+    """
+    # project planes along the z axis
+    projected_image = None
+    for plane in _get_planes(planes):
+        if projected_image is None:
+            projected_image = np.array(plane)
+        else:
+            np.maximum(projected_image, plane, out=projected_image)
+
+    return projected_image
+
+
+def mean_projection_from_planes(planes, return_float=False):
+    """Project the z-dimension of an image read plane by plane, computing the
+    mean intensity of each yx pixel.
+
+    Only one plane and the running sum are kept in memory.
+
+    Parameters
+    ----------
+    planes : str or Iterable[np.ndarray]
+        Path of a ``tif`` or ``tiff`` image, or iterator over 2-d images with
+        shape (y, x), the same dtype and the same shape.
+    return_float : bool, default=False
+        Return a (potentially more accurate) float array.
+
+    Returns
+    -------
+    projected_image : np.ndarray
+        A 2-d image with shape (y, x).
+
+    """
+    # sum planes in float64
+    projected_image = None
+    nb_planes = 0
+    for plane in _get_planes(planes):
+        if projected_image is None:
+            projected_image = plane.astype(np.float64)
+            dtype = plane.dtype
+        else:
+            np.add(projected_image, plane, out=projected_image)
+        nb_planes += 1
+
+    # compute mean
+    projected_image /= nb_planes
+    if not return_float:
+        projected_image = projected_image.astype(dtype)
+
+    return projected_image
+
+
+def median_projection_from_planes(planes, band_size=None):
+    """Project the z-dimension of an image read plane by plane, computing the
+    median intensity of each yx pixel.
+
+    The median is computed by bands of rows, with all the z-slices of a band
+    in memory. A 3-d array or an uncompressed ``tif`` image (memory-mapped) is
+    read directly. Other planes are first written in a temporary file on disk.
+
+    Parameters
+    ----------
+    planes : str, np.ndarray or Iterable[np.ndarray]
+        Path of a ``tif`` or ``tiff`` image, 3-d image with shape (z, y, x),
+        or iterator over 2-d images with shape (y, x), the same dtype and the
+        same shape.
+    band_size : int, optional
+        Number of rows processed at once. If None, bands have roughly the
+        size of one plane.
+
+    Returns
+    -------
+    projected_image : np.ndarray
+        A 2-d image with shape (y, x).
+
+    """
+    # check parameters
+    check_parameter(band_size=(int, type(None)))
+    if band_size is not None and band_size < 1:
+        raise ValueError("Parameter 'band_size' should be a positive integer, "
+                         "not {0}.".format(band_size))
+
+    # compute median directly from an image in memory or memory-mapped
+    image = _get_mapped_planes(planes)
+    if image is not None:
+        projected_image = _median_by_band(image, band_size)
+        return projected_image
+
+    with tempfile.TemporaryDirectory() as tmp_directory:
+
+        # write planes in a temporary file
+        path = os.path.join(tmp_directory, "planes.raw")
+        nb_planes = 0
+        with open(path, "wb") as f:
+            for plane in _get_planes(planes):
+                shape, dtype = plane.shape, plane.dtype
+                f.write(np.ascontiguousarray(plane).tobytes())
+                nb_planes += 1
+        image = np.memmap(
+            path, dtype=dtype, mode="r", shape=(nb_planes,) + shape)
+
+        # compute median band by band
+        projected_image = _median_by_band(image, band_size)
+        del image
+
+    return projected_image
+
+
+def _get_mapped_planes(planes):
+    """Get the planes as a 3-d array, if they are already in memory or can be
+    memory-mapped.
+
+    Parameters
+    ----------
+    planes : str, np.ndarray or Iterable[np.ndarray]
+        Path of a ``tif`` or ``tiff`` image, 3-d image with shape (z, y, x),
+        or iterator over 2-d images with shape (y, x).
+
+    Returns
+    -------
+    image : np.ndarray, np.memmap or None
+        Planes with shape (z, y, x), or None if they should be read one by
+        one.
+
+    """
+    # get image
+    if isinstance(planes, np.ndarray) and planes.ndim == 3:
+        image = planes
+    elif isinstance(planes, str):
+        image = read_image(planes, lazy=True)
+        if not isinstance(image, np.memmap):
+            return None
+        image = image.reshape((-1,) + image.shape[-2:])
+    else:
+        return None
+
+    # check image
+    check_array(
+        image,
+        ndim=3,
+        dtype=[np.uint8, np.uint16, np.float32, np.float64])
+    if image.shape[0] == 0:
+        raise ValueError("At least one plane is required.")
+
+    return image
+
+
+def _median_by_band(image, band_size):
+    """Compute the median of each yx pixel along the z-dimension, by bands of
+    rows.
+
+    Parameters
+    ----------
+    image : np.ndarray or np.memmap
+        Image with shape (z, y, x).
+    band_size : int, optional
+        Number of rows processed at once. If None, bands have roughly the
+        size of one plane.
+
+    Returns
+    -------
+    projected_image : np.ndarray
+        A 2-d image with shape (y, x).
+
+    """
+    nb_planes, shape, dtype = image.shape[0], image.shape[1:], image.dtype
+    if band_size is None:
+        band_size = -(-shape[0] // nb_planes)
+    projected_image = np.empty(shape, dtype=dtype)
+    for y in range(0, shape[0], band_size):
+        band = np.array(image[:, y:y + band_size])
+        projected_image[y:y + band_size] = np.median(
+            band, axis=0, overwrite_input=True)
+
+    return projected_image
+
+
+def _get_planes(planes):
+    """Iterate over 2-d planes and check them.
+
+    Parameters
+    ----------
+    planes : str or Iterable[np.ndarray]
+        Path of a ``tif`` or ``tiff`` image, or iterator over 2-d images with
+        shape (y, x), the same dtype and the same shape.
+
+    Returns
+    -------
+    planes : Generator
+        Iterator over the checked 2-d planes.
+
+    """
+    # read image
+    if isinstance(planes, str):
+        planes = read_image_planes(planes)
+
+    # check planes
+    shape, dtype = None, None
+    for plane in planes:
+        check_array(
+            plane,
+            ndim=2,
+            dtype=[np.uint8, np.uint16, np.float32, np.float64])
+        if shape is None:
+            shape, dtype = plane.shape, plane.dtype
+        elif plane.shape != shape or plane.dtype != dtype:
+            raise ValueError("Planes should have the same shape and dtype. "
+                             "Expected {0} and {1}, got {2} and {3}."
+                             .format(shape, dtype, plane.shape, plane.dtype))
+        yield plane
+    if shape is None:
+        raise ValueError("At least one plane is required.")
+
+
 def focus_projection(image, proportion=0.75, neighborhood_size=7,
                      method="median"):
     """Project the z-dimension of an image.
@@ -140,7 +377,7 @@ def focus_projection(image, proportion=0.75, neighborhood_size=7,
         dtype=[np.uint8, np.uint16, np.float32, np.float64])
 
     # compute focus measure for each pixel
-    focus = compute_focus(image, neighborhood_size)
+    focus = compute_focus(image, neighborhood_size, precision="float32")
 
     # select and keep best z-slices
     indices_to_keep = get_in_focus_indices(focus, proportion)
@@ -148,74 +385,49 @@ def focus_projection(image, proportion=0.75, neighborhood_size=7,
     focus = focus[indices_to_keep]
 
     # for each yx pixel, get the indices of the 5 best focus values
-    top_focus_indices = np.argsort(focus, axis=0)
     n = min(focus.shape[0], 5)
-    top_focus_indices = top_focus_indices[-n:, :, :]
+    top_focus_indices = _get_top_indices(focus, n)
 
-    # build a binary matrix with the same shape of our in-focus image to keep
-    # the top focus pixels only
-    mask = [mask_ for mask_ in map(
-        lambda indices: _one_hot_3d(indices, depth=in_focus_image.shape[0]),
-        top_focus_indices)]
-    mask = np.sum(mask, axis=0, dtype=in_focus_image.dtype)
-
-    # filter top focus pixels in our in-focus image
-    in_focus_image = in_focus_image.astype(np.float64)
-    in_focus_image[mask == 0] = np.nan
+    # gather the top focus pixels of our in-focus image (n, y, x)
+    top_focus_image = np.take_along_axis(
+        in_focus_image, top_focus_indices, axis=0)
 
     # project image
     if method == "median":
-        projected_image = np.nanmedian(in_focus_image, axis=0)
+        projected_image = np.median(top_focus_image, axis=0)
     elif method == "max":
-        projected_image = np.nanmax(in_focus_image, axis=0)
+        projected_image = np.max(top_focus_image, axis=0)
     else:
         raise ValueError("Parameter 'method' should be 'median' or 'max', not "
                          "'{0}'.".format(method))
-    projected_image = projected_image.astype(image.dtype)
+    projected_image = projected_image.astype(image.dtype, copy=False)
 
     return projected_image
 
 
-def _one_hot_3d(indices, depth, return_boolean=False):
-    """Build a 3-d one-hot matrix from a 2-d indices matrix.
+def _get_top_indices(values, n):
+    """Get the indices of the n highest values along the first axis.
+
+    Values are partially sorted with np.argpartition: the n highest values
+    are not sorted between them. Among equal values, any index can be
+    selected.
 
     Parameters
     ----------
-    indices : np.ndarray, int
-        A 2-d tensor with integer indices and shape (y, x).
-    depth : int
-        Depth of the 3-d one-hot matrix.
-    return_boolean : bool
-        Return a boolean one-hot encoded matrix.
+    values : np.ndarray
+        Array with shape (z, ...).
+    n : int
+        Number of indices to select, between 1 and z.
 
     Returns
     -------
-    one_hot : np.ndarray
-        A 3-d binary tensor with shape (depth, y, x)
+    top_indices : np.ndarray, np.int64
+        Indices of the n highest values, with shape (n, ...).
 
     """
-    # check parameters
-    check_parameter(depth=int)
-    check_array(
-        indices,
-        ndim=2,
-        dtype=[np.uint8, np.uint16, np.uint32, np.uint64,
-               np.int8, np.int16, np.int32, np.int64])
-
-    # initialize the 3-d one-hot matrix
-    one_hot = np.zeros((indices.size, depth), dtype=indices.dtype)
-
-    # flatten the matrix to easily one-hot encode it, then reshape it
-    one_hot[np.arange(indices.size), indices.ravel()] = 1
-    one_hot.shape = indices.shape + (depth,)
-
-    # rearrange the axis
-    one_hot = np.moveaxis(one_hot, source=2, destination=0)
-
-    if return_boolean:
-        one_hot = one_hot.astype(bool)
+    top_indices = np.argpartition(values, -n, axis=0)[-n:]
 
-    return one_hot
+    return top_indices
 
 
 # ### Slice selection ###
@@ -229,7 +441,7 @@ def in_focus_selection(image, focus, proportion):
     ----------
     image : np.ndarray
         A 3-d tensor with shape (z, y, x).
-    focus : np.ndarray, np.float64
+    focus : np.ndarray, np.float
         A 3-d tensor with a focus metric computed for each pixel of the
         original image. See :func:`apifish.stack.compute_focus`.
     proportion : float or int
@@ -263,7 +475,7 @@ def get_in_focus_indices(focus, proportion):
 
     Parameters
     ----------
-    focus : np.ndarray, np.float64
+    focus : np.ndarray, np.float
         A 3-d tensor with a focus metric computed for each pixel of the
         original image. See :func:`apifish.stack.compute_focus`.
     proportion : float or int
@@ -278,7 +490,7 @@ def get_in_focus_indices(focus, proportion):
     """
     # check parameters
     check_parameter(proportion=(float, int))
-    check_array(focus, ndim=3, dtype=np.float64)
+    check_array(focus, ndim=3, dtype=[np.float32, np.float64])
     if isinstance(proportion, float) and 0 <= proportion <= 1:
         n = int(focus.shape[0] * proportion)
     elif isinstance(proportion, int) and 0 <= proportion:
@@ -288,7 +500,7 @@ def get_in_focus_indices(focus, proportion):
                          "positive integer, but not {0}.".format(proportion))
 
     # measure focus level per 2-d slices
-    focus_levels = np.mean(focus, axis=(1, 2))
+    focus_levels = np.mean(focus, axis=(1, 2), dtype=np.float64)
 
     # select the best z-slices
     n = min(n, focus_levels.size)
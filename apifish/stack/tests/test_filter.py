@@ -16,6 +16,10 @@ from apifish.stack.filter import _define_kernel
 from numpy.testing import assert_array_equal
 from numpy.testing import assert_allclose
 
+from scipy.ndimage import convolve
+
+from skimage.filters import rank
+
 
 # toy images
 x = np.array(
@@ -131,6 +135,29 @@ def test_mean_filter():
     assert filtered_x.dtype == np.float64
 
 
+@pytest.mark.parametrize("shape, size", [
+    ("square", 4), ("square", 31), ("rectangle", (3, 8)),
+    ("rectangle", (40, 5)), ("disk", 12), ("diamond", 15)])
+@pytest.mark.parametrize("dtype", [
+    np.uint8, np.uint16, np.float32, np.float64])
+def test_mean_filter_large_kernel(shape, size, dtype):
+    # compare fast methods with a dense convolution
+    np.random.seed(0)
+    image = np.random.randint(0, 256, size=(40, 50)).astype(dtype)
+    kernel = _define_kernel(shape, size, np.float64)
+    kernel /= kernel.sum()
+    expected_image = convolve(image, kernel)
+    filtered_image = stack.mean_filter(image,
+                                       kernel_shape=shape,
+                                       kernel_size=size)
+    assert filtered_image.dtype == dtype
+    if dtype in [np.uint8, np.uint16]:
+        # dense convolution can truncate an exact integer mean
+        assert_allclose(filtered_image, expected_image, atol=1)
+    else:
+        assert_allclose(filtered_image, expected_image, rtol=1e-5)
+
+
 def test_median_filter():
     # np.uint8
     filtered_x = stack.median_filter(x,
@@ -203,6 +230,26 @@ def test_minimum_filter():
     assert filtered_x.dtype == np.uint16
 
 
+@pytest.mark.parametrize("shape, size", [
+    ("diamond", 3), ("disk", 4), ("square", 5), ("square", 4),
+    ("rectangle", (1, 6)), ("rectangle", (7, 2))])
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+def test_extremum_filter(shape, size, dtype):
+    # van Herk/Gil-Werman filters match skimage rank filters
+    np.random.seed(0)
+    image = np.random.randint(0, 256, size=(2, 31, 47)).astype(dtype)
+    kernel = _define_kernel(shape, size, dtype)
+    for function, method in [(stack.maximum_filter, rank.maximum),
+                             (stack.minimum_filter, rank.minimum)]:
+        filtered_image = function(image, shape, size)
+        assert filtered_image.dtype == dtype
+        for z in range(image.shape[0]):
+            expected_image = method(image[z], kernel)
+            assert_array_equal(filtered_image[z], expected_image)
+            filtered_image_2d = function(image[z], shape, size)
+            assert_array_equal(filtered_image_2d, expected_image)
+
+
 def test_log_filter():
     # float64
     y_float64 = stack.cast_img_float64(y)
@@ -277,6 +324,73 @@ def test_gaussian_filter():
     assert filtered_y.dtype == np.uint16
 
 
+@pytest.mark.parametrize("dtype", [
+    np.uint8, np.uint16, np.float32, np.float64])
+@pytest.mark.parametrize("precision", [None, "float32", "float64"])
+def test_filter_precision(dtype, precision):
+    np.random.seed(0)
+    image = np.random.randint(0, 256, size=(4, 30, 30)).astype(np.uint8)
+    if dtype == np.uint16:
+        image = stack.cast_img_uint16(image)
+    elif dtype == np.float32:
+        image = stack.cast_img_float32(image)
+    elif dtype == np.float64:
+        image = stack.cast_img_float64(image)
+
+    # wrong precision
+    with pytest.raises(ValueError):
+        stack.log_filter(image, 2, precision="float16")
+
+    # wrong output array
+    with pytest.raises(ValueError):
+        stack.gaussian_filter(image, 2, out=np.zeros(image.shape, np.int8))
+
+    # results are close to default precision and written in the output array
+    for function in [stack.log_filter,
+                     stack.gaussian_filter,
+                     stack.remove_background_gaussian]:
+        expected_image = function(image, (1, 2, 2))
+        out = np.zeros_like(image)
+        filtered_image = function(
+            image, (1, 2, 2), precision=precision, out=out)
+        assert filtered_image is out
+        assert filtered_image.dtype == dtype
+        if dtype in [np.uint8, np.uint16]:
+            assert_allclose(filtered_image, expected_image, atol=1)
+        else:
+            assert_allclose(filtered_image, expected_image,
+                            rtol=1e-5, atol=1e-6)
+        if precision is None:
+            assert_array_equal(filtered_image, expected_image)
+
+
+@pytest.mark.parametrize("ndim", [2, 3])
+def test_filter_n_jobs(ndim):
+    # chunked filtering is bit-identical to single-call filtering
+    np.random.seed(0)
+    shape = (3, 150, 200)[-ndim:]
+    image = np.random.randint(0, 65536, size=shape).astype(np.uint16)
+    for function in [stack.log_filter,
+                     stack.gaussian_filter,
+                     stack.remove_background_gaussian]:
+        expected_image = function(image, 2)
+        filtered_image = function(image, 2, n_jobs=4)
+        assert_array_equal(filtered_image, expected_image)
+        filtered_image = function(stack.cast_img_float32(image), 2, n_jobs=4)
+        expected_image = function(stack.cast_img_float32(image), 2)
+        assert_array_equal(filtered_image, expected_image)
+    for function in [stack.median_filter,
+                     stack.maximum_filter,
+                     stack.minimum_filter]:
+        expected_image = function(image, "disk", 5)
+        filtered_image = function(image, "disk", 5, n_jobs=4)
+        assert_array_equal(filtered_image, expected_image)
+
+    # wrong number of threads
+    with pytest.raises(ValueError):
+        stack.gaussian_filter(image, 2, n_jobs=0)
+
+
 def test_background_removal_mean():
     # np.uint8
     filtered_x = stack.remove_background_mean(x,
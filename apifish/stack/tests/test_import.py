@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Author: Arthur Imbert <arthur.imbert.pro@gmail.com>
+# License: BSD 3 clause
+
+"""
+Import-time regression tests for apifish subpackages.
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+import apifish
+
+
+# heavy dependencies that should only be imported on first use
+_HEAVY_MODULES = [
+    "pandas",
+    "matplotlib",
+    "astropy",
+    "mrc",
+    "skimage.io",
+    "sklearn",
+    "tensorflow"]
+
+# generous upper bound (in seconds) to catch eager imports creeping back
+_MAX_IMPORT_TIME = 10
+
+
+def _import_in_subprocess(module_name):
+    # import the module in a fresh interpreter and report loaded modules
+    code = (
+        "import sys, time, json\n"
+        "start = time.perf_counter()\n"
+        "import {0}\n"
+        "duration = time.perf_counter() - start\n"
+        "print(json.dumps({{'duration': duration, "
+        "'modules': sorted(sys.modules)}}))\n").format(module_name)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(apifish.__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=root,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True)
+    lines = output.stdout.decode("utf-8").strip().split("\n")
+    return json.loads(lines[-1])
+
+
+@pytest.mark.parametrize("module_name", [
+    "apifish.stack",
+    "apifish.detection",
+    "apifish.multistack",
+    "apifish.segmentation",
+    "apifish.plot"])
+def test_lazy_import(module_name):
+    results = _import_in_subprocess(module_name)
+    loaded = set(results["modules"])
+    for heavy_module in _HEAVY_MODULES:
+        assert heavy_module not in loaded, (
+            "'{0}' is imported by '{1}'.".format(heavy_module, module_name))
+    assert results["duration"] < _MAX_IMPORT_TIME
@@ -10,6 +10,7 @@ import os
 import pytest
 import mrc
 import tempfile
+import tifffile
 
 import numpy as np
 import pandas as pd
@@ -72,6 +73,68 @@ def test_image(shape, dtype, extension):
             assert test.dtype == tensor.dtype
 
 
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_image_planes(compression):
+    # build a temporary directory and save tensors inside
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test = np.random.randint(0, 256, size=(2, 3, 8, 9)).astype(np.uint16)
+        path = os.path.join(tmp_dir, "test.tif")
+        tifffile.imwrite(path, test, compression=compression)
+        planes = list(stack.read_image_planes(path))
+        assert len(planes) == 6
+        assert_array_equal(np.stack(planes), test.reshape((6, 8, 9)))
+        for plane in planes:
+            assert plane.dtype == np.uint16
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_image_lazy(compression):
+    # build a temporary directory and save tensors inside
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test = np.random.randint(0, 256, size=(2, 3, 4, 8, 9))
+        test = test.astype(np.uint16)
+        path = os.path.join(tmp_dir, "test.tif")
+        tifffile.imwrite(path, test, compression=compression)
+        tensor = stack.read_image(path, sanity_check=True, lazy=True)
+        if compression is None:
+            assert isinstance(tensor, np.memmap)
+        else:
+            assert isinstance(tensor, stack.LazyTiffImage)
+        assert tensor.shape == test.shape
+        assert tensor.dtype == test.dtype
+        for key in [1, (0, 2), (1, slice(0, 2), 3, slice(2, 5)),
+                    (Ellipsis, 4), (slice(None), [0, 2]), (0, 0, slice(3, 1))]:
+            assert_array_equal(tensor[key], test[key])
+        assert_array_equal(np.asarray(tensor), test)
+        del tensor
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_image_out(compression):
+    # build a temporary directory and save tensors inside
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test = np.random.randint(0, 256, size=(3, 8, 9)).astype(np.uint16)
+        path = os.path.join(tmp_dir, "test.tif")
+        tifffile.imwrite(path, test, compression=compression)
+
+        # read image in a slot of a preallocated array
+        out = np.zeros((2, 3, 8, 9), dtype=np.uint16)
+        tensor = stack.read_image(path, sanity_check=True, out=out[1])
+        assert_array_equal(tensor, test)
+        assert_array_equal(out[1], test)
+        assert out[0].sum() == 0
+
+        # incompatible arrays
+        with pytest.raises(ValueError):
+            stack.read_image(path, out=np.zeros((3, 8, 8), dtype=np.uint16))
+        with pytest.raises(ValueError):
+            stack.read_image(path, out=np.zeros((3, 8, 9), dtype=np.float32))
+        with pytest.raises(ValueError):
+            stack.read_image(path, out=out[..., 1])
+        with pytest.raises(ValueError):
+            stack.read_image(path, lazy=True, out=out[0])
+
+
 def test_image_specific():
     # build a temporary directory and save tensors inside
     with tempfile.TemporaryDirectory() as tmp_dir:
@@ -119,6 +182,72 @@ def test_dv(dtype):
         assert test.dtype == tensor.dtype
 
 
+@pytest.mark.parametrize("dtype", [
+    np.uint8, np.uint16, np.int64, np.float32, bool])
+@pytest.mark.parametrize("codec", [None, "zlib", "bz2", "lzma"])
+def test_chunked_array(dtype, codec):
+    # build a temporary directory and save tensors inside
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test = np.zeros((3, 20, 30), dtype=dtype)
+        test[:, 2:9, 5:27] = np.random.randint(1, 10, size=(3, 7, 22))
+        path = os.path.join(tmp_dir, "test")
+        stack.save_chunked_array(test, path, chunks=(2, 8, 8), codec=codec)
+        tensor = stack.read_chunked_array(path + ".zarr")
+        assert_array_equal(test, tensor)
+        assert test.dtype == tensor.dtype
+
+        # chunks filled with zeros are not written
+        assert not os.path.isfile(os.path.join(path + ".zarr", "0.2.0"))
+
+        # partial reads
+        tensor = stack.read_chunked_array(path + ".zarr", lazy=True, n_jobs=2)
+        assert isinstance(tensor, stack.ChunkedArray)
+        assert tensor.shape == test.shape
+        assert tensor.dtype == test.dtype
+        for key in [1, (slice(None), slice(3, 17, 2), [0, 29, -3]),
+                    (Ellipsis, -1), (slice(None, None, -1), slice(18, 1, -5)),
+                    (2, 5, 7), slice(2, 1)]:
+            assert_array_equal(tensor[key], test[key])
+
+        # overwrite array with parallel writes
+        test = test[:, :10]
+        stack.save_chunked_array(test, path, codec=codec, n_jobs=2)
+        tensor = stack.read_chunked_array(path + ".zarr")
+        assert_array_equal(test, tensor)
+
+
+@pytest.mark.parametrize("codec, package", [
+    ("lz4", "lz4"), ("zstd", "zstandard"), ("blosc", "blosc")])
+def test_chunked_array_optional_codec(codec, package):
+    pytest.importorskip(package)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test = np.random.randint(0, 10, size=(20, 30)).astype(np.uint16)
+        path = os.path.join(tmp_dir, "test.zarr")
+        stack.save_chunked_array(test, path, chunks=(8, 8), codec=codec)
+        tensor = stack.read_chunked_array(path)
+        assert_array_equal(test, tensor)
+
+
+def test_chunked_array_error():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test = np.zeros((20, 30), dtype=np.uint16)
+        path = os.path.join(tmp_dir, "test.zarr")
+        # error: wrong codec
+        with pytest.raises(ValueError):
+            stack.save_chunked_array(test, path, codec="gzip")
+        # error: wrong chunks
+        with pytest.raises(ValueError):
+            stack.save_chunked_array(test, path, chunks=(8, 8, 8))
+        # error: wrong number of threads
+        with pytest.raises(ValueError):
+            stack.save_chunked_array(test, path, n_jobs=0)
+        # error: index out of bounds
+        stack.save_chunked_array(test, path)
+        tensor = stack.read_chunked_array(path, lazy=True)
+        with pytest.raises(IndexError):
+            _ = tensor[20]
+
+
 @pytest.mark.parametrize("shape", [
     (8, 8), (8, 8, 8), (8, 8, 8, 8), (8, 8, 8, 8, 8)])
 @pytest.mark.parametrize("dtype", [
@@ -134,6 +263,11 @@ def test_npy(shape, dtype):
         tensor = stack.read_array(path)
         assert_array_equal(test, tensor)
         assert test.dtype == tensor.dtype
+        tensor = stack.read_array(path, mmap_mode="r")
+        assert isinstance(tensor, np.memmap)
+        assert_array_equal(test, tensor)
+        assert test.dtype == tensor.dtype
+        del tensor
 
 
 @pytest.mark.parametrize("shape", [
@@ -199,3 +333,134 @@ def test_csv_pandas(delimiter):
         path = os.path.join(tmp_dir, "test_dataframe.csv")
         df = stack.read_dataframe_from_csv(path, delimiter=delimiter)
         pd.testing.assert_frame_equal(test_dataframe, df)
+
+
+def test_fov_extracted():
+    # build a temporary directory and save cells inside
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fov_results = []
+        for i in range(5):
+            cell_results = {
+                "cell_id": i,
+                "bbox": [i, i, 10 + i, 20 + i],
+                "cell_coord": np.random.randint(0, 10, size=(3 + i, 2)),
+                "cell_mask": np.random.random((4 + i, 6)) > 0.5,
+                "image": np.random.random((4 + i, 6)).astype(np.float32),
+                "rna_coord": np.zeros((0, 3), dtype=np.int64)}
+            if i % 2 == 0:
+                cell_results["foci"] = np.ones((i, 5), dtype=np.int64)
+            fov_results.append(cell_results)
+        path = os.path.join(tmp_dir, "fov")
+        stack.save_fov_extracted(fov_results, path)
+        cell_store = stack.read_fov_extracted(path + ".cells")
+        assert isinstance(cell_store, stack.CellStore)
+        assert len(cell_store) == 5
+        assert set(cell_store.keys) == set(fov_results[0])
+
+        # per-cell access
+        for i, cell_results in enumerate(cell_store):
+            assert set(cell_results) == set(fov_results[i])
+            for key, value in fov_results[i].items():
+                assert_array_equal(cell_results[key], value)
+                assert cell_results[key].dtype == np.asarray(value).dtype
+        assert_array_equal(cell_store[-1]["cell_mask"],
+                           fov_results[-1]["cell_mask"])
+
+        # per-key access
+        foci = cell_store.get("foci")
+        assert foci[1] is None
+        assert_array_equal(foci[4], fov_results[4]["foci"])
+
+        # errors
+        with pytest.raises(IndexError):
+            _ = cell_store[5]
+        with pytest.raises(KeyError):
+            _ = cell_store.get("nuc_mask")
+        with pytest.raises(ValueError):
+            fov_results[1]["cell_id"] = 1.5
+            stack.save_fov_extracted(fov_results, path)
+        del cell_store
+
+        # a failed writing keeps the previous file and leaves no partial file
+        cell_store = stack.read_fov_extracted(path + ".cells")
+        assert len(cell_store) == 5
+        assert os.listdir(tmp_dir) == ["fov.cells"]
+        del cell_store
+        path_new = os.path.join(tmp_dir, "new")
+        with pytest.raises(ValueError):
+            stack.save_fov_extracted(fov_results, path_new)
+        assert os.listdir(tmp_dir) == ["fov.cells"]
+
+        # a cell with an invalid key is not written at all
+        with stack.CellStoreWriter(path_new) as writer:
+            writer.write({"cell_id": 0, "foci": np.ones((2, 5))})
+            with pytest.raises(ValueError):
+                writer.write({"foci": np.ones((1, 5)), "cell_id": 1.5})
+            writer.write({"cell_id": 2, "foci": np.zeros((1, 5))})
+        cell_store = stack.read_fov_extracted(path_new + ".cells")
+        assert len(cell_store) == 2
+        assert cell_store[1]["cell_id"] == 2
+        assert_array_equal(cell_store[1]["foci"], np.zeros((1, 5)))
+        del cell_store
+
+
+@pytest.mark.parametrize("codec", [None, "zlib"])
+def test_spot_table(codec):
+    # build a temporary directory and save tables inside
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        spots = np.random.randint(0, 100, size=(50, 4)).astype(np.int64)
+        path = os.path.join(tmp_dir, "spots")
+        columns = ["z", "y", "x", "cluster_id"]
+        stack.save_spot_table(spots, path, columns=columns, codec=codec)
+        path += ".spots"
+        tensor = stack.read_array_from_spot_table(path)
+        assert_array_equal(tensor, spots)
+        assert tensor.dtype == np.int64
+        data = stack.read_spot_table(path, columns=["y", "x"])
+        assert list(data) == ["y", "x"]
+        assert_array_equal(data["x"], spots[:, 2])
+        if codec is None:
+            assert isinstance(data["x"], np.memmap)
+        del data
+
+        # append rows
+        stack.append_spot_table(spots[:10].astype(np.int32), path,
+                                columns=columns)
+        df = pd.DataFrame(spots[10:20], columns=columns)
+        stack.append_spot_table(df, path)
+        tensor = stack.read_array_from_spot_table(path)
+        assert_array_equal(tensor, np.concatenate([spots, spots[:20]]))
+
+        # pandas interoperability with typed columns
+        df = pd.DataFrame({
+            "y": np.arange(5, dtype=np.uint16),
+            "x": np.linspace(0, 1, 5, dtype=np.float32),
+            "in_nuc": np.array([True, False, True, True, False])})
+        path = os.path.join(tmp_dir, "cells.spots")
+        stack.save_spot_table(df, path, codec=codec)
+        df_read = stack.read_dataframe_from_spot_table(path)
+        pd.testing.assert_frame_equal(df_read, df)
+        tensor = stack.read_array_from_spot_table(
+            path, columns=["x", "y"], dtype=np.float64)
+        assert_array_equal(tensor[:, 1], np.arange(5))
+        assert tensor.dtype == np.float64
+
+        # errors
+        with pytest.raises(ValueError):
+            stack.append_spot_table(spots, path)
+        with pytest.raises(TypeError):
+            stack.append_spot_table(
+                {"y": np.zeros(2), "x": np.zeros(2), "in_nuc": np.zeros(2)},
+                path)
+        path = os.path.join(tmp_dir, "spots_int32")
+        stack.save_spot_table(spots.astype(np.int32), path, codec=codec)
+        stack.append_spot_table(spots, path)
+        with pytest.raises(TypeError):
+            stack.append_spot_table(spots + np.iinfo(np.int32).max, path)
+        with pytest.raises(TypeError):
+            stack.append_spot_table(spots.astype(np.float64), path)
+        path = os.path.join(tmp_dir, "cells.spots")
+        with pytest.raises(ValueError):
+            _ = stack.read_spot_table(path, columns=["z"])
+        with pytest.raises(ValueError):
+            stack.save_spot_table({"y": np.zeros(2), "x": np.zeros(3)}, path)
@@ -6,12 +6,15 @@
 Unitary tests for apifish.stack.projection module.
 """
 
+import os
 import pytest
+import tempfile
+import tifffile
 
 import numpy as np
 import apifish.stack as stack
 
-from apifish.stack.projection import _one_hot_3d
+from apifish.stack.projection import _get_top_indices
 
 from numpy.testing import assert_array_equal
 from numpy.testing import assert_array_almost_equal
@@ -132,54 +135,69 @@ def test_median_projection(dtype):
     assert y.dtype == dtype
 
 
-# ### test focus selection ###
-
 @pytest.mark.parametrize("dtype", [
-    np.uint8, np.uint16, np.uint32, np.uint64,
-    np.int8, np.int16, np.int32, np.int64])
-def test_one_hot_3d(dtype):
-    # integer
-    indices = np.array(
-        [[1, 0, 0, 0, 0],
-         [0, 1, 0, 0, 0],
-         [2, 1, 0, 2, 2],
-         [0, 1, 1, 1, 2],
-         [0, 0, 0, 1, 0]], dtype=dtype)
-    one_hot = _one_hot_3d(indices=indices, depth=4)
-    expected_one_hot = np.array(
-        [[[0, 1, 1, 1, 1],
-          [1, 0, 1, 1, 1],
-          [0, 0, 1, 0, 0],
-          [1, 0, 0, 0, 0],
-          [1, 1, 1, 0, 1]],
-
-         [[1, 0, 0, 0, 0],
-          [0, 1, 0, 0, 0],
-          [0, 1, 0, 0, 0],
-          [0, 1, 1, 1, 0],
-          [0, 0, 0, 1, 0]],
-
-         [[0, 0, 0, 0, 0],
-          [0, 0, 0, 0, 0],
-          [1, 0, 0, 1, 1],
-          [0, 0, 0, 0, 1],
-          [0, 0, 0, 0, 0]],
-
-         [[0, 0, 0, 0, 0],
-          [0, 0, 0, 0, 0],
-          [0, 0, 0, 0, 0],
-          [0, 0, 0, 0, 0],
-          [0, 0, 0, 0, 0]]],
-        dtype=np.uint8)
-    assert_array_equal(one_hot, expected_one_hot)
-    assert one_hot.dtype == indices.dtype
-
-    # boolean
-    one_hot = _one_hot_3d(indices=indices, depth=4, return_boolean=True)
-    expected_one_hot = expected_one_hot.astype(bool)
-    assert_array_equal(one_hot, expected_one_hot)
-    assert one_hot.dtype == bool
+    np.uint8, np.uint16, np.float32, np.float64])
+def test_projection_from_planes(dtype):
+    np.random.seed(0)
+    x = np.random.randint(0, 256, size=(6, 10, 12)).astype(dtype)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "test.tif")
+        stack.save_image(x, path)
+        for planes in [x, list(x), path]:
+            y = stack.maximum_projection_from_planes(planes)
+            assert_array_equal(y, stack.maximum_projection(x))
+            assert y.dtype == dtype
+            y = stack.mean_projection_from_planes(planes)
+            assert_array_equal(y, stack.mean_projection(x))
+            assert y.dtype == dtype
+            y = stack.mean_projection_from_planes(planes, return_float=True)
+            assert_array_almost_equal(
+                y, stack.mean_projection(x, return_float=True), decimal=5)
+            for band_size in [None, 1, 3, 20]:
+                y = stack.median_projection_from_planes(
+                    planes, band_size=band_size)
+                assert_array_equal(y, stack.median_projection(x))
+                assert y.dtype == dtype
+
+    # error: planes with different shapes
+    with pytest.raises(ValueError):
+        _ = stack.maximum_projection_from_planes([x[0], x[0, :5]])
+    # error: no plane
+    with pytest.raises(ValueError):
+        _ = stack.median_projection_from_planes([])
+    # error: wrong band size
+    with pytest.raises(ValueError):
+        _ = stack.median_projection_from_planes(x, band_size=0)
+
+
+def test_median_projection_from_planes_mapped(monkeypatch):
+    np.random.seed(0)
+    x = np.random.randint(0, 256, size=(5, 10, 12)).astype(np.uint16)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "test.tif")
+        stack.save_image(x, path)
+        path_compressed = os.path.join(tmp_dir, "test_compressed.tif")
+        tifffile.imwrite(path_compressed, x, compression="zlib")
+
+        # 3-d arrays and uncompressed images are not copied on disk
+        def fail():
+            raise AssertionError("Planes should not be written on disk.")
+        monkeypatch.setattr(tempfile, "TemporaryDirectory", fail)
+        for planes in [x, path]:
+            y = stack.median_projection_from_planes(planes)
+            assert_array_equal(y, stack.median_projection(x))
+        with pytest.raises(AssertionError):
+            _ = stack.median_projection_from_planes(list(x))
+        with pytest.raises(AssertionError):
+            _ = stack.median_projection_from_planes(path_compressed)
+        monkeypatch.undo()
+
+        # other planes are written on disk
+        y = stack.median_projection_from_planes(path_compressed)
+        assert_array_equal(y, stack.median_projection(x))
+
 
+# ### test focus selection ###
 
 def test_get_in_focus_indices():
     focus = stack.compute_focus(x_3d_out_focus, neighborhood_size=31)
@@ -256,3 +274,43 @@ def test_focus_projection(dtype):
     with pytest.raises(ValueError):
         _ = stack.focus_projection(
             x, proportion=3, neighborhood_size=7, method="mean")
+
+
+@pytest.mark.parametrize("n", [1, 3, 5, 8])
+def test_get_top_indices(n):
+    # focus values with many ties
+    np.random.seed(0)
+    focus = np.random.randint(0, 4, size=(8, 10, 12)).astype(np.float32)
+    focus[:, 0, 0] = 1
+
+    # compare with a full sort
+    top_indices = _get_top_indices(focus, n)
+    assert top_indices.shape == (n, 10, 12)
+    top_focus = np.take_along_axis(focus, top_indices, axis=0)
+    expected_top_focus = np.sort(focus, axis=0)[-n:]
+    assert_array_equal(np.sort(top_focus, axis=0), expected_top_focus)
+
+    # each index is selected once
+    sorted_indices = np.sort(top_indices, axis=0)
+    assert (np.diff(sorted_indices, axis=0) > 0).all()
+    if n == focus.shape[0]:
+        expected_indices = np.broadcast_to(
+            np.arange(n)[:, np.newaxis, np.newaxis], focus.shape)
+        assert_array_equal(sorted_indices, expected_indices)
+
+
+def test_focus_projection_all_slices():
+    # with 5 z-slices or less, all slices are projected
+    np.random.seed(0)
+    x = np.random.randint(0, 256, size=(4, 20, 20)).astype(np.uint16)
+    y = stack.focus_projection(x, proportion=4, method="median")
+    assert_array_equal(y, np.median(x, axis=0).astype(np.uint16))
+    y = stack.focus_projection(x, proportion=4, method="max")
+    assert_array_equal(y, x.max(axis=0))
+
+    # constant focus (all ties): the projection is still computed from 5
+    # z-slices with the highest focus
+    x = np.ones((7, 20, 20), dtype=np.uint16)
+    x[::2] = 3
+    y = stack.focus_projection(x, proportion=7, method="max")
+    assert_array_equal(y, np.full((20, 20), 3, dtype=np.uint16))
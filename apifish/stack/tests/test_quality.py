@@ -11,6 +11,9 @@ import pytest
 import numpy as np
 import apifish.stack as stack
 
+from numpy.testing import assert_array_equal
+from numpy.testing import assert_allclose
+
 
 x_out_focus = np.array(
     [[[1, 1, 1, 1, 1],
@@ -82,6 +85,26 @@ def test_compute_focus_error():
     # error: sequence 'neighborhood_size' too long
     with pytest.raises(ValueError):
         _ = stack.compute_focus(image, neighborhood_size=(5, 11, 31))
+    # error: wrong precision
+    with pytest.raises(ValueError):
+        _ = stack.compute_focus(image, precision="float16")
+
+
+@pytest.mark.parametrize("dtype", [
+    np.uint8, np.uint16, np.float32, np.float64])
+def test_compute_focus_precision(dtype):
+    np.random.seed(0)
+    image = np.random.randint(0, 256, size=(4, 50, 60)).astype(dtype)
+    image[0, :20, :20] = 0
+    focus = stack.compute_focus(image, neighborhood_size=(7, 4))
+    focus_float32 = stack.compute_focus(
+        image, neighborhood_size=(7, 4), precision="float32")
+    assert focus_float32.dtype == np.float32
+    assert_allclose(focus_float32, focus, rtol=1e-6)
+    # the whole stack is equivalent to each z-slice
+    for z in range(image.shape[0]):
+        focus_2d = stack.compute_focus(image[z], neighborhood_size=(7, 4))
+        assert_array_equal(focus_2d, focus[z])
 
 
 def test_compute_focus():
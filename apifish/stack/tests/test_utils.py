@@ -13,6 +13,10 @@ import apifish.stack as stack
 import numpy as np
 import pandas as pd
 
+from scipy import ndimage as ndi
+
+from numpy.testing import assert_allclose
+
 
 # TODO add test for apifish.stack.load_and_save_url
 # TODO add test for apifish.stack.check_hash
@@ -148,3 +152,30 @@ def test_epsilon_float_32():
     eps = stack.get_eps_float32()
     assert eps < 1e-5
     assert isinstance(eps, np.float32)
+
+
+@pytest.mark.parametrize("dtype", [
+    np.uint8, np.uint16, np.int64, np.float32, np.float64])
+def test_box_sum(dtype):
+    np.random.seed(0)
+    image = np.random.randint(0, 256, size=(2, 15, 17)).astype(dtype)
+    for kernel_shape in [(1, 1), (3, 3), (4, 7)]:
+        image_sum = stack.box_sum(image, kernel_shape)
+        assert image_sum.dtype == np.float64
+        assert image_sum.shape == image.shape
+        kernel = np.ones((1,) + kernel_shape)
+        expected_sum = ndi.convolve(image.astype(np.float64), kernel,
+                                    mode="reflect")
+        assert_allclose(image_sum, expected_sum)
+    image_padded = stack.pad_reflect(image, (4, 7))
+    assert image_padded.shape == (2, 18, 23)
+
+
+def test_get_float_dtype():
+    assert stack.get_float_dtype(np.uint8, None) == np.float32
+    assert stack.get_float_dtype(np.uint16, None) == np.float64
+    assert stack.get_float_dtype(np.float32, None) == np.float32
+    assert stack.get_float_dtype(np.uint8, "float64") == np.float64
+    assert stack.get_float_dtype(np.float64, "float32") == np.float32
+    with pytest.raises(ValueError):
+        _ = stack.get_float_dtype(np.uint8, "float16")
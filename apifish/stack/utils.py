@@ -11,7 +11,6 @@ import inspect
 import hashlib
 
 import numpy as np
-import pandas as pd
 
 from urllib.request import urlretrieve
 
@@ -36,6 +35,9 @@ def check_df(df, features=None, features_without_nan=None):
         Assert if the dataframe is well formatted.
 
     """
+    # import pandas lazily
+    import pandas as pd
+
     # check parameters
     check_parameter(
         df=(pd.DataFrame, pd.Series),
@@ -615,3 +617,124 @@ def centered_moving_average(array, n):
     results = moving_average(array_padded, n)
 
     return results
+
+
+def get_float_dtype(dtype, precision):
+    """Get the float dtype used to filter an image.
+
+    Parameters
+    ----------
+    dtype : type
+        Dtype of the image to filter.
+    precision : {None, `float32`, `float64`}
+        Float precision requested. If None, np.uint8 images are filtered in
+        np.float32, np.uint16 images in np.float64 and float images with their
+        own dtype.
+
+    Returns
+    -------
+    float_dtype : type
+        Float dtype used to filter the image.
+
+    """
+    if precision is None:
+        if dtype == np.uint8:
+            float_dtype = np.float32
+        elif dtype == np.uint16:
+            float_dtype = np.float64
+        else:
+            float_dtype = dtype
+    elif precision == "float32":
+        float_dtype = np.float32
+    elif precision == "float64":
+        float_dtype = np.float64
+    else:
+        raise ValueError("Parameter 'precision' should be None, 'float32' or "
+                         "'float64', not '{0}'.".format(precision))
+
+    return np.dtype(float_dtype).type
+
+
+def pad_reflect(image, kernel_shape):
+    """Pad the last two dimensions of an image, before applying a kernel.
+
+    Padding is consistent with the ``reflect`` mode and the kernel origin of
+    :func:`scipy.ndimage.convolve`.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image with shape (..., y, x).
+    kernel_shape : Tuple(int)
+        Shape of the kernel (`height`, `width`).
+
+    Returns
+    -------
+    image_padded : np.ndarray
+        Padded image with shape (..., y + height - 1, x + width - 1).
+
+    """
+    # check parameters
+    check_parameter(kernel_shape=tuple)
+
+    # a convolution window of size k covers [i - (k - 1) // 2, i + k // 2]
+    pad_width = [(0, 0)] * (image.ndim - 2)
+    pad_width += [((k - 1) // 2, k // 2) for k in kernel_shape]
+
+    # scipy 'reflect' mode is numpy 'symmetric' mode
+    image_padded = np.pad(image, pad_width, mode="symmetric")
+
+    return image_padded
+
+
+def box_sum(image, kernel_shape):
+    """Sum pixel values within a rectangular window, over the last two
+    dimensions of an image.
+
+    Sums are computed with summed-area tables, separately along each axis.
+    Integer images are summed with np.int64 to get exact results.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Image with shape (..., y, x).
+    kernel_shape : Tuple(int)
+        Shape of the rectangular window (`height`, `width`).
+
+    Returns
+    -------
+    image_sum : np.ndarray, np.float64
+        Sum of the pixel values within the window centered on each pixel,
+        with shape (..., y, x).
+
+    """
+    # check parameters
+    check_parameter(kernel_shape=tuple)
+
+    # sum integers exactly
+    if image.dtype.kind in ["u", "i", "b"]:
+        sum_dtype = np.int64
+    else:
+        sum_dtype = np.float64
+
+    # pad image
+    image_padded = pad_reflect(image, kernel_shape)
+    height, width = kernel_shape
+
+    # compute summed-area table along y and sum pixels within the window
+    shape = image_padded.shape[:-2] + (image_padded.shape[-2] + 1,
+                                       image_padded.shape[-1])
+    table = np.zeros(shape, dtype=sum_dtype)
+    np.cumsum(image_padded, axis=-2, out=table[..., 1:, :])
+    image_sum = table[..., height:, :] - table[..., :-height, :]
+
+    # compute summed-area table along x and sum pixels within the window
+    shape = image_sum.shape[:-1] + (image_sum.shape[-1] + 1,)
+    table = np.zeros(shape, dtype=sum_dtype)
+    np.cumsum(image_sum, axis=-1, out=table[..., 1:])
+    image_sum = table[..., width:] - table[..., :-width]
+
+    # cast sums
+    image_sum = image_sum.astype(np.float64, copy=False)
+
+    return image_sum